@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""Batch mode of TiRiFiG: the same edits applied to many .def files.
+
+Every .def file found in the given files and directory trees is loaded, edited and
+saved by a pool of worker processes, one file at a time per worker, so throughput grows
+with the number of cores. Files are saved with the same atomic write as the GUI; a file
+which fails to load or edit is left untouched and reported. Edits are applied in the
+order they are given on the command line, e.g.
+
+    TiRiFiG-batch survey/ --set INCL=60 --regrid-radi 20 --set LOOPS=5 \\
+                          --set FITMODE=2 --report report.json
+
+functions:
+    find_def_files:   lists the .def files in files and directory trees.
+    apply_edits:      applies a list of edits to a DefFile.
+    process_file:     loads, edits and saves one .def file, returning its report.
+    run:              processes many .def files with a pool of worker processes.
+    main:             command-line entry point.
+"""
+
+from __future__ import print_function
+
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from TiRiFiG.core import deffile
+
+# KEY=VALUE, KEY[i]=VALUE or KEY[start:stop]=VALUE
+_SET_EDIT = re.compile(r'^\s*(\w+)\s*(?:\[\s*(\d*)\s*(:)?\s*(\d*)\s*\])?\s*=(.*)$')
+
+
+def find_def_files(paths, pattern='*.def'):
+    """Lists the .def files in files and directory trees
+
+    Keyword arguments:
+    paths (list)--   files and directories; directories are searched recursively
+    pattern (str)--  shell pattern the names of files in directories must match
+
+    Returns:
+    list
+    (path, root) of every file found, where root is the directory given on the
+    command line the file was found in (None for files given directly)
+    """
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append((path, None))
+            continue
+        for dirName, dirNames, fileNames in os.walk(path):
+            dirNames.sort()
+            for fileName in sorted(fnmatch.filter(fileNames, pattern)):
+                found.append((os.path.join(dirName, fileName), path))
+    return found
+
+
+def parse_set(text):
+    """Turns the argument of --set into an edit
+
+    Keyword arguments:
+    text (str)--  KEY=VALUE, KEY[i]=VALUE or KEY[start:stop]=VALUE
+
+    Returns:
+    tuple
+    ('set', key, rings, value) where rings is None, an index or (start, stop)
+    """
+    match = _SET_EDIT.match(text)
+    if match is None or not match.group(5).strip():
+        raise argparse.ArgumentTypeError(
+            "expected KEY=VALUE or KEY[start:stop]=VALUE, got {!r}".format(text))
+    key, start, colon, stop, value = match.groups()
+    if colon:
+        rings = (int(start) if start else None, int(stop) if stop else None)
+    elif start:
+        rings = int(start)
+    else:
+        rings = None
+    return ('set', key.upper(), rings, value.strip())
+
+
+def _ring_values(text):
+    try:
+        return [float(val) for val in text.replace(',', ' ').split()]
+    except ValueError:
+        return None
+
+
+def _apply_set(defFile, key, rings, text):
+    values = _ring_values(text)
+    if key not in defFile:
+        if rings is not None:
+            raise ValueError("{} has no ring values to index".format(key))
+        old = defFile.setting(key)
+        if old is not None and old.split() == text.split():
+            return False
+        defFile.set_setting(key, text)
+        return True
+
+    if values is None:
+        raise ValueError("{} takes numbers, got {!r}".format(key, text))
+    if isinstance(rings, tuple):
+        rings = slice(*rings)
+    if len(values) == 1 and rings is None:
+        values = np.repeat(values[0], defFile.get(key).size)
+    elif len(values) == 1:
+        values = values[0]
+    return defFile.set(key, values, rings=rings)
+
+
+def _apply_regrid(defFile, step):
+    radi = defFile.get('RADI')
+    count = int(np.floor((radi[-1] - radi[0]) / step + 1e-9)) + 1
+    nur = defFile.nur
+    changed = defFile.regrid(radi[0] + step * np.arange(max(count, 1)))
+    return changed + (['NUR'] if defFile.nur != nur else [])
+
+
+def apply_edits(defFile, edits):
+    """Applies a list of edits to a DefFile
+
+    Keyword arguments:
+    defFile (DefFile)--  the .def file to edit
+    edits (list)--       ('set', key, rings, value) or ('regrid', step) in the order
+                         they should be applied
+
+    Returns:
+    list
+    The keys which changed, in the order they were first changed
+    """
+    changed = []
+    for edit in edits:
+        if edit[0] == 'set':
+            keys = [edit[1]] if _apply_set(defFile, *edit[1:]) else []
+        elif edit[0] == 'regrid':
+            keys = _apply_regrid(defFile, edit[1])
+        else:
+            raise ValueError("unknown edit {!r}".format(edit[0]))
+        changed.extend(key for key in keys if key not in changed)
+    return changed
+
+
+def process_file(task):
+    """Loads, edits and saves one .def file
+
+    Keyword arguments:
+    task (tuple)--  (source, target, edits, dryRun) where target is the path the
+                    result is saved to and dryRun skips saving
+
+    Returns:
+    dict
+    Report of the file: source, target, status ('written', 'unchanged', 'dry-run'
+    or 'error'), changed keys, error message and time taken in seconds
+    """
+    source, target, edits, dryRun = task
+    start = time.time()
+    report = {'file': source, 'output': target, 'status': 'error', 'changed': [],
+              'error': None}
+    try:
+        defFile = deffile.load(source)
+        report['changed'] = apply_edits(defFile, edits)
+        if dryRun:
+            report['status'] = 'dry-run'
+        else:
+            targetDir = os.path.dirname(target)
+            if targetDir and not os.path.isdir(targetDir):
+                os.makedirs(targetDir)
+            written = defFile.save(target)
+            report['status'] = 'written' if written else 'unchanged'
+    except Exception as e:
+        report['error'] = "{}: {}".format(type(e).__name__, e)
+    report['seconds'] = time.time() - start
+    return report
+
+
+def _target(path, root, outputDir):
+    if outputDir is None:
+        return path
+    if root is None:
+        return os.path.join(outputDir, os.path.basename(path))
+    return os.path.join(outputDir, os.path.relpath(path, root))
+
+
+def run(files, edits, jobs=None, outputDir=None, dryRun=False):
+    """Processes many .def files with a pool of worker processes
+
+    Keyword arguments:
+    files (list)--      (path, root) of each file as returned by find_def_files
+    edits (list)--      edits to apply to every file (see apply_edits)
+    jobs (int)--        number of worker processes (number of cores by default)
+    outputDir (str)--   directory to save the results in, mirroring the layout
+                        below each root; files are edited in place if None
+    dryRun (bool)--     only report what would change
+
+    Returns:
+    generator
+    The report of each file (see process_file) in the order of files
+    """
+    tasks = [(path, _target(path, root, outputDir), edits, dryRun)
+             for path, root in files]
+    jobs = min(jobs or multiprocessing.cpu_count(), len(tasks))
+    if jobs <= 1:
+        for task in tasks:
+            yield process_file(task)
+        return
+
+    # a few chunks per worker keep all of them busy without one task per message
+    chunkSize = max(1, len(tasks) // (jobs * 4))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for report in pool.imap(process_file, tasks, chunkSize):
+            yield report
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class _EditAction(argparse.Action):
+    # collects all edit options in one list so they keep the command line order
+    def __call__(self, parser, namespace, values, option_string=None):
+        edits = list(getattr(namespace, self.dest) or [])
+        edits.append(values)
+        setattr(namespace, self.dest, edits)
+
+
+def _regrid_step(text):
+    try:
+        step = float(text)
+    except ValueError:
+        step = 0.0
+    if not step > 0:
+        raise argparse.ArgumentTypeError(
+            "expected a positive step, got {!r}".format(text))
+    return ('regrid', step)
+
+
+def _arg_parser():
+    parser = argparse.ArgumentParser(
+        prog='TiRiFiG-batch',
+        description="Apply the same edits to many TiRiFiC .def files in parallel.",
+        epilog="Ring indices are zero-based, so INCL[0:5]=60 sets the inner five "
+               "rings. Any key without ring values e.g. LOOPS or FITMODE is set as text.")
+    parser.add_argument('paths', nargs='+',
+                        help=".def files and directories to search for them")
+    parser.add_argument('--set', dest='edits', action=_EditAction, type=parse_set,
+                        metavar='KEY[start:stop]=VALUE',
+                        help="set a parameter for all or some rings, or any other key "
+                             "e.g. INCL=60, VROT[3]=120, LOOPS=5 or FITMODE=2")
+    parser.add_argument('--regrid-radi', dest='edits', action=_EditAction,
+                        type=_regrid_step, metavar='STEP',
+                        help="space the rings STEP arcsec apart, interpolating all "
+                             "parameters and updating NUR")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="save the edited files here instead of in place")
+    parser.add_argument('--pattern', default='*.def',
+                        help="names of files to pick up in directories (default: *.def)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="report the changes without saving anything")
+    parser.add_argument('--report', default=None, metavar='FILE',
+                        help="also write the per-file report to FILE as JSON")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point; returns 1 if any file failed, otherwise 0"""
+    parser = _arg_parser()
+    args = parser.parse_args(argv)
+    if not args.edits:
+        parser.error("nothing to do: give at least one --set or --regrid-radi")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    files = find_def_files(args.paths, args.pattern)
+    start = time.time()
+    reports = []
+    counts = {}
+    for report in run(files, args.edits, args.jobs, args.output_dir, args.dry_run):
+        reports.append(report)
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+        detail = report['error'] or ', '.join(report['changed']) or '-'
+        print("{0:<9} {1}  {2}  ({3:.3f} s)".format(report['status'], report['file'],
+                                                     detail, report['seconds']))
+    elapsed = time.time() - start
+
+    print("{0} files in {1:.2f} s: {2}".format(
+        len(reports), elapsed,
+        ', '.join("{} {}".format(counts[status], status) for status in sorted(counts))
+        or 'nothing found'))
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump({'edits': args.edits, 'seconds': elapsed, 'files': reports}, f,
+                      indent=2)
+    return 1 if counts.get('error') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+"""Qt-free core of TiRiFiG for loading, editing and writing TiRiFiC .def files.
+
+Nothing here imports Qt or matplotlib, so .def files can be edited headless e.g.
+
+    from TiRiFiG import core
+    deffile = core.load('galaxy.def')
+    deffile.set('INCL', 60.0, rings=slice(0, 5))
+    deffile.save()
+
+The names below are imported on first use, which keeps `import TiRiFiG.core` cheap
+for tools that don't end up touching NumPy.
+
+variables:
+    UNITS:      unit measurement of the tilted-ring parameters TiRiFiG knows about.
+
+functions:
+    load:       reads a .def file into a DefFile.
+
+classes:
+    DefFile:    a .def file with its parsed tilted-ring parameters.
+    DefCache:   LRU cache of parsed .def files.
+    HistoryTree: undo tree of the values of the tilted-ring parameters.
+    Journal:    append-only journal of the edits of a .def file.
+    RingTable:  columnar view of the tilted-ring parameters in a .def file.
+
+modules:
+    defparser:  single-pass parser turning the lines of a .def file into a columnar
+                ring table.
+    defwriter:  save engine writing all changed parameters to a .def file in one
+                atomic write.
+    defcache:   cache of parsed .def files keyed by path, size, mtime and content hash.
+    deffile:    headless loading, editing and saving of .def files.
+    history:    undo history of the values of the tilted-ring parameters, as a tree.
+    journal:    append-only journal of the unsaved edits of a .def file.
+"""
+
+import importlib
+
+__all__ = ['DefCache', 'DefFile', 'HistoryTree', 'Journal', 'RingTable', 'UNITS', 'load']
+
+_LAZY = {'DefCache': 'defcache',
+         'DefFile': 'deffile',
+         'HistoryTree': 'history',
+         'Journal': 'journal',
+         'RingTable': 'defparser',
+         'UNITS': 'deffile',
+         'load': 'deffile'}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(__name__ + '.' + _LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
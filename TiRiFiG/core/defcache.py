@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+"""Cache of parsed .def files.
+
+Reopening a .def file, or reading it again after it was edited in a text editor,
+would otherwise parse it from scratch every time. DefCache keeps the RingTable of
+recently parsed files in memory, least recently used first out once the memory budget
+is exceeded. An entry is only used if the path, size, modification time and a hash of
+the contents all still match. Optionally the parsed columns of large files are also
+stored in a sidecar next to the .def file so that reopening them in a later session
+only has to load a few arrays. The sidecar of galaxy.def is the hidden file
+.galaxy.def.ringtable.npz in the same directory; it's left there for the next session,
+so sidecars are off unless sidecarMinBytes is given.
+
+classes:
+    DefCache:      LRU cache of RingTables keyed by path, size, mtime and content hash.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from TiRiFiG.core import defparser
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _digest(lines):
+    text = ''.join(lines)
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8', 'surrogatepass')
+    return hashlib.sha1(text).hexdigest()
+
+
+class DefCache(object):
+    """LRU cache of parsed .def files
+
+    Instance variables:
+        maxBytes         (int):          memory budget for the cached tables.
+        sidecarMinBytes  (int):          files at least this large get an on-disk
+                                         sidecar; None disables sidecars.
+        nbytes           (int):          memory currently held by cached tables.
+        hits             (int):          number of lookups answered by the cache.
+        misses           (int):          number of lookups which had to parse.
+
+    Functions:
+        load:            reads a .def file and returns its RingTable.
+        parse:           returns the RingTable of lines already read from a file.
+        clear:           empties the cache.
+    """
+
+    SIDECAR_SUFFIX = '.ringtable.npz'
+
+    def __init__(self, maxBytes=256 * 2**20, sidecarMinBytes=None):
+        self.maxBytes = maxBytes
+        self.sidecarMinBytes = sidecarMinBytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # realpath -> (stamp, table, nbytes), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def load(self, fileName, known=()):
+        """Reads a .def file and returns its RingTable
+
+        Keyword arguments:
+        fileName (str)--  path to the .def file
+        known--           tilted-ring parameters which are kept even if they don't
+                          have NUR values
+
+        Returns:
+        RingTable
+        """
+        with open(fileName) as f:
+            lines = f.readlines()
+        return self.parse(fileName, lines, known)
+
+    def parse(self, fileName, lines, known=()):
+        """Returns the RingTable of lines already read from fileName
+
+        Keyword arguments:
+        fileName (str)--  path the lines were read from
+        lines (list)--    text of each line of the .def file
+        known--           tilted-ring parameters which are kept even if they don't
+                          have NUR values
+
+        Returns:
+        RingTable
+
+        The table comes from memory or the sidecar when the file is unchanged,
+        otherwise the lines are parsed and the result is cached. The caller gets its
+        own copy and is free to modify it.
+        """
+        path = os.path.realpath(str(fileName))
+        try:
+            st = os.stat(path)
+        except OSError:
+            size, mtime = None, None
+        else:
+            size, mtime = st.st_size, st.st_mtime
+        known = sorted(set(key.upper() for key in known))
+        stamp = (size, mtime, _digest(lines), tuple(known))
+
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+            if entry[0] == stamp:
+                self.hits += 1
+                self._store(path, stamp, entry[1])
+                return entry[1].copy()
+
+        table = None
+        sidecar = self._use_sidecar(size)
+        if sidecar:
+            table = self._read_sidecar(path, stamp, lines)
+        if table is None:
+            self.misses += 1
+            table = defparser.parse_lines(lines, known)
+            if sidecar:
+                self._write_sidecar(path, stamp, table)
+        else:
+            self.hits += 1
+        self._store(path, stamp, table.copy())
+        return table
+
+    def _store(self, path, stamp, table):
+        nbytes = table.nbytes()
+        if nbytes > self.maxBytes:
+            return
+        self._entries[path] = (stamp, table, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.maxBytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def _use_sidecar(self, size):
+        return (self.sidecarMinBytes is not None and size is not None and
+                size >= self.sidecarMinBytes)
+
+    def _sidecar_path(self, path):
+        dirName, baseName = os.path.split(path)
+        return os.path.join(dirName, '.' + baseName + self.SIDECAR_SUFFIX)
+
+    def _read_sidecar(self, path, stamp, lines):
+        # the cache is only an optimisation: anything wrong with the sidecar means
+        # the file is parsed again
+        try:
+            with np.load(self._sidecar_path(path), allow_pickle=False) as npz:
+                meta = json.loads(str(npz['meta']))
+                if meta['digest'] != stamp[2] or meta['known'] != list(stamp[3]):
+                    return None
+                table = defparser.RingTable()
+                table.relink(lines)
+                table.nur, table.inset, table.loops = (meta['nur'], meta['inset'],
+                                                       meta['loops'])
+                for idx, key in enumerate(meta['keys']):
+                    table.columns[key] = npz['c{}'.format(idx)]
+                    table.precision[key] = meta['precision'][key]
+        except Exception:
+            return None
+        return table
+
+    def _write_sidecar(self, path, stamp, table):
+        keys = table.keys()
+        meta = {'digest': stamp[2], 'known': list(stamp[3]), 'nur': table.nur,
+                'inset': table.inset, 'loops': table.loops, 'keys': keys,
+                'precision': dict((key, table.precision[key]) for key in keys)}
+        arrays = dict(('c{}'.format(idx), table[key]) for idx, key in enumerate(keys))
+        sidecarPath = self._sidecar_path(path)
+        try:
+            fd, tmpName = tempfile.mkstemp(prefix=os.path.basename(sidecarPath) + '.',
+                                           suffix='.tmp', dir=os.path.dirname(sidecarPath))
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+            _replace(tmpName, sidecarPath)
+        except (IOError, OSError):
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
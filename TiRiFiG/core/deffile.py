@@ -0,0 +1,374 @@
+# -*- coding: UTF-8 -*-
+"""Headless loading, editing and saving of TiRiFiC .def files.
+
+DefFile ties the parser and the save engine together so that .def files can be
+loaded, edited ring by ring or in bulk and saved without Qt or matplotlib, e.g. by
+pipelines working through many galaxies. The GUI keeps the .def file it has open in a
+DefFile as well.
+
+variables:
+    UNITS:               unit measurement of the tilted-ring parameters TiRiFiG knows
+                         about; these are kept even if they don't have NUR values.
+    DEFAULT_PRECISION:   decimal places new parameters are written with.
+
+functions:
+    load:                reads a .def file into a DefFile.
+
+classes:
+    DefFile:             a .def file with its parsed tilted-ring parameters.
+"""
+
+import numpy as np
+
+from TiRiFiG.core import defparser, defwriter
+
+UNITS = {'VROT': 'km s-1',
+         'SBR': 'Jy km s-1 arcsec-2',
+         'INCL': 'degrees',
+         'PA': 'degrees',
+         'RADI': 'arcsec',
+         'Z0': 'arcsec',
+         'SDIS': 'km s-1',
+         'XPOS': 'degrees',
+         'YPOS': 'degrees',
+         'VSYS': 'km s-1',
+         'DVRO': 'km s-1 arcsec-1',
+         'DVRA': 'km s-1 arcsec-1',
+         'VRAD': 'km s-1'}
+
+DEFAULT_PRECISION = 5
+
+
+def load(fileName, known=None, cache=None):
+    """Reads a .def file into a DefFile
+
+    Keyword arguments:
+    fileName (str)--     path to the .def file
+    known--              tilted-ring parameters which are kept even if they don't
+                         have NUR values (defaults to the keys of UNITS)
+    cache (DefCache)--   cache to take the parsed file from if it's unchanged
+
+    Returns:
+    DefFile
+    """
+    known = UNITS.keys() if known is None else known
+    if cache is None:
+        table = defparser.read_def(fileName, known)
+    else:
+        table = cache.load(fileName, known)
+    return DefFile(fileName=fileName, known=known, table=table)
+
+
+class DefFile(object):
+    """A .def file with its parsed tilted-ring parameters
+
+    Ring indices are zero-based, so ring 1 of TiRiFiC is index 0.
+
+    Instance variables:
+        fileName   (string):      path of the file lines were read from or saved to.
+        known      (set):         parameters kept even if they don't have NUR values.
+        table      (RingTable):   parsed lines and values of the parameters.
+        units      (dictionary):  unit measurement of each parameter, written in a
+                                  comment when a new parameter is appended.
+        settings   (dictionary):  values of other keys e.g. LOOPS to be written on the
+                                  next save.
+
+    Functions:
+        get:              values of a parameter, all or some rings.
+        set:              changes the values of a parameter, all or some rings.
+        transform:        applies a function to the values of several parameters.
+        fill_rings:       pads parameters with fewer than NUR values.
+        regrid:           moves all parameters onto new ring radii.
+        setting:          text value of any key e.g. LOOPS or FITMODE.
+        set_setting:      changes the text value of any key.
+        save:             writes changed parameters and settings in one atomic write.
+        snapshot:         copy of the file to be saved elsewhere, e.g. on a thread.
+        merge_saved:      takes over the result of saving a snapshot.
+        reparse:          takes new lines of the file, parsing only edited ones.
+    """
+
+    def __init__(self, lines=(), fileName=None, known=None, table=None):
+        self.fileName = fileName
+        self.known = set(key.upper() for key in (UNITS if known is None else known))
+        if table is None:
+            table = defparser.parse_lines(list(lines), self.known)
+        self.table = table
+        self.units = dict(UNITS)
+        self.settings = {}
+        # the table a snapshot was taken from, its versions and the settings at the time
+        self._origin = None
+        self._baseVersions = None
+        self._savedSettings = {}
+
+    @property
+    def lines(self):
+        return self.table.lines
+
+    @property
+    def nur(self):
+        return self.table.nur
+
+    @property
+    def inset(self):
+        return self.table.inset
+
+    @property
+    def loops(self):
+        return self.table.loops
+
+    def __contains__(self, key):
+        return key.upper() in self.table
+
+    def keys(self):
+        """Returns the tilted-ring parameters in the order they appear in the file"""
+        return self.table.keys()
+
+    def get(self, key, rings=None):
+        """Returns values of a parameter
+
+        Keyword arguments:
+        key (str)--  parameter name e.g. VROT
+        rings--      ring index, slice or sequence of indices (all rings by default)
+
+        Returns:
+        float for a single ring, otherwise a copy of the values as an array
+        """
+        values = self.table[key.upper()][slice(None) if rings is None else rings]
+        if isinstance(values, np.ndarray):
+            return values.copy()
+        return float(values)
+
+    def set(self, key, values, rings=None, precision=None):
+        """Changes values of a parameter
+
+        Keyword arguments:
+        key (str)--        parameter name e.g. VROT; new parameters are added
+        values--           new value(s)
+        rings--            ring index, slice or sequence of indices (all rings by
+                           default, in which case the number of rings may change)
+        precision (int)--  decimal places the values are written with
+
+        Returns:
+        bool
+        True if the values changed
+        """
+        key = key.upper()
+        if rings is not None:
+            column = self.table[key].copy()
+            column[rings] = values
+            values = column
+        if precision is None and key not in self.table:
+            precision = DEFAULT_PRECISION
+        return self.table.set_column(key, values, precision)
+
+    def transform(self, func, keys=None):
+        """Applies a function to the values of several parameters
+
+        Keyword arguments:
+        func--   function taking the array of values of a parameter and returning
+                 the new values e.g. lambda v: np.clip(v, 0, 90)
+        keys--   parameters to transform (all parameters by default)
+
+        Returns:
+        list
+        The parameters whose values changed
+        """
+        keys = self.keys() if keys is None else [key.upper() for key in keys]
+        return [key for key in keys if self.set(key, func(self.get(key)))]
+
+    def fill_rings(self):
+        """Pads parameters with fewer than NUR values
+
+        Returns:
+        list
+        The padded parameters
+
+        RADI is continued in steps of 40 arcsec, other parameters repeat their last
+        value; parameters with NUR or more values are left alone.
+        """
+        padded = []
+        for key in self.keys():
+            values = self.table[key]
+            diff = (self.nur or 0) - values.size
+            if diff <= 0:
+                continue
+            if key == 'RADI':
+                extra = values[-1] + 40.0 * np.arange(1, diff + 1)
+            else:
+                extra = np.repeat(values[-1], diff)
+            self.table.set_column(key, np.concatenate([values, extra]))
+            padded.append(key)
+        return padded
+
+    def regrid(self, radii):
+        """Moves all parameters onto new ring radii
+
+        Keyword arguments:
+        radii--  new values of RADI in increasing order
+
+        Returns:
+        list
+        The parameters whose values changed
+
+        Every parameter is interpolated linearly at the new radii; beyond the old
+        outermost (innermost) ring it keeps its outermost (innermost) value. A
+        parameter with fewer values than RADI repeats its last value for the
+        remaining rings, as TiRiFiC does. NUR is set to the new number of rings.
+        """
+        radii = np.asarray(radii, dtype=np.float64).ravel()
+        old = self.table['RADI']
+        if np.any(np.diff(old) <= 0) or np.any(np.diff(radii) <= 0):
+            raise ValueError("RADI must increase from ring to ring to regrid")
+        changed = []
+        for key in self.keys():
+            if key == 'RADI':
+                continue
+            values = self.table[key][:old.size]
+            values = np.append(values, np.repeat(values[-1], old.size - values.size))
+            if self.set(key, np.interp(radii, old, values)):
+                changed.append(key)
+        if self.set('RADI', radii):
+            changed.append('RADI')
+        if self.nur != radii.size:
+            self.table.nur = radii.size
+            self.set_setting('NUR', radii.size)
+        return changed
+
+    def setting(self, key):
+        """Returns the text value of any key e.g. LOOPS, or None if it isn't defined"""
+        key = key.upper()
+        if key in self.settings:
+            return self.settings[key]
+        span = self.table.spans.get(key)
+        if span is None:
+            return None
+        return self.lines[span[0]].split('=')[1].strip()
+
+    def set_setting(self, key, value):
+        """Changes the text value of any key e.g. set_setting('LOOPS', 5)
+
+        The new value is written, or the key appended, on the next save.
+        """
+        self.settings[key.upper()] = str(value)
+
+    def save(self, fileName=None, replacements=None, progress=None):
+        """Writes changed parameters and settings to a .def file
+
+        Keyword arguments:
+        fileName (str)--       path to write to (defaults to fileName)
+        replacements (dict)--  extra line substitutions e.g. defwriter.RUN_SETTINGS
+        progress (function)--  passed on to defwriter.write_lines
+
+        Returns:
+        bool
+        True if the file was written
+
+        Only parameters whose values changed since the last save are formatted;
+        other lines stay byte-identical. The file is written with one atomic write,
+        or not at all if fileName already holds exactly these lines.
+        """
+        if fileName is None:
+            fileName = self.fileName
+        dirty = set(self.table.dirty_keys())
+        params = [(key, self.table[key], self.table.precision[key],
+                   self.units.get(key, "")) for key in self.keys() if key in dirty]
+
+        subs = dict((key, [key + "= " + value + "\n"])
+                    for key, value in self.settings.items())
+        if replacements:
+            subs.update(replacements)
+
+        if params or subs:
+            lines = defwriter.update_lines(self.lines, params, subs)
+            for key in sorted(self.settings):
+                if key not in self.table.spans:
+                    lines.extend(subs[key])
+        else:
+            lines = self.lines
+
+        written = fileName != self.fileName or lines != self.lines
+        if written:
+            defwriter.write_lines(str(fileName), lines, progress)
+        self.table.relink(lines)
+        self.table.mark_saved(dirty)
+        self.settings.clear()
+        self.fileName = fileName
+        return written
+
+    def snapshot(self):
+        """Returns a copy of the file to be saved elsewhere, e.g. on a worker thread
+
+        The copy shares no mutable state with the file, so both can be changed
+        independently; the settings still to be written are copied along, and stay
+        to be written here until the copy is saved. Once it is, merge_saved brings
+        the file up to date with it.
+        """
+        copy = DefFile(fileName=self.fileName, known=self.known,
+                       table=self.table.copy())
+        copy.units = dict(self.units)
+        copy.settings = dict(self.settings)
+        copy._savedSettings = dict(self.settings)
+        copy._origin = self.table
+        copy._baseVersions = dict(self.table.versions)
+        return copy
+
+    def merge_saved(self, saved):
+        """Takes over the result of saving a snapshot
+
+        Keyword arguments:
+        saved (DefFile)--  copy returned by snapshot, after its save
+
+        Returns:
+        None
+
+        The file takes the path and lines saved, and the values of each parameter
+        saved unless it changed here since the snapshot; those still count as
+        changed. The settings saved are no longer to be written, unless they were
+        set again since. If the table was replaced since, e.g. by reparse, only the
+        path is taken.
+        """
+        self.fileName = saved.fileName
+        for key, value in saved._savedSettings.items():
+            if self.settings.get(key) == value:
+                del self.settings[key]
+        if saved._origin is not self.table:
+            return
+        table = saved.table
+        for key in table.columns:
+            if self.table.versions.get(key, 0) != saved._baseVersions.get(key, 0):
+                continue
+            self.table.columns[key] = table.columns[key]
+            self.table.precision[key] = table.precision[key]
+            self.table.versions[key] = table.versions.get(key, 0)
+            self.table.savedVersions[key] = table.savedVersions.get(key, 0)
+        self.table.relink(table.lines)
+
+    def reparse(self, lines, known=None, parsed=None):
+        """Takes new lines of the file e.g. after it was edited in a text editor
+
+        Keyword arguments:
+        lines (list)--   text of each line of the file
+        known--          parameters kept even if they don't have NUR values
+                         (defaults to known)
+        parsed (tuple)-- (previous, table, changed) where table and changed were
+                         returned by defparser.reparse for lines against previous, a
+                         copy of table, e.g. on a worker thread (None: lines are
+                         parsed here)
+
+        Returns:
+        set
+        The parameters which were added, removed or whose values changed
+
+        Only the lines which differ from the current ones are parsed again. A parsed
+        table is only taken if the table hasn't changed since previous was copied;
+        otherwise lines are parsed again here.
+        """
+        if known is not None:
+            self.known = set(key.upper() for key in known)
+        if (parsed is not None and parsed[0].versions == self.table.versions and
+                parsed[0].lines == self.table.lines):
+            self.table, changed = parsed[1], parsed[2]
+        else:
+            self.table, changed = defparser.reparse(self.table, lines, self.known)
+        self.settings.clear()
+        return changed
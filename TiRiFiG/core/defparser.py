@@ -0,0 +1,306 @@
+# -*- coding: UTF-8 -*-
+"""Single-pass parser for TiRiFiC .def files.
+
+The lines of a .def file are read once and turned into a RingTable: one contiguous
+float64 array per tilted-ring parameter, the number of decimal places each parameter
+was written with and the span of lines every key occupies in the file. The rules for
+deciding what counts as a tilted-ring parameter are the ones TiRiFiG has always used:
+a key whose first, middle and last values are numbers and which either has NUR values
+or is one of the known tilted-ring parameters.
+
+functions:
+    line_key:      returns the normalised key defined on a line of a .def file.
+    parse_lines:   builds a RingTable from the lines of a .def file.
+    reparse:       parses only the lines which changed since a previous RingTable.
+    read_def:      reads a .def file from disk and parses it.
+
+classes:
+    RingTable:     columnar view of the tilted-ring parameters in a .def file.
+"""
+
+import numpy as np
+
+
+class RingTable(object):
+    """Columnar view of the tilted-ring parameters in a .def file
+
+    Instance variables:
+        lines      (list):        text of each line of the .def file.
+        nur        (int):         number of rings (None if NUR isn't specified).
+        inset      (string):      name of the data cube (None if INSET isn't specified).
+        loops      (int):         number of fitting loops (None if LOOPS isn't specified).
+        columns    (dictionary):  float64 array of values for each tilted-ring parameter.
+        precision  (dictionary):  number of decimal places each parameter is written with.
+        spans      (dictionary):  (start, stop) line span of every key in the file.
+        versions   (dictionary):  number of times the values of each parameter have
+                                  changed since the file was parsed.
+        savedVersions (dictionary): version of each parameter when it was last saved.
+    """
+
+    def __init__(self, lines=None):
+        self.lines = [] if lines is None else lines
+        self.nur = None
+        self.inset = None
+        self.loops = None
+        self.columns = {}
+        self.precision = {}
+        self.spans = {}
+        self.versions = {}
+        self.savedVersions = {}
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __len__(self):
+        return len(self.columns)
+
+    def copy(self):
+        """Returns a copy of the table which shares no mutable state with it"""
+        table = RingTable(list(self.lines))
+        table.nur, table.inset, table.loops = self.nur, self.inset, self.loops
+        table.columns = dict((key, val.copy()) for key, val in self.columns.items())
+        table.precision = dict(self.precision)
+        table.spans = dict(self.spans)
+        table.versions = dict(self.versions)
+        table.savedVersions = dict(self.savedVersions)
+        return table
+
+    def nbytes(self):
+        """Returns the approximate memory held by the values and lines of the table"""
+        return (sum(val.nbytes for val in self.columns.values()) +
+                sum(len(line) for line in self.lines))
+
+    def keys(self):
+        """Returns the tilted-ring parameters in the order they appear in the file"""
+        end = len(self.lines)
+        return sorted(self.columns, key=lambda key: self.spans.get(key, (end,))[0])
+
+    def set_column(self, key, values, precision=None):
+        """Replaces the values of a parameter
+
+        Keyword arguments:
+        key (str)--        parameter name e.g. VROT
+        values (list)--    new values of the parameter
+        precision (int)--  number of decimal places the values are written with
+
+        Returns:
+        bool
+        True if the values or precision changed, in which case the version of the
+        parameter is incremented and it is reported by dirty_keys until it is saved
+        """
+        values = np.array(values, dtype=np.float64)
+        old = self.columns.get(key)
+        if precision is None:
+            precision = self.precision.get(key, 0)
+        if (old is not None and old.shape == values.shape and
+                precision == self.precision.get(key) and np.array_equal(old, values)):
+            return False
+        self.columns[key] = values
+        self.precision[key] = precision
+        self.versions[key] = self.versions.get(key, 0) + 1
+        return True
+
+    def dirty_keys(self):
+        """Returns the parameters whose values changed since they were last saved"""
+        return [key for key in self.keys()
+                if self.versions.get(key, 0) != self.savedVersions.get(key, 0)]
+
+    def mark_saved(self, keys=None):
+        """Records the current version of keys (all parameters by default) as saved"""
+        for key in self.columns if keys is None else keys:
+            self.savedVersions[key] = self.versions.get(key, 0)
+
+    def relink(self, lines):
+        """Points the table at new lines of the same file e.g. after a save
+
+        Keyword arguments:
+        lines (list)--  text of each line of the .def file
+
+        Returns:
+        None
+
+        The line spans of the keys are rebuilt; values aren't parsed again.
+        """
+        self.lines = lines
+        self.spans = {}
+        for lineNo, line in enumerate(lines):
+            key = line_key(line)
+            if key is not None:
+                self.spans[key.upper()] = (lineNo, lineNo + 1)
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def _fraction_digits(text):
+    """Returns the largest number of decimal places among the values in text
+
+    Keyword arguments:
+    text (str)--  values of a parameter e.g. "+0.00000E+00 +4.00000E+01"
+
+    Returns:
+    int
+
+    The digits between each '.' and the next whitespace or 'E' are counted in one
+    vectorised step instead of splitting every value.
+    """
+    if not isinstance(text, bytes):
+        text = text.encode('ascii', 'replace')
+    buf = np.frombuffer(text, dtype=np.uint8)
+    dots = np.flatnonzero(buf == ord('.'))
+    if dots.size == 0:
+        return 0
+    # whitespace (and other control characters) or the exponent end a fraction
+    stops = np.append(np.flatnonzero((buf <= ord(' ')) | (buf == ord('E'))), buf.size)
+    ends = stops[np.searchsorted(stops, dots)]
+    return int((ends - dots - 1).max())
+
+
+def line_key(line):
+    """Returns the key defined on a line of a .def file
+
+    Keyword arguments:
+    line (str)--  text of a line from the .def file
+
+    Returns:
+    str
+    The key with all whitespace removed or None if the line doesn't define a key
+    """
+    # only the text before '=' is copied, which matters for lines of 10k values
+    idx = line.find('=')
+    if idx < 0:
+        return None
+    return ''.join(line[:idx].split())
+
+
+def _scan_line(table, lineNo, line, candidates):
+    """Reads one line into table; possible tilted-ring parameters go to candidates"""
+    lineVals = line.split('=')
+    if len(lineVals) < 2:
+        return
+    key = ''.join(lineVals[0].split()).upper()
+    table.spans[key] = (lineNo, lineNo + 1)
+    parVal = lineVals[1].split()
+
+    if key == 'NUR':
+        if table.nur is None and parVal:
+            table.nur = int(parVal[0])
+    elif key == 'INSET':
+        table.inset = ''.join(parVal)
+    elif key == 'LOOPS':
+        if parVal:
+            table.loops = int(parVal[0])
+    elif (parVal and _is_number(parVal[0]) and _is_number(parVal[-1]) and
+          _is_number(parVal[len(parVal) // 2])):
+        candidates.append((key, lineVals[1], parVal))
+
+
+def _add_columns(table, candidates, known, previous=None):
+    # NUR is only known once the whole file has been read. A candidate without
+    # values is an unchanged line whose column is taken from the previous table.
+    for key, text, parVal in candidates:
+        if parVal is None:
+            table.columns[key] = previous.columns[key]
+            table.precision[key] = previous.precision[key]
+        elif len(parVal) == table.nur or key in known:
+            table.columns[key] = np.array(parVal, dtype=np.float64)
+            table.precision[key] = _fraction_digits(text)
+
+
+def parse_lines(lines, known=()):
+    """Builds a RingTable from the lines of a .def file
+
+    Keyword arguments:
+    lines (list)--  text of each line of the .def file
+    known--         tilted-ring parameters which are kept even if they don't have
+                    NUR values e.g. the keys of fit_par
+
+    Returns:
+    RingTable
+
+    Every line is visited once. Keys are upper-cased; a key defined more than once
+    takes the values of its last definition whereas NUR is taken from its first.
+    """
+    known = set(key.upper() for key in known)
+    table = RingTable(lines)
+    candidates = []
+    for lineNo, line in enumerate(lines):
+        _scan_line(table, lineNo, line, candidates)
+    _add_columns(table, candidates, known)
+    return table
+
+
+def reparse(previous, lines, known=()):
+    """Parses new lines of a .def file against the table of its previous version
+
+    Keyword arguments:
+    previous (RingTable)--  table parsed from the previous version of the file
+    lines (list)--          text of each line of the new version
+    known--                 tilted-ring parameters which are kept even if they
+                            don't have NUR values
+
+    Returns:
+    (RingTable, set)
+    The table of the new lines and the parameters which were added, removed or
+    whose values changed
+
+    A line identical to the line the previous table has for its key isn't split or
+    converted again; its column is shared with the previous table. Only edited lines
+    are parsed, unless NUR changed, in which case the whole file is.
+    """
+    if previous is None:
+        table = parse_lines(lines, known)
+        return table, set(table.columns)
+
+    known = set(key.upper() for key in known)
+    table = RingTable(lines)
+    candidates = []
+    for lineNo, line in enumerate(lines):
+        key = line_key(line)
+        if key is None:
+            continue
+        key = key.upper()
+        span = previous.spans.get(key)
+        if (key in previous.columns and span is not None and
+                previous.lines[span[0]] == line):
+            table.spans[key] = (lineNo, lineNo + 1)
+            candidates.append((key, None, None))
+        else:
+            _scan_line(table, lineNo, line, candidates)
+
+    if table.nur != previous.nur:
+        table = parse_lines(lines, known)
+    else:
+        _add_columns(table, candidates, known, previous)
+
+    changed = set(table.columns) ^ set(previous.columns)
+    for key in set(table.columns) & set(previous.columns):
+        new, old = table.columns[key], previous.columns[key]
+        if new is not old and (table.precision[key] != previous.precision[key] or
+                               not np.array_equal(new, old)):
+            changed.add(key)
+    return table, changed
+
+
+def read_def(fileName, known=()):
+    """Reads and parses a .def file
+
+    Keyword arguments:
+    fileName (str)--  path to the .def file
+    known--           tilted-ring parameters which are kept even if they don't have
+                      NUR values
+
+    Returns:
+    RingTable
+    """
+    with open(fileName) as f:
+        lines = f.readlines()
+    return parse_lines(lines, known)
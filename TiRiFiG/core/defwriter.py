@@ -0,0 +1,180 @@
+# -*- coding: UTF-8 -*-
+"""Save engine for TiRiFiC .def files.
+
+All the parameters to be saved are gathered into one pass over the lines of the .def
+file and the result is written with a single buffered write to a temporary file which
+then replaces the .def file. TiRiFiC, or anything else watching the file, therefore
+sees either the old or the new file but never a half-written one.
+
+variables:
+    RUN_SETTINGS:     replacements which make TiRiFiC fit without prompting and log
+                      its progress.
+    BLOCK_SIZE:       number of characters written between calls of the progress
+                      function of write_lines.
+
+functions:
+    format_values:    formats all the values of a parameter in one step.
+    parameter_line:   formats the values of a parameter as a line of a .def file.
+    update_lines:     returns the lines of a .def file with new parameter values.
+    write_lines:      atomically replaces a file with the given lines.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from TiRiFiG.core.defparser import line_key
+
+# os.replace overwrites an existing file on every platform, os.rename only on POSIX
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _add_gr_cont(line):
+    return [line, "GR_CONT = \n"]
+
+
+RUN_SETTINGS = {'ACTION': ["ACTION = 1\n"],
+                'PROMPT': ["PROMPT = 0\n"],
+                'GR_DEVICE': _add_gr_cont,
+                'PROGRESSLOG': ["PROGRESSLOG = progress\n"],
+                'GR_CONT': []}
+
+BLOCK_SIZE = 2**20
+
+
+def format_values(values, precision):
+    """Formats all the values of a parameter in one step
+
+    Keyword arguments:
+    values--           values of the parameter (list or array)
+    precision (int)--  number of decimal places of each value
+
+    Returns:
+    str
+    e.g. " 0.00E+00 2.00E+01", the same text as joining '{0:.{1}E}'.format of each
+    value with a leading space
+
+    A single format string with one conversion per value is applied to the whole
+    array, so the text is built by one C-level call instead of a Python loop.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    return (' %.{0}E'.format(int(precision)) * values.size) % tuple(values.tolist())
+
+
+def parameter_line(key, values, precision):
+    """Formats the values of a parameter as a line of a .def file
+
+    Keyword arguments:
+    key (str)--        parameter name e.g. VROT
+    values (list)--    values of the parameter
+    precision (int)--  number of decimal places of each value
+
+    Returns:
+    str
+    e.g. "    VROT= 0.00E+00 2.00E+01\\n"
+    """
+    return "    " + key + "=" + format_values(values, precision) + "\n"
+
+
+def update_lines(lines, params=(), replacements=None):
+    """Returns the lines of a .def file with new parameter values
+
+    Keyword arguments:
+    lines (list)--          text of each line of the .def file
+    params--                (key, values, precision, unitMeasurement) of each
+                            parameter to be saved
+    replacements (dict)--   extra lines to substitute for a key; either a list of
+                            lines or a function taking the original line and
+                            returning a list of lines e.g. RUN_SETTINGS
+
+    Returns:
+    list
+
+    Every line defining one of the keys is replaced in a single pass over lines. Keys
+    are upper-cased before matching, as the parser does, so loops= is replaced by a
+    substitution for LOOPS.
+    Parameters which aren't in the file yet are appended at the end together with
+    a comment giving their unit measurement.
+    """
+    subs = {}
+    units = []
+    for key, values, precision, unitMeasurement in params:
+        subs[key] = [parameter_line(key, values, precision)]
+        units.append((key, unitMeasurement))
+    if replacements:
+        subs.update(replacements)
+
+    newLines = []
+    found = set()
+    for line in lines:
+        key = line_key(line)
+        if key is not None:
+            key = key.upper()
+        if key in subs:
+            found.add(key)
+            sub = subs[key]
+            newLines.extend(sub(line) if callable(sub) else sub)
+        else:
+            newLines.append(line)
+
+    for key, unitMeasurement in units:
+        if key not in found:
+            newLines.append("# " + key + " parameter in " + unitMeasurement + "\n")
+            newLines.extend(subs[key])
+    return newLines
+
+
+def _new_file_mode():
+    # mkstemp creates files readable by the owner only; give new files the
+    # permissions open() would have given them
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_lines(fileName, lines, progress=None):
+    """Atomically replaces a file with the given lines
+
+    Keyword arguments:
+    fileName (str)--       path of the file to be written
+    lines (list)--         text of each line
+    progress (function)--  called with the number of characters written and their
+                           total (None: the text is written in one go)
+
+    Returns:
+    None
+
+    The text is written to a temporary file in the same directory, synced to disk
+    and renamed over fileName. If fileName is a symbolic link the file it points to
+    is replaced. The permissions of an existing file are kept. With progress the
+    text is written in blocks of BLOCK_SIZE characters, and once more after the
+    sync; an exception raised by progress abandons the write, leaving fileName as
+    it was.
+    """
+    target = os.path.realpath(fileName)
+    dirName, baseName = os.path.split(target)
+    fd, tmpName = tempfile.mkstemp(prefix='.' + baseName + '.', suffix='.tmp',
+                                   dir=dirName)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            text = ''.join(lines)
+            if progress is None:
+                f.write(text)
+            else:
+                for start in range(0, len(text), BLOCK_SIZE):
+                    f.write(text[start:start + BLOCK_SIZE])
+                    progress(min(start + BLOCK_SIZE, len(text)), len(text))
+            f.flush()
+            os.fsync(f.fileno())
+        if progress is not None:
+            progress(len(text), len(text))
+        if os.path.exists(target):
+            os.chmod(tmpName, os.stat(target).st_mode & 0o7777)
+        else:
+            os.chmod(tmpName, _new_file_mode())
+        _replace(tmpName, target)
+    except BaseException:
+        if os.path.exists(tmpName):
+            os.remove(tmpName)
+        raise
@@ -0,0 +1,366 @@
+# -*- coding: UTF-8 -*-
+"""Undo history of the values of the tilted-ring parameters, as a tree of edits.
+
+One tree covers all parameters of a .def file. Each node is an edit, holding for every
+parameter it changed the indices of the rings changed and their values before and
+after, so dragging one point of a parameter with ten thousand rings costs a few dozen
+bytes. Undoing and redoing move to the parent and back to a child, only touching the
+rings the edit changed. An edit made after undoing starts a new branch next to the
+old one instead of throwing it away; branches share the edits they have in common,
+so a branch only costs the rings changed on it. Switching to any other node walks
+the edits between the two through their common ancestor.
+
+Every checkpointInterval levels a node keeps a copy of the values of the parameters
+edited so far, so a node far from the current one is reached from the nearest copy
+instead of replaying all edits in between. Once the edits and copies take more than
+maxBytes the copies are dropped first, then the branches least recently visited, and
+finally the oldest edits leading to the current node.
+
+variables:
+    MAX_BYTES:            default memory budget of a HistoryTree.
+    CHECKPOINT_INTERVAL:  default number of levels between copies of the values.
+
+classes:
+    HistoryTree:          undo tree of the values of the tilted-ring parameters.
+"""
+
+import time
+
+import numpy as np
+
+MAX_BYTES = 32 * 2**20
+CHECKPOINT_INTERVAL = 50
+
+
+def _changed(old, new):
+    # rings whose value differs; NaN is taken to equal NaN
+    with np.errstate(invalid='ignore'):
+        same = (old == new) | (np.isnan(old) & np.isnan(new))
+    return np.flatnonzero(~same)
+
+
+class _Node(object):
+    # an edit; changes holds (key, rings, old, new) for each parameter it changed,
+    # rings being None if the number of rings changed and old and new hold all values
+    __slots__ = ('id', 'parent', 'children', 'changes', 'depth', 'label', 'created',
+                 'visited', 'redoChild', 'checkpoint', 'nbytes')
+
+    def __init__(self, id, parent, changes, label):
+        self.id = id
+        self.parent = parent
+        self.children = []
+        self.changes = changes
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.label = label
+        self.created = time.time()
+        self.visited = 0
+        self.redoChild = None
+        self.checkpoint = None
+        self.nbytes = sum(part.nbytes for change in changes
+                          for part in change[1:] if part is not None)
+
+
+class HistoryTree(object):
+    """Undo tree of the values of the tilted-ring parameters
+
+    Nodes are identified by an integer id; the root is the state the tree was created
+    with. Functions moving between nodes take targets, a dictionary of lists e.g. the
+    parVals of each graph widget, which are changed in place along with values, and
+    return the parameters whose values changed.
+
+    Instance variables:
+        values              (dictionary):  values of each parameter at the current
+                                           node.
+        current             (int):         id of the current node.
+        maxBytes            (int):         memory budget for edits and checkpoints.
+        checkpointInterval  (int):         number of levels between checkpoints.
+        nbytes              (int):         memory currently held by edits and
+                                           checkpoints.
+        onChange            (function):    called with the parameter, the rings and
+                                           their new values whenever values change,
+                                           by an edit or by moving to another node;
+                                           rings is None if all values are given
+                                           (None: nothing is called).
+
+    Functions:
+        add:           adds a parameter without an edit.
+        record:        records the values of parameters after an edit.
+        undo:          goes to the parent of the current node.
+        redo:          goes to the child of the current node visited last.
+        checkout:      goes to any node, e.g. the tip of another branch.
+        canUndo:       whether the current node has a parent.
+        canRedo:       whether the current node has a child.
+        branches:      ids of the nodes at the tips of the branches.
+        describe:      what the edit of a node changed and when.
+    """
+
+    def __init__(self, values=None, maxBytes=MAX_BYTES,
+                 checkpointInterval=CHECKPOINT_INTERVAL, onChange=None):
+        self.values = {}
+        self.maxBytes = maxBytes
+        self.checkpointInterval = checkpointInterval
+        self.nbytes = 0
+        self.onChange = onChange
+        # values of each edited parameter at the root, for restoring checkpoints
+        self._base = {}
+        self._clock = 0
+        self._nextId = 1
+        self._root = self._node = _Node(0, None, [], "opened")
+        self._nodes = {0: self._root}
+        for key, column in (values or {}).items():
+            self.add(key, column)
+
+    @property
+    def current(self):
+        return self._node.id
+
+    def add(self, key, values):
+        """Adds a parameter which isn't in the tree yet, without an edit to undo"""
+        self.values[key] = np.array(values, dtype=np.float64)
+
+    def canUndo(self):
+        return self._node.parent is not None
+
+    def canRedo(self):
+        return bool(self._node.children)
+
+    def record(self, changes, label=None):
+        """Records the values of parameters after an edit
+
+        Keyword arguments:
+        changes (dict)--  values of each parameter after the edit; parameters whose
+                          values didn't change are left out of the edit and those not
+                          in the tree are added
+        label (str)--     description of the edit (None: names the parameters and the
+                          number of rings changed)
+
+        Returns:
+        int
+        The id of the new node, a child of the current one, which becomes current;
+        None if no values changed
+        """
+        edits = []
+        for key in sorted(changes):
+            new = np.asarray(changes[key], dtype=np.float64)
+            if key not in self.values:
+                self.add(key, new)
+                continue
+            old = self.values[key]
+            if new.shape == old.shape:
+                rings = _changed(old, new)
+                if not rings.size:
+                    continue
+                edits.append((key, rings, old[rings], new[rings]))
+            else:
+                edits.append((key, None, old.copy(), new.copy()))
+            if key not in self._base:
+                self._base[key] = old.copy()
+        if not edits:
+            return None
+
+        if label is None:
+            label = ', '.join("{} ({} ring{})".format(
+                key, new.size if rings is None else rings.size,
+                '' if rings is not None and rings.size == 1 else 's')
+                for key, rings, old, new in edits)
+        node = _Node(self._nextId, self._node, edits, label)
+        self._nextId += 1
+        self._nodes[node.id] = node
+        self._node.children.append(node)
+        self._node.redoChild = node
+        self.nbytes += node.nbytes
+        self._move(node, True)
+        if node.depth % self.checkpointInterval == 0:
+            node.checkpoint = dict((key, self.values[key].copy()) for key in self._base)
+            self.nbytes += self._size(node.checkpoint)
+        self._trim()
+        return node.id
+
+    @staticmethod
+    def _size(checkpoint):
+        return sum(values.nbytes for values in checkpoint.values())
+
+    def _set(self, key, rings, values, targets, changed):
+        # sets values (and the list in targets, in place) of rings of a parameter
+        target = targets.get(key) if targets else None
+        if rings is None:
+            self.values[key] = values.copy()
+            if target is not None:
+                target[:] = values.tolist()
+        else:
+            self.values[key][rings] = values
+            if target is not None:
+                for ring, value in zip(rings.tolist(), values.tolist()):
+                    target[ring] = value
+        if self.onChange is not None:
+            self.onChange(key, rings, values)
+        if key not in changed:
+            changed.append(key)
+
+    def _move(self, node, forward, targets=None, changed=None):
+        # applies the edit of node, or undoes it, making node or its parent current
+        changed = [] if changed is None else changed
+        for key, rings, old, new in node.changes:
+            self._set(key, rings, new if forward else old, targets, changed)
+        self._node = node if forward else node.parent
+        self._clock += 1
+        self._node.visited = self._clock
+        return changed
+
+    def undo(self, targets=None):
+        """Goes to the parent of the current node
+
+        Keyword arguments:
+        targets (dict)--  lists changed in place along with values
+
+        Returns:
+        list
+        The parameters whose values changed, or None if there's nothing to undo
+        """
+        node = self._node
+        if node.parent is None:
+            return None
+        node.parent.redoChild = node
+        return self._move(node, False, targets)
+
+    def redo(self, targets=None):
+        """Goes to the child of the current node visited last
+
+        Keyword arguments:
+        targets (dict)--  lists changed in place along with values
+
+        Returns:
+        list
+        The parameters whose values changed, or None if there's nothing to redo
+        """
+        node = self._node.redoChild
+        if node is None:
+            if not self._node.children:
+                return None
+            node = self._node.children[-1]
+        return self._move(node, True, targets)
+
+    def _path(self, node, ancestor):
+        # nodes below ancestor down to node, the top one first
+        path = []
+        while node is not ancestor:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        return path
+
+    def checkout(self, id, targets=None):
+        """Goes to any node, e.g. the tip of another branch
+
+        Keyword arguments:
+        id (int)--        id of the node
+        targets (dict)--  lists changed in place along with values
+
+        Returns:
+        list
+        The parameters whose values changed
+
+        The edits are undone up to the common ancestor of the current node and the
+        node, and applied from there down to it, unless the nearest checkpoint above
+        the node is closer, in which case the values are restored from it. Redo then
+        follows the path taken.
+        """
+        target = self._nodes[id]
+        a, b = self._node, target
+        while a.depth > b.depth:
+            a = a.parent
+        while b.depth > a.depth:
+            b = b.parent
+        while a is not b:
+            a, b = a.parent, b.parent
+        steps = self._node.depth + target.depth - 2 * a.depth
+
+        start = target
+        while start.checkpoint is None and start.parent is not None:
+            start = start.parent
+        changed = []
+        if (start.checkpoint is not None and
+                target.depth - start.depth + self.checkpointInterval < steps):
+            for key, base in self._base.items():
+                # parameters first edited after the checkpoint have their base values
+                values = start.checkpoint.get(key, base)
+                if not np.array_equal(values, self.values[key], equal_nan=True):
+                    self._set(key, None, values, targets, changed)
+            self._node = start
+        else:
+            while self._node is not a:
+                self._move(self._node, False, targets, changed)
+            start = a
+        for node in self._path(target, start):
+            node.parent.redoChild = node
+            self._move(node, True, targets, changed)
+        self._clock += 1
+        self._node.visited = self._clock
+        return changed
+
+    def branches(self):
+        """Returns the ids of the nodes at the tips of the branches, oldest first"""
+        return sorted(node.id for node in self._nodes.values() if not node.children)
+
+    def describe(self, id):
+        """Returns what the edit of a node changed and when, e.g. for a menu"""
+        node = self._nodes[id]
+        return "{} at {}, {} edit{} deep".format(
+            node.label, time.strftime('%H:%M:%S', time.localtime(node.created)),
+            node.depth, '' if node.depth == 1 else 's')
+
+    def _remove(self, node):
+        node.parent.children.remove(node)
+        if node.parent.redoChild is node:
+            node.parent.redoChild = None
+        del self._nodes[node.id]
+        self.nbytes -= node.nbytes
+        if node.checkpoint is not None:
+            self.nbytes -= self._size(node.checkpoint)
+
+    def _trim(self):
+        if self.nbytes <= self.maxBytes:
+            return
+        # checkpoints only save time, so they go first, the oldest first
+        for node in sorted((node for node in self._nodes.values()
+                            if node.checkpoint is not None), key=lambda n: n.id):
+            if self.nbytes <= self.maxBytes:
+                return
+            self.nbytes -= self._size(node.checkpoint)
+            node.checkpoint = None
+
+        # then the tips of other branches, least recently visited first; a branch is
+        # removed from its tip so that the edits it shares with others are kept
+        onPath = set()
+        node = self._node
+        while node is not None:
+            onPath.add(node.id)
+            node = node.parent
+        while self.nbytes > self.maxBytes:
+            tips = [node for node in self._nodes.values()
+                    if not node.children and node.id not in onPath]
+            if not tips:
+                break
+            self._remove(min(tips, key=lambda n: (n.visited, n.id)))
+
+        # finally the oldest edits, the first one below the root becoming the root;
+        # the latest edit can always be undone, however large it was
+        while self.nbytes > self.maxBytes and self._node.depth > 1:
+            root = self._path(self._node, self._root)[0]
+            for key, rings, old, new in root.changes:
+                if rings is None:
+                    self._base[key] = new.copy()
+                else:
+                    self._base[key][rings] = new
+            self._remove(root)
+            del self._nodes[self._root.id]
+            root.parent = None
+            root.changes = []
+            root.nbytes = 0
+            self._nodes[root.id] = root
+            self._root = root
+            stack = [(root, 0)]
+            while stack:
+                node, depth = stack.pop()
+                node.depth = depth
+                stack.extend((child, depth + 1) for child in node.children)
@@ -0,0 +1,312 @@
+# -*- coding: UTF-8 -*-
+"""Append-only journal of the unsaved edits of a .def file.
+
+Every edit made to a parameter is appended to a small binary file next to the .def
+file, so that the edits made since the last save survive a crash of TiRiFiG and can
+be replayed into the .def file when it's opened again. A record holds the parameter,
+the indices of the rings changed and their new values, so dragging a point adds a few
+dozen bytes. Records are handed to the operating system straight away and synced to
+disk at most every syncInterval seconds; each one carries a checksum, so a record cut
+short by a crash is recognised and dropped along with anything after it. Once the
+journal grows past compactBytes it's rewritten as a snapshot holding the current
+values of each edited parameter once.
+
+The journal starts with a hash of the .def file it belongs to. Replaying it into a
+file with different contents, e.g. one saved since, does nothing.
+
+variables:
+    SUFFIX:        appended to the path of a .def file to get that of its journal.
+
+functions:
+    journal_path:  path of the journal of a .def file.
+    digest:        hash of the lines of a .def file identifying it in a journal.
+    read:          reads the records of a journal.
+    replay:        applies the edits in a journal to a DefFile.
+
+classes:
+    Journal:       append-only journal of the edits of a .def file.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+SUFFIX = '.journal'
+
+_MAGIC = b'TRFJ\x01'
+_HEADER = len(_MAGIC) + 20
+# length and CRC-32 of the payload of a record
+_FRAME = struct.Struct('<II')
+# kind of record, length of the parameter name and number of values
+_RECORD = struct.Struct('<BBI')
+_EDIT, _COLUMN = 1, 2
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def journal_path(fileName):
+    """Returns the path of the journal of a .def file"""
+    return str(fileName) + SUFFIX
+
+
+def digest(lines):
+    """Returns the hash of the lines of a .def file identifying it in a journal"""
+    text = ''.join(lines)
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8', 'surrogatepass')
+    return hashlib.sha1(text).digest()
+
+
+def _payload(key, rings, values):
+    # any key with NUR values is a parameter, whatever its characters
+    name = key.encode('utf-8')
+    if len(name) > 255:
+        raise ValueError("parameter name {!r} is too long to be journalled".format(key))
+    values = np.asarray(values, dtype='<f8').ravel()
+    if rings is None:
+        return (_RECORD.pack(_COLUMN, len(name), values.size) + name +
+                values.tobytes())
+    rings = np.asarray(rings, dtype='<i4').ravel()
+    return (_RECORD.pack(_EDIT, len(name), values.size) + name + rings.tobytes() +
+            values.tobytes())
+
+
+def _frame(payload):
+    return _FRAME.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def read(path):
+    """Reads the records of a journal
+
+    Keyword arguments:
+    path (str)--  path of the journal
+
+    Returns:
+    tuple
+    (digest, records, end) where records lists (key, rings, values) in the order
+    they were written, rings being None for a whole column, and end is the offset
+    after the last complete record; digest is None if path isn't a journal
+
+    Reading stops at the first record which is cut short or fails its checksum.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER or data[:len(_MAGIC)] != _MAGIC:
+        return None, [], 0
+    fileDigest = data[len(_MAGIC):_HEADER]
+    records = []
+    offset = _HEADER
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        kind, nameLength, count = _RECORD.unpack_from(payload)
+        pos = _RECORD.size
+        key = payload[pos:pos + nameLength].decode('utf-8', 'replace')
+        pos += nameLength
+        rings = None
+        if kind == _EDIT:
+            rings = np.frombuffer(payload, '<i4', count, pos)
+            pos += rings.nbytes
+        values = np.frombuffer(payload, '<f8', count, pos)
+        records.append((key, rings, values))
+        offset = start + length
+    return fileDigest, records, offset
+
+
+def replay(path, defFile):
+    """Applies the edits in a journal to a DefFile
+
+    Keyword arguments:
+    path (str)--         path of the journal
+    defFile (DefFile)--  the .def file the journal was written for, as it was read
+
+    Returns:
+    list
+    The parameters which changed, or None if there's no journal for the current
+    contents of defFile
+
+    Each parameter is set once with the result of all its edits. Edits of rings a
+    parameter doesn't have, or of parameters neither in the file nor written whole
+    to the journal, are skipped.
+    """
+    try:
+        fileDigest, records, end = read(path)
+    except (IOError, OSError):
+        return None
+    if fileDigest is None or fileDigest != digest(defFile.lines):
+        return None
+    columns = {}
+    order = []
+    for key, rings, values in records:
+        if rings is None:
+            columns[key] = values.copy()
+        else:
+            if key not in columns:
+                if key not in defFile:
+                    continue
+                columns[key] = defFile.get(key)
+            column = columns[key]
+            if rings.size and (rings.min() < 0 or rings.max() >= column.size):
+                continue
+            column[rings] = values
+        if key not in order:
+            order.append(key)
+    return [key for key in order if defFile.set(key, columns[key])]
+
+
+class Journal(object):
+    """Append-only journal of the edits of a .def file
+
+    The file is only created with the first edit, so a .def file without unsaved
+    edits has no journal. With resume an existing journal written for the same .def
+    file is continued, after cutting off a record cut short at its end; any other
+    journal at path is removed.
+
+    Instance variables:
+        path           (str):    path of the journal.
+        digest         (bytes):  hash of the .def file the edits apply to.
+        syncInterval   (float):  most seconds an edit may wait to be synced to disk
+                                 (0: every edit is synced straight away; None: only
+                                 on sync, compact and close).
+        compactBytes   (int):    size beyond which the journal should be compacted.
+        touched        (set):    parameters edited since the journal was started.
+        size           (int):    bytes in the journal.
+
+    Functions:
+        edit:              appends an edit.
+        sync:              writes pending edits to disk.
+        needsCompaction:   whether the journal has grown past compactBytes.
+        compact:           rewrites the journal as one record per edited parameter.
+        close:             syncs and closes the journal, keeping the file.
+        discard:           closes the journal and removes the file.
+    """
+
+    def __init__(self, path, digest, syncInterval=1.0, compactBytes=2**20,
+                 resume=False):
+        self.path = path
+        self.digest = digest
+        self.syncInterval = syncInterval
+        self.compactBytes = compactBytes
+        self.touched = set()
+        self.size = 0
+        self._file = None
+        self._pending = False
+        self._lastSync = time.time()
+        if resume and os.path.exists(path):
+            fileDigest, records, end = read(path)
+            if fileDigest == digest:
+                self._file = open(path, 'r+b')
+                self._file.truncate(end)
+                self._file.seek(end)
+                self.size = end
+                self.touched.update(key for key, rings, values in records)
+                return
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _open(self):
+        if self.size:
+            # closed before, but not discarded
+            self._file = open(self.path, 'ab')
+            return
+        self._file = open(self.path, 'wb')
+        self._file.write(_MAGIC + self.digest)
+        self.size = _HEADER
+
+    def edit(self, key, rings, values):
+        """Appends an edit
+
+        Keyword arguments:
+        key (str)--  parameter name e.g. VROT
+        rings--      indices of the rings changed, or None if values hold the whole
+                     column e.g. after the number of rings changed
+        values--     new values of the rings
+
+        Returns:
+        None
+
+        Raises ValueError, writing nothing, if key can't be journalled.
+        """
+        if self._file is None:
+            self._open()
+        record = _frame(_payload(key, rings, values))
+        self._file.write(record)
+        # in the hands of the OS, so it survives TiRiFiG being killed
+        self._file.flush()
+        self.size += len(record)
+        self.touched.add(key)
+        self._pending = True
+        if (self.syncInterval is not None and
+                time.time() - self._lastSync >= self.syncInterval):
+            self.sync()
+
+    def sync(self):
+        """Writes pending edits to disk so that they survive a crash of the system"""
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = False
+        self._lastSync = time.time()
+
+    def needsCompaction(self):
+        return self.size > self.compactBytes
+
+    def compact(self, columns):
+        """Rewrites the journal as one record per edited parameter
+
+        Keyword arguments:
+        columns (dict)--  current values of the parameters in touched; those missing
+                          are left out
+
+        Returns:
+        None
+
+        The snapshot is written to a temporary file which then replaces the journal,
+        so a crash leaves either the old or the new journal.
+        """
+        dirName, baseName = os.path.split(os.path.abspath(self.path))
+        fd, tmpName = tempfile.mkstemp(prefix='.' + baseName + '.', suffix='.tmp',
+                                       dir=dirName)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_MAGIC + self.digest)
+                size = _HEADER
+                for key in sorted(key for key in self.touched if key in columns):
+                    record = _frame(_payload(key, None, columns[key]))
+                    f.write(record)
+                    size += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+            _replace(tmpName, self.path)
+        except BaseException:
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
+            raise
+        self._file = open(self.path, 'ab')
+        self.size = size
+        self._pending = False
+        self._lastSync = time.time()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.touched.clear()
+        self.size = 0
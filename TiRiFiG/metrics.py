@@ -0,0 +1,230 @@
+# -*- coding: UTF-8 -*-
+"""Timing instrumentation of the GUI.
+
+The graph widgets and the main window time how long drawing, handling mouse events
+and loading or saving .def files takes, per parameter where it applies, and count full
+redraws against partial ones (blits). Times go into fixed histograms, so recording
+costs a few microseconds and the memory used doesn't grow over a long session. The
+figures can be viewed while TiRiFiG runs and written to the log as JSON, e.g.
+
+    from TiRiFiG.metrics import METRICS
+    with METRICS.timed('draw', 'VROT'):
+        canvas.draw()
+    METRICS.dump(logging.getLogger('TiRiFiG'))
+
+Nothing here imports Qt or matplotlib.
+
+variables:
+    BUCKETS:     upper bounds in milliseconds of the histogram buckets.
+    METRICS:     the Metrics instance the GUI records to.
+
+functions:
+    clock:       the clock times are taken with, in seconds.
+    timed_method: decorator timing a method per panel.
+
+classes:
+    Histogram:   counts of times in BUCKETS with their total, minimum and maximum.
+    Metrics:     histograms of named timers and counters, per panel.
+"""
+
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# roughly doubling from half a millisecond; the last bucket holds everything slower
+BUCKETS = (0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1000, 2000, float('inf'))
+
+
+class Histogram(object):
+    """Counts of times in BUCKETS with their total, minimum and maximum
+
+    Instance variables:
+        counts   (list):   number of times in each bucket of BUCKETS.
+        count    (int):    number of times added.
+        total    (float):  sum of the times added in milliseconds.
+        min      (float):  shortest time added in milliseconds.
+        max      (float):  longest time added in milliseconds.
+
+    Functions:
+        add:           adds a time.
+        percentile:    upper bound of the bucket a percentile falls in.
+        as_dict:       the histogram as plain types for JSON.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, ms):
+        """Adds a time given in milliseconds"""
+        idx = 0
+        while ms > BUCKETS[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, q):
+        """Returns the upper bound of the bucket the q-th percentile falls in
+
+        Keyword arguments:
+        q (float)--  percentile between 0 and 100
+
+        Returns:
+        float
+        Milliseconds, capped at the longest time added; None if nothing was added
+        """
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean_ms': self.mean,
+                'min_ms': self.min,
+                'max_ms': self.max,
+                'p50_ms': self.percentile(50),
+                'p95_ms': self.percentile(95),
+                'buckets_ms': [[bound if bound != float('inf') else None, count]
+                               for bound, count in zip(BUCKETS, self.counts) if count]}
+
+
+class Metrics(object):
+    """Histograms of named timers and counters, per panel
+
+    A panel is the parameter a graph widget plots, e.g. VROT; timings which don't
+    belong to a panel, such as loading a .def file, are kept under None.
+
+    Instance variables:
+        enabled   (bool):        whether anything is recorded.
+        timers    (dictionary):  Histogram of each (panel, name).
+        counters  (dictionary):  count of each (panel, name).
+        started   (float):       wall-clock time recording started or was reset.
+
+    Functions:
+        timed:         context manager timing its block.
+        add:           records a time given in seconds.
+        count:         increments a counter.
+        snapshot:      all timers and counters as plain types for JSON.
+        dump:          writes the snapshot to a logger as JSON.
+        reset:         forgets everything recorded.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.started = time.time()
+
+    @contextmanager
+    def timed(self, name, panel=None):
+        """Times the block of a with statement as timer name of panel"""
+        if not self.enabled:
+            yield
+            return
+        start = clock()
+        try:
+            yield
+        finally:
+            self.add(name, clock() - start, panel)
+
+    def add(self, name, seconds, panel=None):
+        if not self.enabled:
+            return
+        key = (panel, name)
+        hist = self.timers.get(key)
+        if hist is None:
+            hist = self.timers[key] = Histogram()
+        hist.add(seconds * 1000.0)
+
+    def count(self, name, panel=None, n=1):
+        if not self.enabled:
+            return
+        key = (panel, name)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def snapshot(self):
+        """Returns all timers and counters as plain types for JSON
+
+        Returns:
+        dict
+        {'seconds': time recorded, 'panels': {panel: {'timers': {name: histogram},
+        'counters': {name: count}}}} where timings of no panel are under '*'
+        """
+        panels = {}
+        for (panel, name), hist in self.timers.items():
+            entry = panels.setdefault('*' if panel is None else panel,
+                                      {'timers': {}, 'counters': {}})
+            entry['timers'][name] = hist.as_dict()
+        for (panel, name), count in self.counters.items():
+            entry = panels.setdefault('*' if panel is None else panel,
+                                      {'timers': {}, 'counters': {}})
+            entry['counters'][name] = count
+        return {'seconds': time.time() - self.started, 'panels': panels}
+
+    def dump(self, logger, level=logging.WARNING):
+        """Writes the snapshot to logger as one line of JSON
+
+        Keyword arguments:
+        logger (Logger)--  logger to write to e.g. the one set up by logWarnings
+        level (int)--      logging level (WARNING by default, which the log file of
+                           TiRiFiG records)
+
+        Returns:
+        str
+        The JSON written
+        """
+        text = json.dumps(self.snapshot(), sort_keys=True)
+        logger.log(level, "metrics %s", text)
+        return text
+
+
+METRICS = Metrics()
+
+
+def timed_method(name, panelAttr='par'):
+    """Decorator timing every call of a method as timer name in METRICS
+
+    Keyword arguments:
+    name (str)--       name of the timer e.g. 'firstPlot'
+    panelAttr (str)--  attribute of the instance naming its panel (None: the timer
+                       belongs to no panel)
+
+    Returns:
+    function
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not METRICS.enabled:
+                return method(self, *args, **kwargs)
+            start = clock()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                METRICS.add(name, clock() - start,
+                            getattr(self, panelAttr, None) if panelAttr else None)
+        return wrapper
+    return decorator
@@ -20,30 +20,193 @@ variables:
 functions:
     main  : gets the whole thing started
     _center: centering application windows
+    decimate: indices of the lowest and highest point of a line in each pixel column
+    readDef: reads and parses a .def file as an IOJob.
+    writeDef: saves a snapshot of a DefFile as an IOJob.
 
 classes:
-    Timer:
+    ParseWorker:
+        Class variables:
+            parsed     (pyqtSignal):       emitted with the path and the result of a
+                                           parse.
+            failed     (pyqtSignal):       emitted with the path and the error when a
+                                           file can't be read or parsed.
+
+        Instance variables:  none
+
+        Functions:
+            parse:                         reads a .def file and parses it against the
+                                           table of its previous version.
+
+    FileWatcher:
+        Class variables:
+            changed    (pyqtSignal):       emitted in the GUI thread with the path and
+                                           the result of each parse.
+            failed     (pyqtSignal):       emitted in the GUI thread with the path and
+                                           the error when a parse fails.
+            debounceMs (int):              quiet milliseconds that must follow a burst
+                                           of writes before the file is parsed.
+
+        Instance variables:
+            snapshot   (function):         returns the table the file is parsed against
+                                           and the parameters kept without NUR values.
+            fileName   (string):           path of the file watched (None if none is).
+            notified   (float):            time of the first notification not parsed
+                                           yet (None if there's none).
+            busy       (bool):             whether a parse is running.
+            pending    (bool):             whether the file changed during the parse.
+            watcher    (QFileSystemWatcher): watches the file and its directory.
+            timer      (QTimer):           debounces the notifications of watcher.
+            thread     (QThread):          thread the worker parses on, running while
+                                           a file is watched.
+            worker     (ParseWorker):      parses the file on thread.
+
+        Functions:
+            __init__:                      initialises my instance variables.
+            watch:                         starts thread and watching a file.
+            unwatch:                       stops watching the file and ends thread.
+            touched:                       restarts the debounce timer when the file or
+                                           its directory is written to.
+            parse:                         hands the file to worker to parse.
+            done:                          passes on the result of a parse and starts
+                                           another if the file changed meanwhile.
+            error:                         passes on the error of a parse.
+
+    JobCancelled:                          raised by IOJob.progress once the job
+                                           was cancelled.
+
+    IOSignals:
+        Class variables:
+            progress   (pyqtSignal):       emitted with the permille of the job done.
+            finished   (pyqtSignal):       emitted with the result of the job.
+            failed     (pyqtSignal):       emitted with the exception the job raised.
+            cancelled  (pyqtSignal):       emitted when the job stopped because it was
+                                           cancelled.
+
+    IOJob:
+        Class variables:  none
+
+        Instance variables:
+            func       (function):         function run on a thread of the pool with
+                                           the job and args.
+            args       (tuple):            further arguments of func.
+            signals    (IOSignals):        signals delivered to the GUI thread.
+            cancelled  (bool):             whether cancel was called.
+            seconds    (float):            time func took (None until it returned).
+
+        Functions:
+            __init__:                      initialises my instance variables.
+            cancel:                        asks the job to stop.
+            progress:                      reports how much of the job is done.
+            run:                           runs func and emits its outcome.
+
+    FitProcess:
+        Class variables:
+            loop       (pyqtSignal):       emitted with the number of the loop TiRiFiC
+                                           has started.
+            finished   (pyqtSignal):       emitted with the last message TiRiFiC
+                                           logged when it ends.
+            failed     (pyqtSignal):       emitted with the error when TiRiFiC can't
+                                           be started.
+            pollMs     (int):              milliseconds between looks at the progress
+                                           log.
+
+        Instance variables:
+            process    (QProcess):         TiRiFiC.
+            timer      (QTimer):           times the looks at the progress log.
+            logPath    (string):           path of the progress log.
+            offset     (int):              bytes of the progress log read so far.
+            loopNo     (int):              number of the loop TiRiFiC is in.
+            message    (string):           last message TiRiFiC logged.
+
+        Functions:
+            __init__:                      initialises my instance variables.
+            start:                         starts TiRiFiC on a .def file.
+            running:                       whether TiRiFiC is running.
+            kill:                          stops TiRiFiC.
+            stop:                          stops TiRiFiC and waits for it to end.
+            tail:                          reads what was added to the progress log.
+            parseLine:                     takes the loop or message from a line of
+                                           the progress log.
+            ended:                         reads the rest of the log and emits
+                                           finished.
+            error:                         emits failed if TiRiFiC couldn't start.
+
+    FrameScheduler:
+        Class variables:  none
+
+        Instance variables:
+            func       (function):         function to be run.
+            maxFps     (float):            maximum number of runs per second.
+            lastRun    (float):            time the function was last run.
+            timer      (QTimer):           single shot timer of the pending run.
+
+        Functions:
+            __init__:                      initialises my instance variables.
+            request:                       asks for the function to be run; requests
+                                           made before it runs are coalesced.
+            run:                           runs the function now.
+            flush:                         runs the function now if a run is pending.
+
+    RepaintScheduler:
         Class variables:  none
 
         Instance variables:
-            t          (int):              the time(ms) when thread begins.
-            hFunction  (function):         function to be executed by thread.
-            thread     (function):         initialises and start the thread.
+            dirty      (list):             graph widgets waiting to be redrawn.
+            scheduler  (FrameScheduler):   runs the pending redraws on the next tick.
 
         Functions:
             __init__:                      initialises my instance variables.
-            handle_function:               calls the function which the thread is run on.
-            start:                         starts the thread.
-            cancel:                        stops the thread.
+            invalidate:                    marks a graph widget to be redrawn.
+            run:                           redraws all marked graph widgets, each
+                                           canvas once.
+
+    RingLocator:
+        Class variables:
+            minSpacing     (int):          fewest pixels between ticks at ring radii.
+
+        Instance variables:
+            radii          (array):        values of RADI in increasing order.
+            fallback       (AutoLocator):  locator used when the rings are too close
+                                           together for a tick each.
+
+        Functions:
+            __init__:                      initialises instance variables.
+            set_axis:                      sets the axis of both locators.
+            tick_values:                   returns the ring radii in view or round
+                                           numbers.
+
+    ParameterModel:
+        Class variables:  none
+
+        Instance variables:               the data variables of GraphWidget (xScale,
+                                           yScale, unitMeas, par, parVals, parValRADI,
+                                           history, key, numPrecisionX,
+                                           numPrecisionY).
+
+        Functions:
+            __init__:                      initialises instance variables.
+            firstPlot:                     does nothing as there's nothing to plot on.
+            invalidate:                    does nothing as there's nothing to redraw.
+            widget:                        creates the GraphWidget of the parameter.
 
     GraphWidget:
         Class variables:
-            redo           (list):         the state of some parameters before undo
-                                           action.
             mPress         (list):         x-y values of mouse click.
             mRelease       (list):         x-y values of mouse release.
             mMotion        (list):         x-y values of mouse motion.
             mDblPress      (list):         x-y values of mouse double click.
+            canvasPool     (CanvasPool):   pool the widget takes its own canvas from
+                                           while it's on screen (None: the widget
+                                           makes its own canvas when shown).
+            repaintScheduler (RepaintScheduler): batches the redraws asked for by
+                                           invalidate (None: redraw straight away).
+            maxFps         (int):          maximum number of redraws per second while
+                                           a point is dragged.
+            pickRadius     (int):          how far in pixels the mouse may be from a
+                                           node to pick it.
+            nodeSpacing    (int):          fewest pixels between rings for their nodes
+                                           to be drawn.
 
         Instance variables:
             xScale         (list):         upper and lower limit of x-axis.
@@ -53,8 +216,9 @@ classes:
             parVals        (list):         the values of  variable par (y-values on
                                            graph).
             parValRADI     (list):         the values of RADI (x-values on graph).
-            historyList    (list):         the values of parVals for each time a point is
-                                           shifted.
+            history        (HistoryTree):  undo tree of the values of all parameters,
+                                           shared with the main window; edits of
+                                           parVals are recorded in it.
             key            (bool):         determines whether or not undo/redo key
                                            combination is pressed.
             numPrecisionX  (int):          the precision point to which a x-values are
@@ -62,6 +226,31 @@ classes:
             numPrecisionY  (int):          the precision point to which a y-values are
                                            saved in.
             canvas         (FigureCanvas): figure canvas where the subplots are made.
+            figure         (Figure):       figure of the axes the parameter is plotted on
+                                           (None until the widget is first shown).
+            ax             (Axes):         axes the parameter is plotted on.
+            ownCanvas      (FigureCanvas): canvas of the widget itself, taken from
+                                           canvasPool while the widget is on screen.
+            cids           (list):         ids of the canvas events connected to the
+                                           widget.
+            pressed        (bool):         whether the left mouse button was pressed on
+                                           the axes of the widget.
+            dragIndex      (int):          ring of the node picked on press (None if no
+                                           node was under the mouse).
+            radiIndex      (tuple):        parValRADI with its values sorted and the
+                                           ring of each sorted value.
+            showXAxis      (bool):         whether the x-axis label and tick labels are
+                                           shown.
+            line           (Line2D):       the plotted line of parVals against parValRADI;
+                                           created once per axes and updated in place.
+            labels         (tuple):        parameter and unit the axis labels show.
+            ticks          (list):         parValRADI the tick locator was made for.
+            background     (object):       copy of the axes without the line, cached
+                                           while a point is dragged (None otherwise).
+            renderScheduler (FrameScheduler): coalesces motion events into at most one
+                                           redraw per frame.
+            inputTime      (float):        time of the first motion event not yet drawn,
+                                           for the input-to-pixel latency in METRICS.
             btnAddParam    (QPushButton):  add a new plotted parameter to viewgraph.
             btnEditParam   (QPushButton):  change the parameter plotted to another
                                            parameter.
@@ -72,6 +261,20 @@ classes:
             changeGlobal:                  change the value of the global parameter
                                            (currPar) to reflect the parameter graphWidget
                                            is plotting.
+            showEvent:                     lets canvasPool know the widget may be on
+                                           screen.
+            hideEvent:                     lets canvasPool know the widget is off screen.
+            moveEvent:                     lets canvasPool know the widget moved.
+            resizeEvent:                   lets canvasPool know the widget was resized.
+            useOwnCanvas:                  plots on the widget's own canvas.
+            releaseOwnCanvas:              gives the widget's own canvas back to
+                                           canvasPool.
+            attach:                        plots on the given axes of a canvas e.g. a
+                                           subplot of SharedFigure.
+            detach:                        removes the plot from the canvas.
+            sortedRadii:                   returns the sorted radii and their rings.
+            nodeAt:                        finds the ring whose node is under the
+                                           mouse by binary search.
             getClick:                      assigns x-y value captured from mouse
                                            left-click to mPress list or x-y value of.
                                            captured double click to mDblPress.
@@ -79,16 +282,57 @@ classes:
                                            to mRelease list.
             getMotion:                     assigns x-y value captured from mouse motion
                                            to mMotion list.
-            undoKey:                       sends the viewgraph back in history .
-            redoKey:                       sends the viewgraph forward in history after
-                                           an undo action.
-            showInformation:               display information to say history list is
-                                           exhausted when too many undo/redo actions are
-                                           performed.
             firstPlot:                     produces plot of tilted-ring parameter(s) in
                                            viewgraph after .def file is opened.
+            invalidate:                    asks for the plot to be made again with the
+                                           current data and scales.
+            updateAxes:                    sets the limits, and the labels and ticks if
+                                           they changed.
+            updateLine:                    gives the line new y-values, decimated to
+                                           the resolution of the screen.
+            onResize:                      decimates the line again for the new size.
             plotFunc:                      produces plot of tilted-ring parameter(s) in
                                            viewgraph when interacting with data points.
+            onDraw:                        caches the background and draws the line on
+                                           top of it after a full redraw during a drag.
+            blitLine:                      redraws only the line over the cached
+                                           background.
+            drawCanvas:                    draws the whole canvas now.
+            endDrag:                       leaves drag mode with a full redraw.
+
+    CanvasPool:
+        Class Variables:  none
+
+        Instance Variables:
+            scrollArea     (QScrollArea):  scroll area holding the graph widgets.
+            maxFree        (int):          number of unused canvases kept for reuse.
+            free           (list):         unused canvases.
+            scheduler      (FrameScheduler): coalesces requests to update the viewport.
+
+        Functions:
+            __init__:                      initialises instance variables.
+            request:                       asks for the canvases to be handed out
+                                           again e.g. after scrolling.
+            acquire:                       returns an unused canvas.
+            release:                       takes back a canvas which is no longer used.
+            updateViewport:                gives canvases to the graph widgets in or
+                                           near the viewport and takes them from the
+                                           others.
+
+    SharedFigure:
+        Class Variables:  none
+
+        Instance Variables:
+            figure         (Figure):       the figure holding all subplots.
+            canvas         (FigureCanvas): canvas of figure.
+            gwObjects      (list):         graph widgets plotted on the subplots.
+
+        Functions:
+            __init__:                      initialises instance variables.
+            setPanels:                     plots graph widgets on subplots sharing the
+                                           x-axis.
+            onDraw:                        counts a full redraw of the canvas.
+            clear:                         removes all subplots.
 
     SMWindow:
         Class Variables:  none
@@ -138,6 +382,24 @@ classes:
         Functions:
             __init__:                      initialises instance variables
 
+    MetricsWindow:
+        Class Variables:
+            columns        (tuple):        headers of the table.
+
+        Instance Variables:
+            table          (QTableWidget): a row per timer or counter of each panel.
+            timer          (QTimer):       refreshes the table every second while the
+                                           window is shown.
+            btnReset       (QPushButton):  forgets everything recorded so far.
+            btnLog         (QPushButton):  writes the figures to the log as JSON.
+            btnClose       (QPushButton):  close window.
+
+        Functions:
+            __init__:                      initialises instance variables.
+            refresh:                       shows the current figures of METRICS.
+            reset:                         forgets everything recorded so far.
+            logMetrics:                    writes the figures to the log as JSON.
+
     MainWindow:
         Class Variables:
             key             (string):      determines whether or not undo/redo key has
@@ -154,21 +416,31 @@ classes:
             tmpDeffile      (string):      path to temp file which is used to sync entry
                                            of data in text editor to viewgraph.
             gwObjects       (list):        list of graph widget objects each representing
-                                           a tilted-ring parameter.
-            t               (int):         thread which runs a separate process
-                                           (open a text editor).
+                                           a tilted-ring parameter; parameters which
+                                           haven't been displayed yet are held by a
+                                           ParameterModel instead.
             scrollWidth     (int):         width of the scroll area.
             scrollHeight    (int):         height of the scroll area.
-            before          (int):         time in milliseconds.
             numPrecisionY   (int):         precision in terms of number of decimal points
                                            to which values of parameter are handled.
             numPrecisionX   (int):         precision in terms of number of decimal points
                                            to which values of RADI are handled.
             NUR             (int):         number of rings as indicated in .def file.
             data            (list):        stream of text from .def file.
+            defFile         (DefFile):     the .def file with its parsed parameters.
+            defCache        (DefCache):    parsed .def files kept for reopening them.
+            historyMaxBytes (int):         memory budget of the undo tree.
+            editHistory     (HistoryTree): undo tree of the edits of all parameters,
+                                           including those of RADI made in a text
+                                           editor.
+            editJournal     (Journal):     journal of the edits made since the .def
+                                           file was last saved.
+            journalSyncInterval (float):   most seconds a journalled edit may wait to
+                                           be synced to disk (0: every edit is synced
+                                           straight away).
+            progressDelayMs (int):         milliseconds a load or save runs before its
+                                           progress is shown.
             parVals         (dictionary):  values of tilted-ring parameters.
-            historyList     (dictionary):  values of tilted-ring parameters which have
-                                           their values changed.
             xScale          (list):        upper and lower limit values of RADI axis
             yScale          (dictionary):  upper and lower limit values of parameter axis
             mPress          (list):        mouse x,y values when left mouse button is
@@ -176,6 +448,8 @@ classes:
             mRelease        (list):        mouse x,y values when the left mouse button
                                            is released.
             mMotion         (list):        mouse x,y values when mouse is moved.
+            sharedFigureMode (bool):       whether the displayed parameters are plotted
+                                           as subplots of one figure.
 
         Instance Variables:
             cWidget        (QWidget):      central widget (main window).
@@ -183,6 +457,28 @@ classes:
                                            the parameter file.
             scrollArea     (QScrollArea):  scroll area where graph widgets will be
                                            populated.
+            sharedScrollArea (QScrollArea): scroll area holding sharedFigure.
+            canvasPool     (CanvasPool):   canvases of the graph widgets on screen in
+                                           scrollArea.
+            repaintScheduler (RepaintScheduler): redraws the graph widgets whose plots
+                                           changed, once each, on the next tick.
+            sharedFigure   (SharedFigure): figure with the displayed parameters as
+                                           subplots sharing the x-axis.
+            journalTimer   (QTimer):       syncs the journal to disk, and compacts it
+                                           when it has grown too large, every
+                                           journalSyncInterval seconds.
+            fileWatcher    (FileWatcher):  parses tmpDeffile on a worker thread when
+                                           it's edited in a text editor.
+            ioPool         (QThreadPool):  runs the jobs loading and saving .def files,
+                                           one at a time in the order started.
+            ioJobs         (list):         jobs started on ioPool and not ended yet.
+            ioProgress     (QProgressBar): shows in the status bar how far the jobs
+                                           have got once they take long.
+            ioCancel       (QPushButton):  cancels the jobs on ioPool.
+            fitProcess     (FitProcess):   runs TiRiFiC and follows its progress.
+            fitProgress    (QProgressDialog): shows how far TiRiFiC has got, without
+                                           blocking the window (None until TiRiFiC is
+                                           first started).
             mainMenu       (QMenu):        Menu bar with file menu, preference menu and
                                            run menu with each menu having different
                                            actions.
@@ -194,37 +490,80 @@ classes:
                                            menus with their actions.
             quitApp:                       closes TiRiFiG.
             cleaunUp:                      initialises class variables.
-            getData:                       opens .def file and gets data from the file.
-            strType:                       determines the data type of a variable.
-            numPrecision:                  determines the floating point precision
-                                           currently in .def file and sets it.
+            getData:                       asks for a .def file and starts loading it
+                                           in the background.
             getParameter:                  fetches the data points for the various
-                                           tilted-ring parameters.
-            openDef:                       calls getData and getParameter and creates the
-                                           graph widgets for the default parameters
-                                           (VROT, SBR, PA, INCL).
-            undoCommand:                   undo last action for the current parameter in
-                                           focus.
-            redoCommand:                   redo last action for the current parameter in
-                                           focus.
+                                           tilted-ring parameters with the .def parser.
+            applyTable:                    copies values of parameters from a parsed
+                                           .def file into parVals.
+            openDef:                       calls getData.
+            defLoaded:                     calls getParameter once the file is loaded
+                                           and creates the graph widgets for the
+                                           default parameters (VROT, SBR, PA, INCL).
+            runJob:                        starts a load or save on ioPool.
+            jobEnded:                      forgets a job which ended.
+            jobFailed:                     tells the user a job failed.
+            jobProgress:                   shows how far the jobs have got.
+            showJobProgress:               shows ioProgress if jobs are still running.
+            cancelJobs:                    cancels the jobs on ioPool.
+            createGraphWidget:             creates the graph widget of a parameter from
+                                           its ParameterModel.
+            graphWidget:                   returns the graph widget of a parameter,
+                                           creating it on first use.
+            recoverJournal:                offers to replay the edits journalled but not
+                                           saved in a previous session.
+            startJournal:                  starts the journal of the edits of the .def
+                                           file.
+            logEdit:                       appends an edit to the journal.
+            syncJournal:                   syncs the journal to disk and compacts it
+                                           when it has grown too large.
+            updateXScale:                  sets xScale from the values of RADI.
+            undoCommand:                   undo last edit, whichever parameter it
+                                           changed.
+            redoCommand:                   redo the edit last undone, following the
+                                           branch visited last.
+            switchBranch:                  goes to the tip of another branch of the
+                                           undo tree.
+            historyTargets:                returns the lists of values the undo tree
+                                           changes in place.
+            historyChanged:                brings the graph widgets up to date after
+                                           moving in the undo tree.
             setRowCol:                     specify the number of rows and columns in the
                                            grid layout.
-            saveFile:                      save changes to file for one parameter.
-            saveAll:                       calls saveFile function to save changes to
+            layoutGraphWidgets:            places the graph widgets of the displayed
+                                           parameters on the grid.
+            setSharedFigure:               switches between one figure per parameter and
+                                           one figure for all displayed parameters.
+            refreshSharedFigure:           plots the displayed parameters on sharedFigure.
+            saveDef:                       save changes for all parameters to a .def
+                                           file in one atomic write, in the
+                                           background.
+            defSaved:                      takes over the result of a save.
+            saveAll:                       calls saveDef function to save changes to
                                            file for all parameters.
             saveMessage:                   display information that save was successful.
-            saveAs:                        save changes to a new file for one parameter.
             saveAsMessage:                 display information that save as was
                                            successful.
-            saveAsAll:                     calls saveAs function to save changes for all
+            saveAsAll:                     calls saveDef function to save changes for all
                                            parameters to a new file.
+            runTiriFiC:                    runs TiRiFiC once the .def file is saved.
+            fitProgressed:                 shows the loop TiRiFiC is in.
+            fitFinished:                   tells the user TiRiFiC has ended.
+            fitFailed:                     tells the user TiRiFiC couldn't be started.
+            closeFitProgress:              closes fitProgress.
             slotChangeData:                change current viewgraph after making changes
                                            to .def file in text editor.
-            animate:                       synchronise actions in text file to viewgraph
-                                           with calls to slotChangeData function.
+            watchSnapshot:                 returns what fileWatcher parses the file
+                                           against.
+            fileChanged:                   shows the edits fileWatcher parsed.
+            watchFailed:                   logs why fileWatcher couldn't parse the file.
             openEditor:                    open preferred text editor.
+            startEditor:                   starts the text editor once the file to be
+                                           edited is saved.
             SMobj:                         instantiates the scale manager window and pops
                                            it.
+            metricsObj:                    instantiates the window showing draw times
+                                           and latencies and pops it.
             updateScale:                   updates the values in graph widget from what
                                            was entered in the scale manager window.
             updateMessage:                 displays information to say update was
@@ -240,39 +579,29 @@ classes:
                                            the specified parameter.
             tirificMessage:                displays information about input data cube not
                                            available in current working directory.
-            startTiriFiC:                  starts TiRiFiC from terminal.
+            startTiriFiC:                  saves the .def file and starts TiRiFiC on
+                                           it.
 """
 
 # libraries
-import os, sys, threading, time, logging
+import os, sys, time, logging, functools
 from subprocess import Popen as run
 from math import ceil
-from decimal import Decimal
 import numpy as np
 import matplotlib
 matplotlib.use("qt4Agg")
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 # from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
-import matplotlib.pyplot as plt
-from matplotlib import style
+from matplotlib.figure import Figure
+from matplotlib import style, ticker
 style.use("seaborn")
 from PyQt4 import QtGui, QtCore
+from TiRiFiG.core import defcache, deffile, defparser, defwriter, history, journal
+from TiRiFiG.metrics import METRICS, clock, timed_method
 
 currPar = None
 selected_option = None
-fit_par = {'VROT':'km s-1',
-           'SBR':'Jy km s-1 arcsec-2',
-           'INCL':'degrees',
-           'PA':'degrees',
-           'RADI':'arcsec', 
-           'Z0':'arcsec',
-           'SDIS':'km s-1',
-           'XPOS':'degrees',
-           'YPOS':'degrees',
-           'VSYS':'km s-1',
-           'DVRO':'km s-1 arcsec-1',
-           'DVRA':'km s-1 arcsec-1',
-           'VRAD':'km s-1'}
+fit_par = dict(deffile.UNITS)
 
 def _center(self):
     """Centers the window
@@ -292,33 +621,521 @@ def _center(self):
     qr.moveCenter(cp)
     self.move(qr.topLeft())
 
-class TimerThread():
-    def __init__(self, t, hFunction):
-        self.t = t
-        self.hFunction = hFunction
-        self.thread = threading.Timer(self.t, self.handle_function)
+class ParseWorker(QtCore.QObject):
+    """Reads and parses a .def file on the thread it was moved to
 
-    def handle_function(self):
-        self.hFunction()
-        self.thread = threading.Timer(self.t, self.handle_function)
-        self.thread.start()
+    The result is (lines, previous, table, changed) with table and changed as
+    returned by defparser.reparse for the lines of the file against previous.
+    """
+    parsed = QtCore.pyqtSignal(str, object)
+    failed = QtCore.pyqtSignal(str, str)
 
-    def start(self):
+    def parse(self, fileName, request):
+        previous, known = request
+        try:
+            with open(fileName) as f:
+                lines = f.readlines()
+            table, changed = defparser.reparse(previous, lines, known)
+        except Exception as e:
+            # a file caught half written by an editor mustn't end the thread
+            self.failed.emit(fileName, str(e))
+            return
+        self.parsed.emit(fileName, (lines, previous, table, changed))
+
+class FileWatcher(QtCore.QObject):
+    """Parses a .def file on a worker thread whenever it's written to
+
+    The operating system tells the watcher when the file changes, so nothing is
+    polled. Editors write a file in several steps, often by writing a new file and
+    renaming it over the old one, so the directory is watched as well and a parse
+    only starts once debounceMs have passed without another notification. The file
+    is read and parsed on thread, against a copy of the table given by snapshot,
+    and the result is delivered to the GUI thread with the changed signal. A change
+    during a parse is parsed once that one is done.
+    """
+    changed = QtCore.pyqtSignal(str, object)
+    failed = QtCore.pyqtSignal(str, str)
+    _request = QtCore.pyqtSignal(str, object)
+    debounceMs = 15
+
+    def __init__(self, snapshot, parent=None):
+        super(FileWatcher, self).__init__(parent)
+        self.snapshot = snapshot
+        self.fileName = None
+        self.notified = None
+        self.busy = False
+        self.pending = False
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.touched)
+        self.watcher.directoryChanged.connect(self.touched)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.parse)
+        self.thread = QtCore.QThread(self)
+        self.worker = ParseWorker()
+        self.worker.moveToThread(self.thread)
+        # the worker lives on thread, so these are queued connections
+        self._request.connect(self.worker.parse)
+        self.worker.parsed.connect(self.done)
+        self.worker.failed.connect(self.error)
+
+    def watch(self, fileName):
+        self.unwatch()
         self.thread.start()
+        self.fileName = fileName
+        self.watcher.addPath(fileName)
+        self.watcher.addPath(os.path.dirname(os.path.abspath(fileName)))
+
+    def unwatch(self):
+        self.timer.stop()
+        paths = list(self.watcher.files()) + list(self.watcher.directories())
+        if paths:
+            self.watcher.removePaths(paths)
+        self.fileName = None
+        self.notified = None
+        self.busy = self.pending = False
+        # a thread still running when the application is destroyed aborts it
+        if self.thread.isRunning():
+            self.thread.quit()
+            self.thread.wait()
+
+    def touched(self, path):
+        if self.fileName is None:
+            return
+        # a file renamed over the one watched isn't watched itself
+        if (self.fileName not in self.watcher.files() and
+                os.path.exists(self.fileName)):
+            self.watcher.addPath(self.fileName)
+        if self.notified is None:
+            self.notified = clock()
+        self.timer.start(self.debounceMs)
+
+    def parse(self):
+        if self.fileName is None or not os.path.isfile(self.fileName):
+            return
+        if self.busy:
+            self.pending = True
+            return
+        table, known = self.snapshot()
+        if table is None:
+            return
+        self.busy = True
+        self._request.emit(self.fileName, (table.copy(), list(known)))
+
+    def done(self, fileName, result):
+        self.busy = False
+        if fileName == self.fileName:
+            notified, self.notified = self.notified, None
+            self.changed.emit(fileName, result + (notified,))
+        if self.pending:
+            self.pending = False
+            self.parse()
+
+    def error(self, fileName, message):
+        self.busy = False
+        self.notified = None
+        self.failed.emit(fileName, message)
+        if self.pending:
+            self.pending = False
+            self.parse()
+
+class JobCancelled(Exception):
+    pass
+
+class IOSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+
+class IOJob(QtCore.QRunnable):
+    """A load or save run on a thread pool, which can be cancelled
+
+    func is called with the job followed by args and may call job.progress with the
+    amount done, which raises JobCancelled once the job has been cancelled, so the
+    job stops at the next call. The signals are made in the GUI thread, so whatever
+    they're connected to there gets the outcome of the job through the event loop.
+    """
+
+    def __init__(self, func, *args):
+        super(IOJob, self).__init__()
+        # the job is kept by whoever started it, not deleted by the pool
+        self.setAutoDelete(False)
+        self.func = func
+        self.args = args
+        self.signals = IOSignals()
+        self.cancelled = False
+        self.seconds = None
+        self._permille = -1
 
     def cancel(self):
-        self.thread.cancel()
+        self.cancelled = True
+
+    def progress(self, done, total):
+        if self.cancelled:
+            raise JobCancelled()
+        permille = int(1000 * done / total) if total else 1000
+        # one signal per permille at most, whatever the size of the blocks
+        if permille != self._permille:
+            self._permille = permille
+            self.signals.progress.emit(permille)
+
+    def run(self):
+        start = clock()
+        try:
+            result = self.func(self, *self.args)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.seconds = clock() - start
+            self.signals.finished.emit(result)
+
+def readDef(job, fileName, cache, known):
+    """Reads and parses a .def file as an IOJob
+
+    Keyword arguments:
+    job (IOJob)--        the job, told how much of the file has been read
+    fileName (str)--     path to the .def file
+    cache (DefCache)--   cache the table is taken from or kept in
+    known--              tilted-ring parameters kept even if they don't have NUR
+                         values
+
+    Returns:
+    tuple
+    (lines, table) with the text of each line and the parsed RingTable
+    """
+    total = os.path.getsize(fileName)
+    blocks = []
+    done = 0
+    with open(fileName) as f:
+        while True:
+            block = f.read(defwriter.BLOCK_SIZE)
+            if not block:
+                break
+            blocks.append(block)
+            done += len(block)
+            job.progress(min(done, total), total)
+    # the lines as readlines would give them
+    lines = ''.join(blocks).split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    job.progress(total, total)
+    return lines, cache.parse(fileName, lines, known)
+
+def writeDef(job, defFile, values, fileName, replacements):
+    """Saves a snapshot of a DefFile as an IOJob
+
+    Keyword arguments:
+    job (IOJob)--           the job, told how much of the file has been written
+    defFile (DefFile)--     snapshot of the .def file
+    values (list)--         (parameter, values, precision, unit) of each parameter
+                            to be saved
+    fileName (str)--        path of the .def file to be written
+    replacements (dict)--   extra line substitutions e.g. defwriter.RUN_SETTINGS
+
+    Returns:
+    DefFile
+    defFile, after the save
+    """
+    for par, parVals, precision, unit in values:
+        defFile.set(par, parVals, precision=precision)
+        defFile.units[par] = unit
+    defFile.save(str(fileName), replacements, job.progress)
+    return defFile
+
+class FitProcess(QtCore.QObject):
+    """TiRiFiC fitting a .def file, followed through its progress log
+
+    TiRiFiC runs as a QProcess, so the event loop carries on while it fits. Every
+    pollMs the bytes TiRiFiC has added to its progress log are read, starting from
+    the offset reached by the last look, so a long fit costs a small read now and
+    then however long the log grows. A line cut short by the look is kept until the
+    rest of it is written.
+    """
+    loop = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str)
+    pollMs = 500
+
+    def __init__(self, parent=None):
+        super(FitProcess, self).__init__(parent)
+        self.process = QtCore.QProcess(self)
+        self.process.finished.connect(self.ended)
+        self.process.error.connect(self.error)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.tail)
+        self.logPath = None
+        self.offset = 0
+        self.loopNo = 0
+        self.message = "Stopped"
+        self._partial = b''
+
+    def start(self, fileName, logPath):
+        """Starts TiRiFiC on a .def file
+
+        Keyword arguments:
+        self--            the current instance of the FitProcess class
+        fileName (str)--  path of the .def file, saved with defwriter.RUN_SETTINGS
+        logPath (str)--   path of the progress log TiRiFiC writes
+
+        Returns:
+        None
+        """
+        # the log of an earlier fit would be taken for this one's
+        if os.path.exists(logPath):
+            os.remove(logPath)
+        self.logPath = logPath
+        self.offset = 0
+        self.loopNo = 0
+        self.message = "Stopped"
+        self._partial = b''
+        self.process.start("tirific", ["deffile=", str(fileName)])
+        self.timer.start(self.pollMs)
+
+    def running(self):
+        return self.process.state() != QtCore.QProcess.NotRunning
+
+    def kill(self):
+        if self.running():
+            self.process.kill()
+
+    def stop(self):
+        # a QProcess destroyed while running complains, so it's waited for
+        if self.running():
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+    def tail(self):
+        try:
+            with open(self.logPath, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    # the log was started afresh
+                    self.offset = 0
+                    self._partial = b''
+                f.seek(self.offset)
+                data = f.read()
+        except (IOError, OSError):
+            # not written yet
+            return
+        if not data:
+            return
+        self.offset += len(data)
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.parseLine(line.decode('ascii', 'replace'))
+
+    def parseLine(self, line):
+        """Takes the loop or the message from a line of the progress log
+
+        Keyword arguments:
+        self--        the current instance of the FitProcess class
+        line (str)--  the line, e.g. "L:2/3 ..." while fitting loop 2 of 3
+
+        Returns:
+        None
+        """
+        first = line.split(" ")[0]
+        if 'L:' in first.upper():
+            try:
+                loopNo = int(first.split(":")[1].split("/")[0])
+            except ValueError:
+                return
+            if loopNo > self.loopNo:
+                self.loopNo = loopNo
+                self.loop.emit(loopNo)
+        elif "finish" in first.lower():
+            self.message = line.strip()
+
+    def ended(self, *args):
+        self.timer.stop()
+        self.tail()
+        if self._partial:
+            self.parseLine(self._partial.decode('ascii', 'replace'))
+            self._partial = b''
+        self.finished.emit(self.message)
+
+    def error(self, error):
+        if error == QtCore.QProcess.FailedToStart:
+            self.timer.stop()
+            self.failed.emit(str(self.process.errorString()))
+
+class FrameScheduler(object):
+    """Runs a function at most maxFps times per second however often it's requested
+
+    Mouse motion events arrive faster than the canvas can be drawn. Each event only
+    records where the mouse is and requests a run; the requests pending when the
+    timer fires are served by a single run, which uses the latest position.
+    """
+
+    def __init__(self, func, maxFps=60, parent=None):
+        self.func = func
+        self.maxFps = maxFps
+        self.lastRun = 0.0
+        self.timer = QtCore.QTimer(parent)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.run)
+
+    def request(self):
+        if self.timer.isActive():
+            return
+        wait = self.lastRun + 1.0 / self.maxFps - time.time()
+        # a zero timeout still lets the motion events already queued come in first
+        self.timer.start(max(0, int(ceil(wait * 1000))))
+
+    def run(self):
+        self.timer.stop()
+        self.lastRun = time.time()
+        self.func()
+
+    def flush(self):
+        if self.timer.isActive():
+            self.run()
+
+class RepaintScheduler(object):
+    """Redraws the graph widgets whose plots changed, once each, on the next tick
+
+    Changing the scales or the layout touches every displayed parameter. Instead of
+    each graph widget drawing its canvas there and then, the widgets are marked dirty
+    and a single pass on the next tick of the event loop updates all their plots and
+    draws each canvas once, however many of its subplots changed.
+    """
+
+    def __init__(self, parent=None):
+        self.dirty = []
+        self.scheduler = FrameScheduler(self.run, parent=parent)
+
+    def invalidate(self, gwObject):
+        if not any(gwObject is other for other in self.dirty):
+            self.dirty.append(gwObject)
+        self.scheduler.request()
+
+    @timed_method('repaint', panelAttr=None)
+    def run(self):
+        dirty, self.dirty = self.dirty, []
+        canvases = []
+        for gwObject in dirty:
+            # widgets without a canvas are plotted when they get one
+            if gwObject.canvas is None:
+                continue
+            gwObject.firstPlot(draw=False)
+            if not any(gwObject.canvas is canvas for canvas in canvases):
+                canvases.append(gwObject.canvas)
+        for canvas in canvases:
+            # coalesces with the redraw the canvas may already have pending e.g. after
+            # it was resized by a new layout
+            canvas.draw_idle()
+
+def decimate(x, y, left, right, columns):
+    """Reduces a line to the lowest and highest point in each pixel column
+
+    Keyword arguments:
+    x --            x-values in increasing order
+    y --            y-values
+    left --         x-value of the left edge of the axes
+    right --        x-value of the right edge of the axes
+    columns (int)-- width of the axes in pixels
+
+    Returns:
+    array
+    Indices of the points to draw in increasing order: the first and last point and
+    the lowest and highest point in each column, so the drawn line covers the same
+    pixels as the full one
+    """
+    if right <= left or columns < 1:
+        return np.arange(x.size)
+    col = np.clip(((x - left) * (columns / (right - left))).astype(np.intp), -1, columns)
+    # x is sorted, so the points of each column are next to each other and sorting by
+    # column and then by y puts the lowest (highest) point of a column at its start (end)
+    byValue = np.lexsort((y, col))
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(col)) + 1])
+    ends = np.append(starts[1:], x.size) - 1
+    return np.unique(np.concatenate([byValue[starts], byValue[ends], [0, x.size - 1]]))
+
+class RingLocator(ticker.Locator):
+    """Puts the x-ticks at the ring radii while there's room for them
+
+    Once the rings in view are closer together than minSpacing pixels their labels
+    would overlap, and laying out a tick for each of thousands of rings takes longer
+    than drawing the rest of the figure, so the ticks fall back to round numbers.
+    """
+
+    minSpacing = 20
+
+    def __init__(self, radii):
+        self.radii = radii
+        self.fallback = ticker.AutoLocator()
+
+    def set_axis(self, axis):
+        super(RingLocator, self).set_axis(axis)
+        self.fallback.set_axis(axis)
+
+    def __call__(self):
+        vmin, vmax = self.axis.get_view_interval()
+        return self.tick_values(vmin, vmax)
+
+    def tick_values(self, vmin, vmax):
+        vmin, vmax = min(vmin, vmax), max(vmin, vmax)
+        lo = np.searchsorted(self.radii, vmin, side='left')
+        hi = np.searchsorted(self.radii, vmax, side='right')
+        width = self.axis.axes.bbox.width if self.axis is not None else 0.0
+        if (hi - lo) * self.minSpacing <= width:
+            return self.radii[lo:hi]
+        return self.fallback.tick_values(vmin, vmax)
+
+class ParameterModel(object):
+    """Ring data of a tilted-ring parameter which has no GraphWidget yet
+
+    A .def file can have many more parameters than are displayed. Those which aren't
+    are kept in this lightweight object, which has the same data variables as
+    GraphWidget so the main window can save, reload and rescale both alike; the
+    widget is only made once the parameter is displayed.
+    """
+
+    def __init__(self, xScale, yScale, unitMeas, par, parVals, parValRADI,
+                 history, key, numPrecisionX, numPrecisionY):
+        self.xScale = xScale
+        self.yScale = yScale
+        self.unitMeas = unitMeas
+        self.par = par
+        self.parVals = parVals
+        self.parValRADI = parValRADI
+        self.history = history
+        self.key = key
+        self.numPrecisionX = numPrecisionX
+        self.numPrecisionY = numPrecisionY
+
+    def firstPlot(self, draw=True):
+        self.key = "No"
+
+    def invalidate(self):
+        self.key = "No"
+
+    def widget(self):
+        """Creates the GraphWidget of the parameter from the data held here"""
+        return GraphWidget(self.xScale, self.yScale, self.unitMeas, self.par,
+                           self.parVals, self.parValRADI, self.history, self.key,
+                           self.numPrecisionX, self.numPrecisionY)
+
 
 class GraphWidget(QtGui.QWidget):
-    redo = []
     mPress = [None, None]
     mRelease = [None, None]
     mMotion = [None]
     mDblPress = [None, None]
     last_value = 0
+    maxFps = 60
+    pickRadius = 5
+    nodeSpacing = 4
+    canvasPool = None
+    repaintScheduler = None
 
     def __init__(self, xScale, yScale, unitMeas, par, parVals, parValRADI,
-                 historyList, key, numPrecisionX, numPrecisionY):
+                 history, key, numPrecisionX, numPrecisionY):
         super(GraphWidget, self).__init__()
         self.xScale = xScale
         self.yScale = yScale
@@ -326,29 +1143,31 @@ class GraphWidget(QtGui.QWidget):
         self.par = par
         self.parVals = parVals
         self.parValRADI = parValRADI
-        self.historyList = historyList
+        self.history = history
         self.key = key
         self.numPrecisionX = numPrecisionX
         self.numPrecisionY = numPrecisionY
+        self.background = None
+        self.labels = None
+        self.ticks = None
+        self.renderScheduler = FrameScheduler(self.plotFunc, self.maxFps, self)
+        # the figure is only made when the widget is shown (or attached to a shared
+        # figure), so parameters which aren't displayed don't hold one
+        self.figure = None
+        self.canvas = None
+        self.ax = None
+        self.line = None
+        self.ownCanvas = None
+        self.cids = []
+        self.pressed = False
+        self.dragIndex = None
+        self.radiIndex = None
+        self.inputTime = None
+        self.showXAxis = True
 
         # Grid Layout
-        grid = QtGui.QGridLayout()
-        self.setLayout(grid)
-        # Canvas and Toolbar
-        self.figure = plt.figure()
-
-        self.canvas = FigureCanvas(self.figure)
-        # self.canvas.setFocusPolicy( QtCore.Qt.ClickFocus )
-        # self.canvas.setFocusPolicy( QtCore.Qt.WheelFocus )
-        self.canvas.setFocus()
-
-
-        self.canvas.mpl_connect('button_press_event', self.getClick)
-        self.canvas.mpl_connect('button_release_event', self.getRelease)
-        self.canvas.mpl_connect('motion_notify_event', self.getMotion)
-        # self.canvas.mpl_connect('key_press_event', self.keyPressed)
-
-        self.ax = self.figure.add_subplot(111)
+        self.grid = QtGui.QGridLayout()
+        self.setLayout(self.grid)
 
         # button to add another tilted-ring parameter to plot
         self.btnAddParam = QtGui.QPushButton('&Add',self)
@@ -370,8 +1189,7 @@ class GraphWidget(QtGui.QWidget):
         hbox.addWidget(self.btnAddParam)
         hbox.addWidget(self.btnEditParam)
 
-        grid.addLayout(hbox, 0, 0)
-        grid.addWidget(self.canvas, 2, 0, 1, 2)
+        self.grid.addLayout(hbox, 0, 0)
 
         self.firstPlot()
 
@@ -382,6 +1200,147 @@ class GraphWidget(QtGui.QWidget):
         else:
             currPar = self.par
 
+    def showEvent(self, event):
+        if self.canvasPool is not None:
+            self.canvasPool.request()
+        elif self.canvas is None:
+            self.useOwnCanvas()
+        super(GraphWidget, self).showEvent(event)
+
+    def hideEvent(self, event):
+        if self.canvasPool is not None:
+            self.canvasPool.request()
+        super(GraphWidget, self).hideEvent(event)
+
+    def moveEvent(self, event):
+        if self.canvasPool is not None:
+            self.canvasPool.request()
+        super(GraphWidget, self).moveEvent(event)
+
+    def resizeEvent(self, event):
+        if self.canvasPool is not None:
+            self.canvasPool.request()
+        super(GraphWidget, self).resizeEvent(event)
+
+    def useOwnCanvas(self):
+        """Plots the parameter on the widget's own canvas, getting one if need be"""
+        if self.ownCanvas is None:
+            if self.canvasPool is not None:
+                self.ownCanvas = self.canvasPool.acquire()
+            else:
+                # a plain Figure rather than pyplot's, which would keep it alive forever
+                self.ownCanvas = FigureCanvas(Figure())
+                self.ownCanvas.figure.add_subplot(111)
+            # self.canvas.setFocusPolicy( QtCore.Qt.ClickFocus )
+            # self.canvas.setFocusPolicy( QtCore.Qt.WheelFocus )
+            self.ownCanvas.setFocus()
+            self.grid.setRowMinimumHeight(2, 0)
+            self.grid.addWidget(self.ownCanvas, 2, 0, 1, 2)
+            self.ownCanvas.show()
+        # drawn once the layout has given the canvas its size
+        self.attach(self.ownCanvas, self.ownCanvas.figure.axes[0], draw=False)
+        self.ownCanvas.draw_idle()
+
+    def releaseOwnCanvas(self):
+        """Gives the widget's own canvas back to canvasPool
+
+        The space the canvas took is kept so that the layout of the scroll area, and
+        with it the scroll position, doesn't change.
+        """
+        if self.ownCanvas is None or self.canvasPool is None:
+            return
+        if self.canvas is self.ownCanvas:
+            self.detach()
+        self.grid.setRowMinimumHeight(2, self.ownCanvas.height())
+        self.grid.removeWidget(self.ownCanvas)
+        self.canvasPool.release(self.ownCanvas)
+        self.ownCanvas = None
+
+    def attach(self, canvas, ax, showXAxis=True, draw=True):
+        """Plots the parameter on the given axes of a canvas
+
+        Keyword arguments:
+        self --            main window being displayed i.e. the current instance of
+                           the mainWindow class
+        canvas --          canvas the axes are drawn on
+        ax --              axes to plot the parameter on
+        showXAxis (bool)-- whether to show the x-axis label and tick labels
+        draw (bool)--      whether to draw the canvas straight away
+
+        Returns:
+        None
+
+        The mouse events of the canvas are connected to the widget; events on other
+        axes of the same canvas are ignored.
+        """
+        self.detach()
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.ax = ax
+        self.showXAxis = showXAxis
+        self.labels = None
+        self.ticks = None
+        self.line, = self.ax.plot([], [], '--bo')
+        self.cids = [canvas.mpl_connect('button_press_event', self.getClick),
+                     canvas.mpl_connect('button_release_event', self.getRelease),
+                     canvas.mpl_connect('motion_notify_event', self.getMotion),
+                     canvas.mpl_connect('draw_event', self.onDraw),
+                     canvas.mpl_connect('resize_event', self.onResize)]
+        # self.canvas.mpl_connect('key_press_event', self.keyPressed)
+        self.firstPlot(draw)
+
+    def detach(self):
+        """Removes the plot from the canvas it's on and disconnects its events"""
+        if self.canvas is None:
+            return
+        for cid in self.cids:
+            self.canvas.mpl_disconnect(cid)
+        self.line.remove()
+        self.cids = []
+        self.pressed = False
+        self.dragIndex = None
+        self.background = None
+        self.figure = self.canvas = self.ax = self.line = None
+
+    def sortedRadii(self):
+        """Returns the values of RADI in increasing order and the ring of each
+
+        The sorted copy is kept until parValRADI is replaced, so finding a node
+        doesn't sort the rings again on every click.
+        """
+        if self.radiIndex is None or self.radiIndex[0] is not self.parValRADI:
+            radi = np.asarray(self.parValRADI, dtype=np.float64)
+            order = np.argsort(radi, kind='mergesort')
+            self.radiIndex = (self.parValRADI, radi[order], order)
+        return self.radiIndex[1], self.radiIndex[2]
+
+    def nodeAt(self, xdata, xpixel):
+        """Finds the ring whose node is under the mouse
+
+        Keyword arguments:
+        xdata (float)--   x-value of the mouse on the axes
+        xpixel (float)--  x-position of the mouse on the canvas in pixels
+
+        Returns:
+        int
+        Index of the ring with the radius closest to xdata, or None if it's more than
+        pickRadius pixels away from the mouse
+
+        The ring is found by binary search in the sorted radii, so the time taken
+        doesn't grow with the number of rings and a node can be picked however close
+        together the rings are drawn.
+        """
+        radii, order = self.sortedRadii()
+        if not radii.size or xdata is None:
+            return None
+        pos = np.searchsorted(radii, xdata)
+        nearest = min((idx for idx in (pos - 1, pos) if 0 <= idx < radii.size),
+                      key=lambda idx: abs(radii[idx] - xdata))
+        nodeX = self.ax.transData.transform((radii[nearest], 0.0))[0]
+        if abs(nodeX - xpixel) > self.pickRadius:
+            return None
+        return int(order[nearest])
+
     def _almost_equal(self, a, b, rel_tol=5e-2, abs_tol=0.0):
         '''Takes two values return true if they are almost equal'''
         diff = abs(b - a)
@@ -415,9 +1374,12 @@ class GraphWidget(QtGui.QWidget):
         """
         # on left click in figure canvas, captures mouse press and assign None to
         # mouse release
-
+        if self.ax is None or event.inaxes is not self.ax:
+            return
 
         if event.button == 1 and not event.xdata is None:
+            self.pressed = True
+            self.dragIndex = self.nodeAt(event.xdata, event.x)
             self.mPress[0] = event.xdata
             self.mPress[1] = event.ydata
             self.mRelease[0] = None
@@ -431,47 +1393,37 @@ class GraphWidget(QtGui.QWidget):
             if ok:
                 if text:
                     newVal = float(str(text))
-                    for j in range(len(self.parValRADI)):
-                        if ((self.mDblPress[0] < (self.parValRADI[j])+3) and
-                            (self.mDblPress[0] > (self.parValRADI[j])-3)):
-
-                            self.parVals[j] = newVal
-                            bottom, top = self.ax.get_ylim()
-                            self.ax.clear()
-                            self.ax.set_xlim(self.xScale[0], self.xScale[1])
-                            max_yvalue = max(self.parVals)
-                            min_yvalue = min(self.parVals)
-                            
-                            if self._over_and_above(min_yvalue, bottom, 'min'):
-                                bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
-                                # this line is optional, only bottom scale should change
-                                top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
-                            elif self._over_and_above(max_yvalue, top, 'max'):
-                                top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
-                                # this line is optional, only top scale should change
-                                bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
-                            elif self._almost_equal(min_yvalue, bottom, rel_tol=1e-2):
-                                bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
-                                # this line is optional, only bottom scale should change
-                                top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
-                            elif self._almost_equal(max_yvalue, top, rel_tol=1e-2):
-                                top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
-                                # this line is optional, only top scale should change
-                                bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
-
-                            self.ax.set_ylim(bottom, top)
-                            self.ax.set_xlabel("RADI (arcsec)")
-                            self.ax.set_ylabel(self.par + "( "+self.unitMeas+ " )")
-                            self.ax.plot(self.parValRADI, self.parVals, '--bo')
-                            self.ax.set_xticks(self.parValRADI)
-                            self.canvas.draw()
-                            self.key = "No"
-                            break
+                    j = self.nodeAt(event.xdata, event.x)
+                    if j is not None:
+                        self.parVals[j] = newVal
+                        bottom, top = self.ax.get_ylim()
+                        max_yvalue = max(self.parVals)
+                        min_yvalue = min(self.parVals)
+                        
+                        if self._over_and_above(min_yvalue, bottom, 'min'):
+                            bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
+                            # this line is optional, only bottom scale should change
+                            top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
+                        elif self._over_and_above(max_yvalue, top, 'max'):
+                            top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
+                            # this line is optional, only top scale should change
+                            bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
+                        elif self._almost_equal(min_yvalue, bottom, rel_tol=1e-2):
+                            bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
+                            # this line is optional, only bottom scale should change
+                            top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
+                        elif self._almost_equal(max_yvalue, top, rel_tol=1e-2):
+                            top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
+                            # this line is optional, only top scale should change
+                            bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
 
-                    # append the new point to the history if the last item in history differs
-                    # from the new point
-                    if not self.historyList[len(self.historyList)-1] == self.parVals[:]:
-                        self.historyList.append(self.parVals[:])
+                        self.ax.set_ylim(bottom, top)
+                        self.updateLine(self.parVals)
+                        self.drawCanvas()
+                        self.key = "No"
+
+                    # only the changed ring goes into the history, if any changed
+                    self.history.record({self.par: self.parVals})
 
                     self.mPress[0] = None
                     self.mPress[1] = None
@@ -488,24 +1440,32 @@ class GraphWidget(QtGui.QWidget):
         None
 
         The xData is captured when the left mouse button is released on the canvas.
-        The new data point is added to the history and mouse pressed is assigned None
+        The rings changed by the drag are recorded in the history, as a new branch if
+        edits were undone, and mouse pressed is assigned None
         """
         # re-look at this logic --seems to be a flaw somewhere
 
+        if not self.pressed:
+            return
+        self.pressed = False
+
+        # the point ends up where the mouse was last seen, not where it was last drawn
+        self.renderScheduler.flush()
 
         if not event.ydata is None:
             self.mRelease[0] = event.xdata
             self.mRelease[1] = event.ydata
             self.changeGlobal()
-            self.redo = []
 
-        # append the new point to the history if the last item in history differs
-        # from the new point
-        if not self.historyList[len(self.historyList)-1] == self.parVals[:]:
-            self.historyList.append(self.parVals[:])
+        if self.background is not None:
+            self.endDrag()
+
+        self.history.record({self.par: self.parVals})
 
         self.mPress[0] = None
         self.mPress[1] = None
+        self.dragIndex = None
+        self.inputTime = None
 
     def getMotion(self, event):
         """Mouse is in motion
@@ -517,191 +1477,389 @@ class GraphWidget(QtGui.QWidget):
 
         Returns:
         None
+
+        The redraw is left to renderScheduler, which only draws the latest position
+        of all the motion events received since the last frame. The time of the
+        first of those events is kept to measure how long it takes to reach the
+        screen.
         """
         # whilst the left mouse button is being clicked
         # capture the VROT (y-value) during mouse
         # movement and call re-draw graph
 
+        if not self.pressed:
+            return
+        start = clock()
+        if self.inputTime is None:
+            self.inputTime = start
         if event.guiEvent.MouseMove == QtCore.QEvent.MouseMove:
             if event.button == QtCore.Qt.LeftButton:
+                if event.inaxes is not None and event.inaxes is not self.ax:
+                    # over another subplot of a shared figure: the y-value on our axes
+                    self.last_value = self.ax.transData.inverted().transform(
+                        (event.x, event.y))[1]
+                    self.mMotion[0] = self.last_value
                 # if the mouse pointer moves out of the figure canvas use
                 # the last value to redraw the graph
-                if event.ydata is None:
+                elif event.ydata is None:
                     self.last_value += 0.1 * self.last_value
                     self.mMotion[0] = self.last_value
                 else:
                     self.last_value = event.ydata
                     self.mMotion[0] = event.ydata
-                self.plotFunc()
+                self.renderScheduler.request()
+        METRICS.add('getMotion', clock() - start, self.par)
 
-    def undoKey(self):
-        """Key is pressed
+    @timed_method('firstPlot')
+    def firstPlot(self, draw=True):
+        """Plots data from file
 
         Keyword arguments:
         self --         main window being displayed i.e. the current instance of the
-                        mainWindow class
-        event --        event type
+        mainWindow class
+        draw (bool)--   whether to draw the canvas straight away
 
         Returns:
         None
 
-        Deletes the last item in the history list when "Ctrl+z" is pressed and
-        re-draws graph
+        Produces view graph from history. The existing line is given the new data
+        rather than plotting a new one. Nothing is drawn while the widget has no
+        figure; the plot is made when it gets one.
+        """
+        self.key = "No"
+        if self.canvas is None:
+            return
+        self.background = None
+        self.line.set_animated(False)
+        self.updateAxes()
+        self.updateLine(self.history.values[self.par])
+        if draw:
+            self.drawCanvas()
+
+    def invalidate(self):
+        """Asks for the plot to be made again with the current data and scales
+
+        The plot is redrawn by repaintScheduler together with all other widgets which
+        changed at the same time, or straight away if there's no repaintScheduler.
         """
-        if len(self.historyList) > 1:
-            self.redo.append([self.numPrecisionY, self.parVals[:],
-                              self.historyList[-1], self.yScale[:]])
-            self.historyList.pop()
-            self.parVals = self.historyList[-1][:]
-            self.key = "Yes"
-            self.plotFunc()
+        if self.repaintScheduler is None:
+            self.firstPlot()
         else:
-            self.showInformation()
+            self.key = "No"
+            self.repaintScheduler.invalidate(self)
 
-    def redoKey(self):
-        """Key is pressed
+    def updateAxes(self):
+        """Sets the limits of the axes and, if they changed, the labels and ticks
 
         Keyword arguments:
         self --         main window being displayed i.e. the current instance of the
-                        mainWindow class
-        event --        event type
+        mainWindow class
 
         Returns:
         None
 
-        Deletes the last item in the history list when "Ctrl+z" is pressed and
-        re-draws graph
+        The labels only change with the parameter or its unit and the tick locator
+        with RADI, so they are kept as they are otherwise instead of being created
+        again. RingLocator puts the ticks at the rings while there's room for them.
         """
+        labels = (self.par, self.unitMeas)
+        if labels != self.labels:
+            self.ax.set_xlabel("RADI (arcsec)" if self.showXAxis else "")
+            self.ax.set_ylabel(self.par + "( "+self.unitMeas+ " )")
+            self.ax.tick_params(labelbottom=self.showXAxis)
+            self.labels = labels
+        if self.ticks is not self.parValRADI:
+            self.ax.xaxis.set_major_locator(RingLocator(self.sortedRadii()[0]))
+            self.ticks = self.parValRADI
+        self.ax.set_xlim(self.xScale[0], self.xScale[1])
+        self.ax.set_ylim(self.yScale[0], self.yScale[1])
 
-        if len(self.redo) > 0:
-            self.numPrecisionY = self.redo[-1][2]
-            self.parVals = self.redo[-1][3][:]
-            self.historyList.append(self.redo[-1][4][:])
-            self.yScale = self.redo[-1][5][:]
-            self.redo.pop()
-            self.key = "Yes"
-            self.plotFunc()
-        else:
-            self.showInformation()
-
-
-    def showInformation(self):
-        """Show the information message
+    def updateLine(self, values):
+        """Gives the line new y-values, at the resolution of the screen
 
         Keyword arguments:
         self --         main window being displayed i.e. the current instance of the
         mainWindow class
+        values --       y-value of each ring
 
         Returns:
         None
 
-        Displays a messagebox that informs user there's no previous action to be undone
+        Only the rings in view are drawn. Their nodes are drawn while they're at least
+        nodeSpacing pixels apart; once there are more rings than pixel columns the line
+        is decimated to the lowest and highest value in each column, so drawing takes
+        as long for ten thousand rings as for a hundred. The x-limits must be set first.
         """
-        QtGui.QMessageBox.information(self, "Information", "History list is exhausted")
-
-
-    def firstPlot(self):
+        radii, order = self.sortedRadii()
+        values = np.asarray(values, dtype=np.float64)
+        if values.size != radii.size:
+            self.line.set_data(self.parValRADI, values)
+            return
+        values = values[order]
+        left, right = sorted(self.ax.get_xlim())
+        width = max(self.ax.bbox.width, 1.0)
+        # one ring beyond each edge keeps the line running off the axes
+        lo = max(np.searchsorted(radii, left) - 1, 0)
+        hi = min(np.searchsorted(radii, right, side='right') + 1, radii.size)
+        x, y = radii[lo:hi], values[lo:hi]
+        self.line.set_marker('o' if x.size * self.nodeSpacing <= width else '')
+        if x.size > 2 * width:
+            keep = decimate(x, y, left, right, int(width))
+            x, y = x[keep], y[keep]
+        self.line.set_data(x, y)
+
+    def onResize(self, event):
+        """Decimates the line again for the new size of the canvas"""
+        self.updateLine(self.parVals)
+
+    @timed_method('plotFunc')
+    def plotFunc(self):
         """Plots data from file
 
         Keyword arguments:
         self --         main window being displayed i.e. the current instance of the
-        mainWindow class
+                        mainWindow class
 
         Returns:
         None
 
-        Produces view graph from historyList
+        Produces view graph from history or parVals. While a point is dragged only
+        the line is redrawn, over a cached copy of the rest of the axes (blitting);
+        the whole figure is drawn again only when the y-limits change.
         """
-        self.ax.clear()
-        self.ax.set_xlim(self.xScale[0], self.xScale[1])
-        self.ax.set_ylim(self.yScale[0], self.yScale[1])
-        self.ax.set_xlabel("RADI (arcsec)")
-        self.ax.set_ylabel(self.par + "( "+self.unitMeas+ " )")
-        self.ax.plot(self.parValRADI, self.historyList[-1], '--bo')
-        self.ax.set_xticks(self.parValRADI)
-        self.canvas.draw()
-        self.key = "No"
+        if self.canvas is None:
+            return
 
-    def plotFunc(self):
-        """Plots data from file
+        if self.key == "Yes":
+            self.firstPlot()
+
+        # this re-plots the graph as long as the mouse is in motion and the right data
+        # point is clicked
+        else:
+            # the node was picked once on press; no search per motion event
+            j = self.dragIndex
+            if j is not None and self.mRelease[0] is None:
+                dy = self.mMotion[0] - self.parVals[j]
+                self.parVals[j]+=dy
+                bottom, top = self.ax.get_ylim()
+                max_yvalue = max(self.parVals)
+                min_yvalue = min(self.parVals)
+
+                # FIX ME (sam 28/05/2019): scaling points too close to the limit should be relooked
+                # division by zero was encountered during runtime
+                if ((self.mMotion[0]/min_yvalue) >= 0.95) or ((self.mMotion[0]/max_yvalue) >= 0.95):
+                    if self._almost_equal(self.mMotion[0], bottom, rel_tol=5e-2):
+                        bottom = min_yvalue - (0.05*(max_yvalue-min_yvalue))
+                        # this line is optional, only bottom scale should change
+                        top = max_yvalue + (0.05*(max_yvalue-min_yvalue))
+                    elif self._almost_equal(self.mMotion[0], top, rel_tol=5e-2):
+                        top = max_yvalue + (0.05*(max_yvalue-min_yvalue))
+                        # this line is optional, only top scale should change
+                        bottom = min_yvalue - (0.05*(max_yvalue-min_yvalue))
+                else:
+                    if self._almost_equal(self.mMotion[0], min_yvalue):
+                        bottom = min_yvalue - (0.3*(max_yvalue-min_yvalue))
+                        # this line is optional, only bottom scale should change
+                        top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
+                    elif self._almost_equal(self.mMotion[0], max_yvalue):
+                        top = max_yvalue + (0.3*(max_yvalue-min_yvalue))
+                        # this line is optional, only top scale should change
+                        bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
+
+                self.updateLine(self.parVals)
+                if self.background is not None and (bottom, top) == self.ax.get_ylim():
+                    self.blitLine()
+                else:
+                    # drag just started or the y-limits changed: draw everything
+                    # except the line, which onDraw caches as the new background
+                    self.line.set_animated(True)
+                    self.ax.set_ylim(bottom, top)
+                    self.drawCanvas()
+                self.key = "No"
+                if self.inputTime is not None:
+                    # from the first motion event of the frame until it's drawn
+                    METRICS.add('latency', clock() - self.inputTime, self.par)
+                    self.inputTime = None
+
+    def onDraw(self, event):
+        """Caches the background after a full redraw while a point is dragged
 
         Keyword arguments:
         self --         main window being displayed i.e. the current instance of the
                         mainWindow class
+        event --        event type
 
         Returns:
         None
 
-        Produces view graph from historyList or parVals
+        The line is left out of the figure while it's being dragged (animated), so the
+        freshly drawn figure is kept as the background and the line drawn over it.
+        A draw of the canvas of a SharedFigure is counted there, once for all panels.
         """
+        if self.canvas is self.ownCanvas:
+            METRICS.count('fullRedraw', self.par)
+        if self.line is not None and self.line.get_animated():
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self.ax.draw_artist(self.line)
+
+    @timed_method('blit')
+    def blitLine(self):
+        """Redraws only the line over the cached background"""
+        METRICS.count('partialRedraw', self.par)
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    @timed_method('draw')
+    def drawCanvas(self):
+        """Draws the whole canvas now"""
+        self.canvas.draw()
 
-        if self.key == "Yes":
-            self.firstPlot()
+    def endDrag(self):
+        """Puts the line back into the figure and redraws the whole figure"""
+        self.background = None
+        self.line.set_animated(False)
+        self.drawCanvas()
 
-        # this re-plots the graph as long as the mouse is in motion and the right data
-        # point is clicked
+class CanvasPool(object):
+    """Canvases of the graph widgets on screen in a scroll area
+
+    Only the graph widgets in or near the viewport of the scroll area hold a canvas.
+    A widget scrolled out of view hands its canvas back, and the canvas is given to
+    the next widget scrolled into view, so the number of canvases follows the size
+    of the window rather than the number of parameters displayed.
+    """
+
+    def __init__(self, scrollArea, maxFree=4):
+        self.scrollArea = scrollArea
+        self.maxFree = maxFree
+        self.free = []
+        self.scheduler = FrameScheduler(self.updateViewport, parent=scrollArea)
+        scrollArea.verticalScrollBar().valueChanged.connect(self.request)
+        scrollArea.horizontalScrollBar().valueChanged.connect(self.request)
+
+    def request(self, *args):
+        self.scheduler.request()
+
+    def acquire(self):
+        if self.free:
+            return self.free.pop()
+        canvas = FigureCanvas(Figure())
+        canvas.figure.add_subplot(111)
+        return canvas
+
+    def release(self, canvas):
+        canvas.hide()
+        canvas.setParent(None)
+        if len(self.free) < self.maxFree:
+            self.free.append(canvas)
         else:
-            for j in range(len(self.parValRADI)):
-                if ((self.mPress[0] < (self.parValRADI[j]) + 3) and
-                        (self.mPress[0] > (self.parValRADI[j]) - 3) and
-                        (self.mRelease[0] is None)):
-                    dy = self.mMotion[0] - self.parVals[j]
-                    self.parVals[j]+=dy
-                    bottom, top = self.ax.get_ylim()
-                    self.ax.clear()
-                    self.ax.set_xlim(self.xScale[0], self.xScale[1])
-                    max_yvalue = max(self.parVals)
-                    min_yvalue = min(self.parVals)
-
-                    # FIX ME (sam 28/05/2019): scaling points too close to the limit should be relooked
-                    # division by zero was encountered during runtime
-                    if ((self.mMotion[0]/min_yvalue) >= 0.95) or ((self.mMotion[0]/max_yvalue) >= 0.95):
-                        if self._almost_equal(self.mMotion[0], bottom, rel_tol=5e-2):
-                            bottom = min_yvalue - (0.05*(max_yvalue-min_yvalue))
-                            # this line is optional, only bottom scale should change
-                            top = max_yvalue + (0.05*(max_yvalue-min_yvalue))
-                        elif self._almost_equal(self.mMotion[0], top, rel_tol=5e-2):
-                            top = max_yvalue + (0.05*(max_yvalue-min_yvalue))
-                            # this line is optional, only top scale should change
-                            bottom = min_yvalue - (0.05*(max_yvalue-min_yvalue))
-                    else:
-                        if self._almost_equal(self.mMotion[0], min_yvalue):
-                            bottom = min_yvalue - (0.3*(max_yvalue-min_yvalue))
-                            # this line is optional, only bottom scale should change
-                            top = max_yvalue + (0.1*(max_yvalue-min_yvalue))
-                        elif self._almost_equal(self.mMotion[0], max_yvalue):
-                            top = max_yvalue + (0.3*(max_yvalue-min_yvalue))
-                            # this line is optional, only top scale should change
-                            bottom = min_yvalue - (0.1*(max_yvalue-min_yvalue))
+            canvas.deleteLater()
 
-                    self.ax.set_ylim(bottom, top)
-                    self.ax.set_xlabel("RADI (arcsec)")
-                    self.ax.set_ylabel(self.par + "( "+self.unitMeas+ " )")
-                    self.ax.plot(self.parValRADI, self.parVals, '--bo')
-                    self.ax.set_xticks(self.parValRADI)
-                    self.canvas.draw()
-                    self.key = "No"
-                    break
+    def updateViewport(self):
+        """Gives canvases to the graph widgets in or near the viewport
 
-class SMWindow(QtGui.QWidget):
+        Keyword arguments:
+        self --         the current instance of the CanvasPool class
 
-    def __init__(self, par, xVal, gwObjects):
-        # TODO SAM (26/06/2019) no need to pass 'par' to init if we have 'gwObjects'
-        # but maybe we need it because it makes things faster
-        super(SMWindow, self).__init__()
-        self.xMinVal = xVal[0]
-        self.xMaxVal = xVal[1]
-        self.gwObjects = gwObjects
-        self.par = par
-        self.prevParVal = ""
-        self.counter = 0
+        Returns:
+        None
 
-        self.parameter = QtGui.QComboBox()
-        # self.parameter.setEditable(True)
-        self.parameter.addItem("Select Parameter")
-        for i in self.par:
-            self.parameter.addItem(i)
-        self.parameter.setAutoCompletion(True)
+        Widgets within half a viewport of the visible area get a canvas so that it's
+        already drawn when scrolled to; all other widgets give theirs back first so
+        that those canvases can be reused straight away.
+        """
+        content = self.scrollArea.widget()
+        viewport = self.scrollArea.viewport()
+        area = viewport.rect()
+        area.adjust(0, -area.height() // 2, 0, area.height() // 2)
+        onScreen = []
+        for gwObject in content.findChildren(GraphWidget):
+            rect = QtCore.QRect(gwObject.mapTo(viewport, QtCore.QPoint(0, 0)),
+                                gwObject.size())
+            if gwObject.isVisible() and area.intersects(rect):
+                onScreen.append(gwObject)
+            else:
+                gwObject.releaseOwnCanvas()
+        for gwObject in onScreen:
+            if gwObject.canvas is None:
+                gwObject.useOwnCanvas()
+
+
+class SharedFigure(QtGui.QWidget):
+    """One figure with the displayed parameters as subplots sharing the x-axis
+
+    Each graph widget plotted here draws on its own subplot of the one canvas, so a
+    layout of many parameters needs a single figure instead of one per parameter.
+    """
+
+    def __init__(self):
+        super(SharedFigure, self).__init__()
+        self.figure = Figure()
+        self.canvas = FigureCanvas(self.figure)
+        # one draw of the canvas redraws every panel, so it's counted once
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+        self.gwObjects = []
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+    def setPanels(self, gwObjects, ncols=1):
+        """Plots graph widgets on subplots sharing the x-axis
+
+        Keyword arguments:
+        self --            the current instance of the SharedFigure class
+        gwObjects (list)-- graph widgets in the order they should be displayed,
+                           filling rows first
+        ncols (int)--      number of columns of subplots
+
+        Returns:
+        None
+        """
+        self.clear(draw=False)
+        self.gwObjects = list(gwObjects)
+        ncols = max(1, min(ncols, len(self.gwObjects)))
+        nrows = int(ceil(len(self.gwObjects) / float(ncols)))
+        first = None
+        for idx, gwObject in enumerate(self.gwObjects):
+            ax = self.figure.add_subplot(nrows, ncols, idx + 1, sharex=first)
+            first = first or ax
+            # only the bottom subplot of each column labels RADI
+            gwObject.attach(self.canvas, ax, idx + ncols >= len(self.gwObjects), False)
+        self.canvas.draw_idle()
+
+    def onDraw(self, event):
+        METRICS.count('fullRedraw')
+
+    def clear(self, draw=True):
+        for gwObject in self.gwObjects:
+            if gwObject.canvas is self.canvas:
+                gwObject.detach()
+        self.gwObjects = []
+        self.figure.clear()
+        if draw:
+            self.canvas.draw()
+
+
+class SMWindow(QtGui.QWidget):
+
+    def __init__(self, par, xVal, gwObjects):
+        # TODO SAM (26/06/2019) no need to pass 'par' to init if we have 'gwObjects'
+        # but maybe we need it because it makes things faster
+        super(SMWindow, self).__init__()
+        self.xMinVal = xVal[0]
+        self.xMaxVal = xVal[1]
+        self.gwObjects = gwObjects
+        self.par = par
+        self.prevParVal = ""
+        self.counter = 0
+
+        self.parameter = QtGui.QComboBox()
+        # self.parameter.setEditable(True)
+        self.parameter.addItem("Select Parameter")
+        for i in self.par:
+            self.parameter.addItem(i)
+        self.parameter.setAutoCompletion(True)
         self.parameter.setStyleSheet("QComboBox { combobox-popup: 0; }")
         self.parameter.setMaxVisibleItems(5)
         index = self.parameter.findText("Select Parameter", QtCore.Qt.MatchFixedString)
@@ -789,7 +1947,7 @@ class SMWindow(QtGui.QWidget):
         for gwObject in self.gwObjects:
             gwObject.yScale = self.gwDict[gwObject.par][:]
             gwObject.xScale = [self.xMinVal, self.xMaxVal]
-            gwObject.firstPlot()
+            gwObject.invalidate()
         self.close()
         QtWidgets.QMessageBox.information(self, "Information", "Done!")
 
@@ -840,6 +1998,83 @@ class ParamSpec(QtGui.QWidget):
         self.setFocus()
 
 
+class MetricsWindow(QtGui.QWidget):
+    """Draw times, event latencies and redraw counts recorded in METRICS
+
+    Each row is a timer or counter of a panel (the parameter of a graph widget, or
+    * for the main window) with the count and, for timers, the mean, median, 95th
+    percentile and longest time in milliseconds.
+    """
+
+    columns = ("Panel", "Name", "Count", "Mean (ms)", "p50 (ms)", "p95 (ms)",
+               "Max (ms)")
+
+    def __init__(self):
+        super(MetricsWindow, self).__init__()
+        self.table = QtGui.QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+
+        self.btnReset = QtGui.QPushButton('Reset', self)
+        self.btnReset.clicked.connect(self.reset)
+        self.btnLog = QtGui.QPushButton('Log as JSON', self)
+        self.btnLog.clicked.connect(self.logMetrics)
+        self.btnClose = QtGui.QPushButton('Close', self)
+        self.btnClose.clicked.connect(self.close)
+        self.hboxBtns = QtGui.QHBoxLayout()
+        self.hboxBtns.addStretch(1)
+        self.hboxBtns.addWidget(self.btnReset)
+        self.hboxBtns.addWidget(self.btnLog)
+        self.hboxBtns.addWidget(self.btnClose)
+
+        vbox = QtGui.QVBoxLayout()
+        vbox.addWidget(self.table)
+        vbox.addLayout(self.hboxBtns)
+        self.setLayout(vbox)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+
+        self.setWindowTitle("Performance Metrics")
+        self.setGeometry(300, 300, 640, 400)
+        _center(self)
+        self.refresh()
+
+    def refresh(self):
+        """Shows the current figures of METRICS"""
+        rows = []
+        for (panel, name), hist in METRICS.timers.items():
+            rows.append(('*' if panel is None else panel, name, hist.count,
+                         hist.mean, hist.percentile(50), hist.percentile(95), hist.max))
+        for (panel, name), count in METRICS.counters.items():
+            rows.append(('*' if panel is None else panel, name, count,
+                         None, None, None, None))
+        rows.sort(key=lambda row: (row[0], row[1]))
+
+        self.table.setRowCount(len(rows))
+        for rowNo, row in enumerate(rows):
+            for colNo, value in enumerate(row):
+                if value is None:
+                    text = ""
+                elif isinstance(value, float):
+                    text = "{:.2f}".format(value)
+                else:
+                    text = str(value)
+                self.table.setItem(rowNo, colNo, QtGui.QTableWidgetItem(text))
+
+    def reset(self):
+        METRICS.reset()
+        self.refresh()
+
+    def logMetrics(self):
+        """Writes the figures to the log set up by logWarnings as JSON"""
+        METRICS.dump(logging.getLogger(__name__))
+        QtGui.QMessageBox.information(self, "Information",
+                                          "Metrics written to TiRiFiG.log")
+
+
 class MainWindow(QtGui.QMainWindow):
     runNo = 0
     key = "Yes"
@@ -849,22 +2084,29 @@ class MainWindow(QtGui.QMainWindow):
     par = ['VROT', 'SBR', 'INCL', 'PA']
     tmpDeffile = os.getcwd() + "/tmpDeffile.def"
     progressPath = ''
+    fitProgress = None
     fileName = ""
     gwObjects = []
-    t = 0
     scrollWidth = 0; scrollHeight = 0
-    before = 0
     numPrecisionY = {}
     numPrecisionX = 0
     NUR = 0
     data = []
+    defFile = None
+    # in memory only: no sidecar files are left next to the user's .def files
+    defCache = defcache.DefCache()
     parVals = {}
-    historyList = {}
+    historyMaxBytes = history.MAX_BYTES
+    editHistory = None
+    editJournal = None
+    journalSyncInterval = 1.0
+    progressDelayMs = 300
     xScale = [0, 0]
     yScale = {'VROT':[0, 0]}
     mPress = [-5]
     mRelease = ['None']
     mMotion = [-5]
+    sharedFigureMode = False
 
     def __init__(self):
         super(MainWindow, self).__init__()
@@ -897,6 +2139,41 @@ class MainWindow(QtGui.QMainWindow):
         self.scroll_area_content.setLayout(self.scroll_grid_layout)
         scroll_area.setWidget(self.scroll_area_content)
         vertical_layout.addWidget(scroll_area)
+        self.scrollArea = scroll_area
+        self.canvasPool = CanvasPool(scroll_area)
+        self.repaintScheduler = RepaintScheduler(self)
+        # all displayed parameters on one figure; hidden until switched on
+        self.sharedFigure = SharedFigure()
+        self.sharedScrollArea = QtGui.QScrollArea()
+        self.sharedScrollArea.setWidgetResizable(True)
+        self.sharedScrollArea.setWidget(self.sharedFigure)
+        self.sharedScrollArea.hide()
+        vertical_layout.addWidget(self.sharedScrollArea)
+        self.journalTimer = QtCore.QTimer(self)
+        self.journalTimer.timeout.connect(self.syncJournal)
+        if self.journalSyncInterval:
+            self.journalTimer.start(int(self.journalSyncInterval * 1000))
+        self.fileWatcher = FileWatcher(self.watchSnapshot, self)
+        self.fileWatcher.changed.connect(self.fileChanged)
+        self.fileWatcher.failed.connect(self.watchFailed)
+        QtGui.qApp.aboutToQuit.connect(self.fileWatcher.unwatch)
+        self.ioPool = QtCore.QThreadPool(self)
+        self.ioPool.setMaxThreadCount(1)
+        self.ioJobs = []
+        self.ioProgress = QtGui.QProgressBar()
+        self.ioProgress.setRange(0, 1000)
+        self.ioProgress.setMaximumWidth(300)
+        self.ioCancel = QtGui.QPushButton('Cancel')
+        self.ioCancel.clicked.connect(self.cancelJobs)
+        self.statusBar().addPermanentWidget(self.ioProgress)
+        self.statusBar().addPermanentWidget(self.ioCancel)
+        self.ioProgress.hide()
+        self.ioCancel.hide()
+        self.fitProcess = FitProcess(self)
+        self.fitProcess.loop.connect(self.fitProgressed)
+        self.fitProcess.finished.connect(self.fitFinished)
+        self.fitProcess.failed.connect(self.fitFailed)
+        QtGui.qApp.aboutToQuit.connect(self.fitProcess.stop)
         self.createActions()
         self.createMenus()
 
@@ -930,6 +2207,12 @@ class MainWindow(QtGui.QMainWindow):
         self.redoAction.setStatusTip('Redo last action')
         self.redoAction.triggered.connect(self.redoCommand)
 
+        self.branchAction = QtGui.QAction("Switch &Branch...", self)
+        self.branchAction.setShortcut("Ctrl+Shift+Y")
+        self.branchAction.setStatusTip('Go back to edits which were undone and then '
+                                       'replaced by others')
+        self.branchAction.triggered.connect(self.switchBranch)
+
         self.openTextEditor = QtGui.QAction("&Open Text Editor...", self)
         self.openTextEditor.setStatusTip('View the current open .def file in '
                                          'preferred text editor')
@@ -943,10 +2226,21 @@ class MainWindow(QtGui.QMainWindow):
         self.winSpec.setStatusTip('Determines the number of rows and columns in a plot')
         self.winSpec.triggered.connect(self.setRowCol)
 
+        self.sharedFig = QtGui.QAction("&Shared Figure", self)
+        self.sharedFig.setStatusTip('Plot the displayed parameters on one figure '
+                                    'sharing the RADI axis')
+        self.sharedFig.setCheckable(True)
+        self.sharedFig.toggled.connect(self.setSharedFigure)
+
         self.scaleMan = QtGui.QAction("&Scale Manager", self)
         self.scaleMan.setStatusTip('Manages behaviour of scale and min and max values')
         self.scaleMan.triggered.connect(self.SMobj)
 
+        self.metricsAction = QtGui.QAction("Performance &Metrics", self)
+        self.metricsAction.setStatusTip('Shows draw times and event latencies of '
+                                        'the plots')
+        self.metricsAction.triggered.connect(self.metricsObj)
+
         self.paraDef = QtGui.QAction("&Parameter Definition", self)
         # self.paraDef.setStatusTip('Determines which parameter is plotted')
         self.paraDef.triggered.connect(self.add_parameter_dialog)
@@ -958,6 +2252,7 @@ class MainWindow(QtGui.QMainWindow):
         self.fileMenu.addAction(self.openFile)
         self.fileMenu.addAction(self.undoAction)
         self.fileMenu.addAction(self.redoAction)
+        self.fileMenu.addAction(self.branchAction)
         self.fileMenu.addAction(self.saveChanges)
         self.fileMenu.addAction(self.saveAsFile)
         self.fileMenu.addAction(self.exitAction)
@@ -972,10 +2267,15 @@ class MainWindow(QtGui.QMainWindow):
         self.prefMenu.addAction(self.scaleMan)
         self.prefMenu.addAction(self.paraDef)
         self.prefMenu.addAction(self.winSpec)
+        self.prefMenu.addAction(self.sharedFig)
+        self.prefMenu.addAction(self.metricsAction)
 
     def quitApp(self):
-        if self.t != 0:
-            self.t.cancel()
+        self.fileWatcher.unwatch()
+        self.cancelJobs()
+        self.ioPool.waitForDone()
+        if self.editJournal is not None:
+            self.editJournal.close()
         QtGui.qApp.quit()
 
     def cleanUp(self):
@@ -991,15 +2291,15 @@ class MainWindow(QtGui.QMainWindow):
         self.tmpDeffile = os.getcwd() + "/tmpDeffile.def"
         self.fileName = ""
         self.gwObjects = []
-        self.t = 0
         self.scrollWidth = 0; self.scrollHeight = 0
-        self.before = 0
         self.numPrecisionY = {}
         self.numPrecisionX = 0
         self.NUR = 0
         self.data = []
+        self.defFile = None
+        self.editJournal = None
+        self.editHistory = None
         self.parVals = {}
-        self.historyList = {}
         self.xScale = [0, 0]
         self.yScale = {'VROT':[0, 0]}
         self.mPress = [-5]
@@ -1009,179 +2309,132 @@ class MainWindow(QtGui.QMainWindow):
         self.initUI()
 
     def getData(self):
-        """Loads data from specified .def file in open dialog box
+        """Starts loading the .def file chosen in an open dialog box
 
         Keyword arguments:
         self-- this is the main window being displayed
             i.e. the current instance of the mainWindow class
 
         Returns:
-        data:list
-        The text found in each line of the opened file
+        IOJob
+        The job reading and parsing the file on ioPool, or None if no file is chosen
 
-        data will be a none type variable if the fileName is invalid or no file is chosen
+        The file is read and parsed in the background, so the window stays
+        responsive however slow the disk; defLoaded takes over once it's done.
         """
-
-        # stores file path of .def to fileName variable after user selects file in open
-        # dialog box
-        # TODO (Samuel 28-11-2018): If cancel is selected then suppress the message in try/except below
-        self.fileName = QtGui.QFileDialog.getOpenFileName(self, "Open .def File", "~/",
-                                                          ".def Files (*.def)")
-
-        # assign texts of read lines to data variable if fileName is exists, else assign
-        # None
-        try:
-            with open(self.fileName) as f:
-                data = f.readlines()
-        except:
-            if self.fileName == '':
-                pass
-            else:
-                QtGui.QMessageBox.information(self, "Information",
-                                              "Empty/Invalid file specified")
+        fileName = QtGui.QFileDialog.getOpenFileName(self, "Open .def File", "~/",
+                                                      ".def Files (*.def)")
+        if not fileName:
             return None
-        else:
-            return data
+        job = IOJob(readDef, str(fileName), self.defCache, list(fit_par.keys()))
+        return self.runJob(job, "Loading " + os.path.basename(str(fileName)),
+                           functools.partial(self.defLoaded, job, str(fileName)),
+                           functools.partial(self.jobFailed, "Empty/Invalid file specified"))
 
-    def strType(self, var):
-        """Determines the data type of a variable
+    def getParameter(self, data, fileName=None, table=None):
+        """Fetches data points of the tilted-ring parameters
 
         Keyword arguments:
-        self-- main window being displayed i.e. the current instance of the mainWindow class
-        var-- variable holding the values
+        self-- main window being displayed i.e. the current instance of the
+               mainWindow class
+        data (list)--  list containing texts of each line loaded from .def file
+        fileName (str)--  path data was read from (defaults to self.fileName)
+        table (RingTable)--  data already parsed e.g. by readDef (None: parsed here)
 
         Returns:
-        int, float or str : string
+        None
 
-        The function evaluates the data type of the var object and returns int,
-        float or str
+        The lines are parsed in a single pass into the DefFile held in defFile, whose
+        columns are copied into parVals for plotting and other data manipulation.
+        The parsed table is taken from defCache instead if the file hasn't changed
+        since it was last parsed. NUR, INSET, LOOPS and the floating point precision
+        of each parameter are set from the parsed table.
         """
-        # why are you putting this in a try block (fixme)
-        try:
-            if int(var) == float(var):
-                return 'int'
-        except:
-            try:
-                float(var)
-                return 'float'
-            except:
-                return 'str'
+        global fit_par
 
-    def numPrecision(self, data):
-        """Determines and sets floating point precision
+        if fileName is None:
+            fileName = self.fileName
+        if table is None:
+            table = self.defCache.parse(fileName, data, fit_par.keys())
+        self.defFile = deffile.DefFile(fileName=fileName, known=fit_par.keys(),
+                                       table=table)
+        self.applyTable(table, table.keys())
+
+    def applyTable(self, table, keys):
+        """Takes the values of parameters from a parsed .def file
 
         Keyword arguments:
-        self-- main window being displayed i.e. the current instance of the mainWindow
-               class
-        data (list)--  list of scientific values of type string
-                       e.g. x = ["20.00E4","55.0003E-4",...]
+        self-- main window being displayed i.e. the current instance of the
+               mainWindow class
+        table (RingTable)--  table parsed from the .def file
+        keys--  parameters whose values and precision are copied into parVals
 
         Returns:
-        int
+        None
 
-        Determines the highest floating point precision of data points
+        NUR, INSET and LOOPS are always taken from the table; parameters in keys
+        which the table no longer has are left as they are.
         """
+        if table.nur is not None:
+            self.NUR = table.nur
+        if table.inset is not None:
+            self.INSET = table.inset
+        if table.loops is not None:
+            self.loops = table.loops
+
+        for key in keys:
+            if key not in table:
+                continue
+            if key == 'RADI':
+                self.numPrecisionX = table.precision[key]
+            else:
+                self.numPrecisionY[key] = table.precision[key]
+            self.parVals[key] = table[key].tolist()
 
-        decPoints = []
-        # ensure values from list to are converted string
-        # FIX ME: Consider using enumerate instead of iterating with range and len
-        for i in range(len(data)):
-            data[i] = str(data[i])
-
-        for i in range(len(data)):
-            val = data[i].split(".")
-        # check val has decimal & fractional part and append length of numbers of
-        # fractional part
-            if len(val) == 2:
-                decPoints.append(len(val[1].split('E')[0]))
-
-        # assign greatest precision in decPoints to class variables handling precision
-        if len(decPoints) == 0:
-            return 0
-        else:
-            return max(decPoints)
-
-    def getParameter(self, data):
-        """Fetches data points of specified parameter
+    def openDef(self):
+        """Opens a .def file chosen by the user
 
         Keyword arguments:
-        self-- main window being displayed i.e. the current instance of the
-               mainWindow class
-        data (list)--  list containing texts of each line loaded from .def file
+        self -- main window being displayed i.e. the current instance of the
+                mainWindow class
 
         Returns:
-        parVal:list
-        The values appearing after the '=' symbol of the parameter specified in sKey.
-        If search key isnt found, zero values are returned
+        None
 
-        The data points for the specific parameter value are located and converted
-        from string to float data types for plotting and other data manipulation
+        Calls getData, which loads the file in the background; defLoaded shows it
         """
-        # search through fetched data for values of "PAR =" or "PAR = " or "PAR=" or
-        # "PAR= "
-        global fit_par
+        self.getData()
 
-        # I need NUR value first that's why it's on a different loop
-        for i in data:
-            lineVals = i.split("=")
-            if len(lineVals) > 1:
-                lineVals[0] = ''.join(lineVals[0].split())
-                if lineVals[0].upper() == "NUR":
-                    parVal = lineVals[1].split()
-                    self.NUR = int(parVal[0])
-                    break
-
-        for i in data:
-            lineVals = i.split("=")
-            if len(lineVals) > 1:
-                lineVals[0] = ''.join(lineVals[0].split())
-                parVal = lineVals[1].split()
-
-                if lineVals[0].upper() == "INSET":
-                    self.INSET = ''.join(lineVals[1].split())
-                elif lineVals[0].upper() == "LOOPS":
-                    self.loops = int(parVal[0])
-                else:
-                    if (len(parVal) > 0 and not self.strType(parVal[0]) == 'str' and
-                            not self.strType(parVal[-1]) == 'str' and
-                            not self.strType(parVal[len(parVal) / 2]) == 'str'):
-                        if (len(parVal) == self.NUR or lineVals[0].upper() in
-                                fit_par.keys()):
-                            if lineVals[0].upper() == 'RADI':
-                                self.numPrecisionX = self.numPrecision(parVal[:])
-                            else:
-                                self.numPrecisionY[str.upper(lineVals[0])] = (
-                                    self.numPrecision(parVal[:]))
-                            for i in range(len(parVal)):
-                                parVal[i] = float(Decimal(parVal[i]))
-                            self.parVals[str.upper(lineVals[0])] = parVal[:]
-
-    def openDef(self):
-        """Opens data, gets parameter values, sets precision and sets scale
+    def defLoaded(self, job, fileName, result):
+        """Gets parameter values, sets precision and sets scale of a loaded file
 
         Keyword arguments:
         self -- main window being displayed i.e. the current instance of the
                 mainWindow class
+        job (IOJob)--     the job which loaded the file
+        fileName (str)--  path of the file
+        result (tuple)--  lines and parsed table of the file from readDef
 
         Returns:
         None
 
-        Makes function calls to getData and getParameter functions, assigns
-        values to dictionaries parVals and firstPlot historyList and defines
-        the x-scale and y-scale for plotting on viewgraph
+        Makes function calls to getParameter, assigns values to dictionaries
+        parVals, starts the undo tree and defines the x-scale and y-scale for
+        plotting on viewgraph. Nothing is done if the load was cancelled.
         """
         global fit_par
-        data = self.getData()
+        if job.cancelled:
+            return
+        data, table = result
+        METRICS.add('load', job.seconds)
+        self.fileName = fileName
         try:
-            self.getParameter(data)
+            self.getParameter(data, fileName, table)
         except:
-            if data is None:
-                pass
-            else:
-                QtGui.QMessageBox.information(self, "Information",
-                                              "Tilted-ring parameters not retrieved")
-                logging.info('The tilted-ring parameters could not be retrieved from the {}'
-                             .format(self.fileName))
+            QtGui.QMessageBox.information(self, "Information",
+                                          "Tilted-ring parameters not retrieved")
+            logging.info('The tilted-ring parameters could not be retrieved from the {}'
+                         .format(self.fileName))
         else:
             self.data = data
             if self.runNo > 0:
@@ -1212,26 +2465,14 @@ class MainWindow(QtGui.QMainWindow):
                 g_w_to_plot = {}
                 # ensure there are the same points for parameters as there are for RADI as
                 # specified in NUR parameter
-                for key, val in self.parVals.items():
-                    diff = self.NUR - len(val)
-                    if key == 'RADI': #use this implementation in other diff checkers
-                        if diff == self.NUR:
-                            for j in np.arange(0.0, (int(diff) * 40.0), 40):
-                                self.parVals[key].append(j)
-                        elif diff > 0 and diff < self.NUR:
-                            for j in range(int(diff)):
-                                self.parVals[key].append(self.parVals[key][-1] + 40.0)
+                for key in self.defFile.fill_rings():
+                    self.parVals[key] = self.defFile.get(key).tolist()
+                self.recoverJournal()
+                self.editHistory = history.HistoryTree(self.parVals, self.historyMaxBytes,
+                                                       onChange=self.logEdit)
+                for key in self.parVals:
+                    if key == 'RADI':
                         continue
-                    else:
-                        if diff == self.NUR:
-                            for j in range(int(diff)):
-                                self.parVals[key].append(0.0)
-                        elif diff > 0 and diff < self.NUR:
-                            for j in range(int(diff)):
-                                self.parVals[key].append(val[-1])
-
-                    self.historyList.clear()
-                    self.historyList[key] = [self.parVals[key][:]]
 
                     min_max_diff = max(self.parVals[key]) - min(self.parVals[key])
                     percentage_of_min_max_diff = 0.1 * min_max_diff
@@ -1244,26 +2485,17 @@ class MainWindow(QtGui.QMainWindow):
                         self.yScale[key] = [lower_bound, upper_bound]
 
                     unit = fit_par[key] if key in fit_par.keys() else ""
-                    self.gwObjects.append(GraphWidget(self.xScale,
-                                                      self.yScale[key][:],
-                                                      unit, key,
-                                                      self.parVals[key][:],
-                                                      self.parVals['RADI'][:],
-                                                      self.historyList[key][:],
-                                                      self.key, self.numPrecisionX,
-                                                      self.numPrecisionY[key]))
-                    self.gwObjects[-1].btnAddParam.clicked.connect(
-                        self.gwObjects[-1].changeGlobal)
-                    self.gwObjects[-1].btnAddParam.clicked.connect(
-                        self.insert_parameter_dialog)
-                    self.gwObjects[-1].btnEditParam.clicked.connect(
-                        self.gwObjects[-1].changeGlobal)
-                    self.gwObjects[-1].btnEditParam.clicked.connect(
-                        self.editParaObj)
-                    # TODO we should also probably set the minimum size for the scroll layout
-                    self.gwObjects[-1].setMinimumSize(self.scrollWidth/2, self.scrollHeight/2)
+                    # only the displayed parameters get a graph widget for now
+                    self.gwObjects.append(ParameterModel(self.xScale,
+                                                         self.yScale[key][:],
+                                                         unit, key,
+                                                         self.parVals[key][:],
+                                                         self.parVals['RADI'][:],
+                                                         self.editHistory,
+                                                         self.key, self.numPrecisionX,
+                                                         self.numPrecisionY[key]))
                     if key in self.par:
-                        g_w_to_plot[key] = self.gwObjects[-1]
+                        g_w_to_plot[key] = self.graphWidget(key)
 
                 # retrieve the values in order and build a list of ordered key-value pairs
                 ordered_dict_items = [(key, g_w_to_plot[key]) for key in self.par]
@@ -1272,20 +2504,338 @@ class MainWindow(QtGui.QMainWindow):
                     self.scroll_grid_layout.addWidget(graph_widget, idx, 0)
                 del g_w_to_plot, ordered_dict_items
                 self.runNo+=1
+                self.refreshSharedFigure()
+
+    def runJob(self, job, label, finished, failed=None):
+        """Starts a load or save on ioPool
+
+        Keyword arguments:
+        self --                 main window being displayed i.e. the current
+                                instance of the mainWindow class
+        job (IOJob)--           the job
+        label (str)--           what the job does, shown with its progress
+        finished (function)--   called with the result of the job
+        failed (function)--     called with the exception the job raised (None:
+                                the user is told the job failed)
+
+        Returns:
+        IOJob
+        job, which is also kept in ioJobs until it ends
+
+        The outcome of the job reaches the GUI thread as a queued signal, so the
+        functions are called by the event loop. Jobs run one at a time in the order
+        they were started. Their progress is shown once they've run for
+        progressDelayMs.
+        """
+        queued = QtCore.Qt.QueuedConnection
+        signals = job.signals
+        for signal in (signals.finished, signals.failed, signals.cancelled):
+            signal.connect(functools.partial(self.jobEnded, job), queued)
+        signals.finished.connect(finished, queued)
+        signals.failed.connect(failed or functools.partial(self.jobFailed, label + " failed"),
+                               queued)
+        signals.progress.connect(self.jobProgress, queued)
+        job.label = label
+        self.ioJobs.append(job)
+        self.ioPool.start(job)
+        QtCore.QTimer.singleShot(self.progressDelayMs, self.showJobProgress)
+        return job
+
+    def jobEnded(self, job, *args):
+        if job in self.ioJobs:
+            self.ioJobs.remove(job)
+        if self.ioJobs:
+            self.ioProgress.setFormat(self.ioJobs[0].label + " %p%")
+        else:
+            self.ioProgress.hide()
+            self.ioCancel.hide()
+
+    def jobFailed(self, message, error):
+        logging.warning("{}: {}".format(message, error))
+        QtGui.QMessageBox.information(self, "Information", message)
+
+    def jobProgress(self, permille):
+        self.ioProgress.setValue(permille)
+
+    def showJobProgress(self):
+        if not self.ioJobs or self.ioProgress.isVisible():
+            return
+        self.ioProgress.setFormat(self.ioJobs[0].label + " %p%")
+        self.ioProgress.show()
+        self.ioCancel.show()
+
+    def cancelJobs(self):
+        for job in self.ioJobs:
+            job.cancel()
+
+    def createGraphWidget(self, model):
+        """Creates the graph widget of a parameter
+
+        Keyword arguments:
+        self --                    main window being displayed i.e. the current
+                                   instance of the mainWindow class
+        model (ParameterModel)--   ring data of the parameter
+
+        Returns:
+        GraphWidget
+        with its buttons connected to the main window
+        """
+        graph_widget = model.widget()
+        graph_widget.canvasPool = self.canvasPool
+        graph_widget.repaintScheduler = self.repaintScheduler
+        graph_widget.btnAddParam.clicked.connect(graph_widget.changeGlobal)
+        graph_widget.btnAddParam.clicked.connect(self.insert_parameter_dialog)
+        graph_widget.btnEditParam.clicked.connect(graph_widget.changeGlobal)
+        graph_widget.btnEditParam.clicked.connect(self.editParaObj)
+        # TODO we should also probably set the minimum size for the scroll layout
+        graph_widget.setMinimumSize(self.scrollWidth//2, self.scrollHeight//2)
+        return graph_widget
+
+    def graphWidget(self, par):
+        """Returns the graph widget of a parameter
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        par (str)--     tilted-ring parameter e.g. VROT
+
+        Returns:
+        GraphWidget
+        or None if there's no such parameter
+
+        A parameter held by a ParameterModel gets its graph widget now, which takes
+        the model's place in gwObjects.
+        """
+        for idx, gwObject in enumerate(self.gwObjects):
+            if gwObject.par == par:
+                if isinstance(gwObject, ParameterModel):
+                    gwObject = self.gwObjects[idx] = self.createGraphWidget(gwObject)
+                return gwObject
+        return None
+
+    def recoverJournal(self):
+        """Offers to replay the edits journalled but not saved in a previous session
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+
+        Returns:
+        None
+
+        If the .def file just opened has a journal written for exactly its contents,
+        e.g. because TiRiFiG crashed before the edits were saved, the user is asked
+        whether to apply them. The journal is continued if they were applied and
+        started afresh otherwise; a journal of another version of the file is dropped.
+        """
+        path = journal.journal_path(self.defFile.fileName)
+        resume = False
+        try:
+            fileDigest, records, end = journal.read(path)
+        except (IOError, OSError):
+            fileDigest, records = None, []
+        if records and fileDigest == journal.digest(self.defFile.lines):
+            answer = QtGui.QMessageBox.question(
+                self, "Recover Changes",
+                "{} has changes which weren't saved when TiRiFiG last closed. "
+                "Recover them?".format(os.path.basename(self.defFile.fileName)),
+                QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                QtGui.QMessageBox.Yes)
+            if answer == QtGui.QMessageBox.Yes:
+                self.applyTable(self.defFile.table, journal.replay(path, self.defFile))
+                resume = True
+        self.startJournal(resume)
+
+    def startJournal(self, resume=False):
+        """Starts the journal of the edits of the .def file held in defFile
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        resume (bool)-- whether to continue the journal found next to the file
+
+        Returns:
+        None
+
+        The journal kept so far is removed, so this is also called once the edits
+        have been saved. Edits aren't journalled if the journal can't be written.
+        """
+        if self.editJournal is not None:
+            self.editJournal.discard()
+            self.editJournal = None
+        fileName = self.defFile.fileName
+        try:
+            # synced by journalTimer rather than in the middle of a drag
+            self.editJournal = journal.Journal(journal.journal_path(fileName),
+                                               journal.digest(self.defFile.lines),
+                                               None, resume=resume)
+        except (IOError, OSError) as e:
+            logging.warning("Edits of {} aren't journalled: {}".format(fileName, e))
+
+    def logEdit(self, par, rings, values):
+        """Appends an edit to the journal
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        par (str)--     tilted-ring parameter edited
+        rings--         indices of the rings changed (None: values of all rings)
+        values--        new values of the rings
+
+        Returns:
+        None
+
+        Called by the undo tree whenever the values of a parameter change. The edit
+        is only handed to the operating system here; syncing it to disk is left to
+        journalTimer, or done straight away if there's no timer.
+        """
+        if self.editJournal is None:
+            return
+        try:
+            self.editJournal.edit(par, rings, values)
+        except (IOError, OSError, ValueError) as e:
+            logging.warning("Edits are no longer journalled: {}".format(e))
+            self.editJournal = None
+            return
+        if not self.journalTimer.isActive():
+            self.syncJournal()
+
+    def syncJournal(self):
+        """Syncs the journal to disk
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+
+        Returns:
+        None
+
+        Once the journal has grown too large it's compacted to the current values of
+        the parameters edited instead.
+        """
+        if self.editJournal is None:
+            return
+        try:
+            if self.editJournal.needsCompaction():
+                # every parameter the tree has values of, RADI included
+                self.editJournal.compact(self.editHistory.values)
+            else:
+                self.editJournal.sync()
+        except (IOError, OSError, ValueError) as e:
+            logging.warning("Edits are no longer journalled: {}".format(e))
+            self.editJournal = None
+
+    def historyTargets(self):
+        # the lists the undo tree changes in place along with its own values
+        targets = dict((gwObject.par, gwObject.parVals) for gwObject in self.gwObjects)
+        targets['RADI'] = self.parVals['RADI']
+        return targets
+
+    def historyChanged(self, changed):
+        """Brings the graph widgets up to date after moving in the undo tree
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        changed (list)--  parameters whose values changed
+
+        Returns:
+        None
+
+        Only the graph widgets of the parameters which changed are redrawn, or all of
+        them, with a new x-scale, if RADI changed.
+        """
+        if 'RADI' in changed:
+            self.updateXScale()
+            for gwObject in self.gwObjects:
+                gwObject.parValRADI = self.parVals['RADI'][:]
+                gwObject.xScale = self.xScale
+        for gwObject in self.gwObjects:
+            if gwObject.par in changed or 'RADI' in changed:
+                gwObject.invalidate()
+
+    def updateXScale(self):
+        """Sets xScale from the values of RADI
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+
+        Returns:
+        None
+        """
+        radii = self.parVals['RADI']
+        if np.subtract(max(radii), min(radii)) == 0:
+            self.xScale = [-100, 100]
+        elif (max(radii) - min(radii)) <= 100:
+            self.xScale = [int(ceil(-2 * max(radii))), int(ceil(2 * max(radii)))]
+        else:
+            self.xScale = [int(ceil(min(radii) - 0.1 * (max(radii) - min(radii)))),
+                           int(ceil(max(radii) + 0.1 * (max(radii) - min(radii))))]
 
     def undoCommand(self):
-        global currPar
-        for i in range(len(self.gwObjects)):
-            if self.gwObjects[i].par == currPar:
-                self.gwObjects[i].undoKey()
-                break
+        """Undoes the last edit, whichever parameter it changed
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+
+        Returns:
+        None
+
+        Only the rings the edit changed are put back. The edit isn't lost when
+        another one is made afterwards; it's kept on a branch of the undo tree which
+        switchBranch goes back to.
+        """
+        if self.editHistory is None:
+            return
+        changed = self.editHistory.undo(self.historyTargets())
+        if changed is None:
+            QtGui.QMessageBox.information(self, "Information", "History list is exhausted")
+            return
+        self.historyChanged(changed)
 
     def redoCommand(self):
-        global currPar
-        for i in range(len(self.gwObjects)):
-            if self.gwObjects[i].par == currPar:
-                self.gwObjects[i].redoKey()
-                break
+        if self.editHistory is None:
+            return
+        changed = self.editHistory.redo(self.historyTargets())
+        if changed is None:
+            QtGui.QMessageBox.information(self, "Information", "History list is exhausted")
+            return
+        self.historyChanged(changed)
+
+    def switchBranch(self):
+        """Goes to the tip of another branch of the undo tree
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+
+        Returns:
+        None
+
+        Lists the last edit of every branch, latest first, and walks the undo tree
+        to the one chosen, only changing the rings edited on the way. Undo and redo
+        then follow that branch.
+        """
+        if self.editHistory is None:
+            return
+        tips = self.editHistory.branches()[::-1]
+        if len(tips) < 2:
+            QtGui.QMessageBox.information(self, "Information",
+                                              "There are no other branches of edits")
+            return
+        items = [self.editHistory.describe(tip) +
+                 (" (current)" if tip == self.editHistory.current else "")
+                 for tip in tips]
+        item, ok = QtGui.QInputDialog.getItem(self, "Switch Branch",
+                                                  "Go to the edits ending with:",
+                                                  items, 0, False)
+        if not ok:
+            return
+        changed = self.editHistory.checkout(tips[items.index(item)],
+                                            self.historyTargets())
+        self.historyChanged(changed)
 
     def setRowCol(self):
         text, ok = QtGui.QInputDialog.getText(self, "Window number Input Dialog",
@@ -1297,109 +2847,145 @@ class MainWindow(QtGui.QMainWindow):
                 self.nrows = int(text[0])
                 self.ncols = int(text[1])
                 if (self.nrows * self.ncols) >= len(self.par):
-                    # clear the existing graph objects
-                    item_count = self.scroll_grid_layout.count()
-                    for i in range(item_count):
-                        widget_to_remove = self.scroll_grid_layout.itemAt(0).widget()
-                        self.scroll_grid_layout.removeWidget(widget_to_remove)
-                        widget_to_remove.close()
-
-                    # get only the plot widgets for the we want to plot: defined in par
-                    g_w_to_plot = [gwObject for gwObject in self.gwObjects
-                                   if gwObject.par in self.par]
-                    # retrieve the parameter for each graph widget in the g_w_to_plot list
-                    # self.par for instance contains [VROT, SBR, PA and INCL]
-                    # g_w_pars will also contain a list of parameters but in the order
-                    # of self.gwObjects e.g. new_par = [PA, SBR, VROT, INCL].
-                    # Create a new sorted list of graph widgets based as below:
-                    # loop through self.par [VROT, SBR, PA, INCL]grab the index of the 
-                    # parameter in the new_par list [PA, SBR, VROT, INCL] i.e. 
-                    # index(VROT) in new_par list: 2
-                    # index(SBR) in new_par list: 1
-                    # index(PA) in new_par list: 0
-                    # index(INCL) in new_par list: 3
-                    # Use these indexes to get a sorted list of graph widgets
-                    # from g_w_to_plot for the plotting
-                    g_w_pars = [g_w.par for g_w in g_w_to_plot]
-                    sorted_g_w_to_plot = []
-                    for par in self.par:
-                        idx = g_w_pars.index(par)
-                        sorted_g_w_to_plot.append(g_w_to_plot[idx])
-                    # delete the unordered list of graph widgets
-                    del g_w_to_plot
-
-                    counter = 0
-                    for i in range(self.nrows):
-                        for j in range(self.ncols):
-                            self.scroll_grid_layout.addWidget(
-                                sorted_g_w_to_plot[counter], i, j)
-                            # call the show method on the graphWidget object in order to
-                            # display it
-                            sorted_g_w_to_plot[counter].show()
-                            # don't bother iterating to plot if all the parameters have been
-                            # plotted else you'll get an error
-                            if counter == len(sorted_g_w_to_plot) -1 :
-                                break
-                            counter += 1
-                    del sorted_g_w_to_plot
+                    self.layoutGraphWidgets()
+                    self.refreshSharedFigure()
                 else:
                     QtGui.QMessageBox.information(self, "Information",
                                                   "Product of rows and columns should"
                                                   " match the current number of parameters"
                                                   " on viewgraph")
 
-    def saveFile(self, newVals, sKey, unitMeasurement, numPrecisionX, numPrecisionY):
-        """Save changes made to data points to .def file per specified parameter
+    def layoutGraphWidgets(self):
+        """Places the graph widgets of the displayed parameters on the grid
 
         Keyword arguments:
-        self--  main window being displayed i.e. the current instance of the
-        mainWindow class
-        newVals (list)-- list containing new values
-        sKey (str)-- parameter search key
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
 
         Returns:
         None
 
-        The .def file would be re-opened and updated per the new values that
-        are contained in the parVal* variable
+        The widgets fill nrows x ncols row by row in the order of par. Widgets which
+        stay on the grid are only moved, not closed and shown again, so their plots
+        aren't made again; a canvas is only redrawn if the new layout resizes it, once
+        however many times it's resized before the next tick.
         """
+        displayed = [self.graphWidget(par) for par in self.par]
+        displayed = [gwObject for gwObject in displayed if gwObject is not None]
+        # hidden while the grid is rebuilt, the widgets are resized only once, to
+        # their final size, when it's shown again
+        self.scroll_area_content.hide()
+        while self.scroll_grid_layout.count():
+            widget = self.scroll_grid_layout.takeAt(0).widget()
+            if widget is not None and not any(widget is gw for gw in displayed):
+                widget.close()
+        ncols = max(1, self.ncols)
+        for idx, gwObject in enumerate(displayed):
+            self.scroll_grid_layout.addWidget(gwObject, idx // ncols, idx % ncols)
+            gwObject.show()
+        self.scroll_area_content.show()
+
+    def setSharedFigure(self, shared):
+        """Switches between one figure per parameter and one shared figure
 
-        # get the new values and format it as e.g. [0 20 30 40 50...]
-        txt = ""
-        for i in range(len(newVals)):
-            if sKey == 'RADI':
-                txt = txt+" " +'{0:.{1}E}'.format(newVals[i], numPrecisionX)
-            else:
-                txt = txt+" " +'{0:.{1}E}'.format(newVals[i], numPrecisionY)
-
-        # FIXME (11-06-2018) put this block of code in a try except block
-        tmpFile = []
-        with open(self.fileName, 'a') as f:
-            status = False
-            for i in self.data:
-                lineVals = i.split("=")
-                if len(lineVals) > 1:
-                    lineVals[0] = ''.join(lineVals[0].split())
-                    if sKey == lineVals[0]:
-                        txt = "    "+sKey+"="+txt+"\n"
-                        tmpFile.append(txt)
-                        status = True
-                    else:
-                        tmpFile.append(i)
-                else:
-                    tmpFile.append(i)
+        Keyword arguments:
+        self --          main window being displayed i.e. the current instance of the
+                         mainWindow class
+        shared (bool)--  plot the displayed parameters as subplots of one figure
+
+        Returns:
+        None
+        """
+        self.sharedFigureMode = shared
+        if shared:
+            self.scrollArea.hide()
+            self.refreshSharedFigure()
+            self.sharedScrollArea.show()
+        else:
+            self.sharedScrollArea.hide()
+            self.sharedFigure.clear()
+            # the graph widgets go back to their own canvases as they're shown again
+            self.scrollArea.show()
+            self.canvasPool.request()
+
+    def refreshSharedFigure(self):
+        """Plots the displayed parameters on sharedFigure in the order of par"""
+        if not self.sharedFigureMode:
+            return
+        gwDict = dict((gwObject.par, gwObject) for gwObject in self.gwObjects)
+        panels = [gwDict[par] for par in self.par if par in gwDict]
+        nrows = int(ceil(len(panels) / float(max(1, self.ncols))))
+        self.sharedFigure.setMinimumHeight(nrows * max(self.scrollHeight // 2, 200))
+        self.sharedFigure.setPanels(panels, self.ncols)
+
+    def saveDef(self, fileName, replacements=None, then=None):
+        """Save changes made to data points of all parameters to a .def file
 
-            if not status:
-                tmpFile.append("# "+sKey+" parameter in "+unitMeasurement+"\n")
-                txt = "    "+sKey+"="+txt+"\n"
-                tmpFile.append(txt)
+        Keyword arguments:
+        self--  main window being displayed i.e. the current instance of the
+                mainWindow class
+        fileName (str)--  path of the .def file to be written
+        replacements (dict)--  extra line substitutions e.g. defwriter.RUN_SETTINGS
+        then (function)--  called once the file is written (None: nothing is called)
+
+        Returns:
+        IOJob
+        The job saving the file on ioPool
+
+        The values held by the graph widgets are copied, with a snapshot of defFile,
+        into a job which sets them on the snapshot, keeping a version counter per
+        parameter. Only the lines of parameters that changed since the last save are
+        formatted and substituted, in a single pass, so untouched lines stay
+        byte-identical. The result is written to fileName with one atomic write, so
+        a reader of the file never sees it half-written; nothing is written if the
+        current file wouldn't change. All of this runs in the background; defSaved
+        takes over the result.
+        """
+        values = [(i.par, list(i.parVals),
+                   i.numPrecisionX if i.par == 'RADI' else i.numPrecisionY, i.unitMeas)
+                  for i in self.gwObjects]
+        # RADI has no graph widget, but it's edited in a text editor and undone
+        values.append(('RADI', list(self.parVals['RADI']), self.numPrecisionX,
+                       fit_par['RADI']))
+        snapshot = self.defFile.snapshot()
+        job = IOJob(writeDef, snapshot, values, str(fileName), replacements)
+        version = self.editHistory.current if self.editHistory is not None else None
+        return self.runJob(job, "Saving " + os.path.basename(str(fileName)),
+                           functools.partial(self.defSaved, job, version, then),
+                           functools.partial(self.jobFailed,
+                                             "Could not save {}".format(fileName)))
+
+    def defSaved(self, job, version, then, snapshot):
+        """Takes over the result of a save
+
+        Keyword arguments:
+        self--  main window being displayed i.e. the current instance of the
+                mainWindow class
+        job (IOJob)--      the job which saved the file
+        version (int)--    node of the undo tree the values saved were taken at
+        then (function)--  called once done (None: nothing is called)
+        snapshot (DefFile)--  the snapshot of defFile which was saved
 
-            f.seek(0)
-            f.truncate()
-            for i in tmpFile:
-                f.write(i)
+        Returns:
+        None
 
-            self.data = tmpFile[:]
+        The window now holds the file saved, so a save as only switches files once
+        the new one is written. The journal of unsaved edits is started afresh for
+        it; the parameters edited while the file was being written are journalled
+        again, as they still aren't saved.
+        """
+        METRICS.add('save', job.seconds)
+        self.defFile.merge_saved(snapshot)
+        self.fileName = self.defFile.fileName
+        self.data = self.defFile.lines
+        # everything journalled is in the file now
+        self.startJournal()
+        if self.editHistory is not None and self.editHistory.current != version:
+            for par, parVals in self.historyTargets().items():
+                if not np.array_equal(self.defFile.get(par), parVals):
+                    self.logEdit(par, None, parVals)
+        if then is not None:
+            then()
 
     def saveAll(self):
         """Save changes made to data point to .def file for all parameters
@@ -1411,13 +2997,10 @@ class MainWindow(QtGui.QMainWindow):
         Returns:
         None
 
-        The saveFile function is called and updated with the current values being
+        The saveDef function is called and updated with the current values being
         held by parameters.
         """
-        for i in self.gwObjects:
-            self.saveFile(i.parVals, i.par, i.unitMeas, i.numPrecisionX, i.numPrecisionY)
-
-        self.saveMessage()
+        self.saveDef(self.fileName, then=self.saveMessage)
 
     def saveMessage(self):
         """Displays the information about save action
@@ -1434,62 +3017,6 @@ class MainWindow(QtGui.QMainWindow):
         QtGui.QMessageBox.information(self, "Information",
                                       "Changes successfully written to file")
 
-    def saveAs(self, fileName, newVals, sKey, unitMeasurement, numPrecisionX,
-               numPrecisionY):
-        """Creates a new .def file with current data points on viewgraph
-
-        Keyword arguments:
-        self--  main window being displayed i.e. the current instance of the
-                mainWindow class
-        fileName--  filePath where new file should be saved to
-        newVals (list)--    list containing new values
-        sKey (str)--    parameter search key
-
-        Returns:
-        None
-
-        A new .def file would be created and placed in the specified file path
-        """
-
-        # get the new values and format it as [0 20 30 40 50...]
-        txt = ""
-        for i in range(len(newVals)):
-            if sKey == 'RADI':
-                txt = txt+" " +'{0:.{1}E}'.format(newVals[i], numPrecisionX)
-            else:
-                txt = txt+" " +'{0:.{1}E}'.format(newVals[i], numPrecisionY)
-
-        tmpFile = []
-
-        if not fileName == None:
-            with open(fileName, 'a') as f:
-                status = False
-                for i in self.data:
-                    lineVals = i.split("=")
-                    if len(lineVals) > 1:
-                        lineVals[0] = ''.join(lineVals[0].split())
-                        if sKey == lineVals[0]:
-                            txt = "    "+sKey+"="+txt+"\n"
-                            tmpFile.append(txt)
-                            status = True
-                        else:
-                            tmpFile.append(i)
-                    else:
-                        tmpFile.append(i)
-
-                if not status:
-                    tmpFile.append("# "+sKey+" parameter in "+unitMeasurement+"\n")
-                    txt = "    "+sKey+"="+txt+"\n"
-                    tmpFile.append(txt)
-
-                f.seek(0)
-                f.truncate()
-                for i in tmpFile:
-                    f.write(i)
-
-                self.data = tmpFile[:]
-                self.fileName = fileName
-
     def saveAsMessage(self):
         """Displays the information about save action
 
@@ -1515,31 +3042,48 @@ class MainWindow(QtGui.QMainWindow):
         Returns:
         None
 
-        The saveAs function is called and updated with the current values being
+        The saveDef function is called and updated with the current values being
         held by parameters.
         """
         fileName = QtGui.QFileDialog.getSaveFileName(self, "Save .def file as ",
                                                      os.getcwd(),
                                                      ".def Files (*.def)")
-        for i in self.gwObjects:
-            self.saveAs(fileName, i.parVals, i.par, i.unitMeas, i.numPrecisionX,
-                        i.numPrecisionY)
+        if not fileName:
+            return
+        self.saveDef(fileName, then=self.saveAsMessage)
 
-        self.saveAsMessage()
-
-    def slotChangeData(self, fileName):
+    @timed_method('reload', panelAttr=None)
+    def slotChangeData(self, fileName, parsed=None):
         global fit_par
-        with open(fileName) as f:
-            self.data = f.readlines()
-
-        self.getParameter(self.data)
-
-        # counter = 0
-        for i in fit_par.keys():
-            for j in self.gwObjects:
-                if j.par == i:
-                    j.parVals = self.parVals[i][:]
-                    j.parValRADI = self.parVals['RADI'][:]
+        if parsed is None:
+            with open(fileName) as f:
+                self.data = f.readlines()
+        else:
+            # read and parsed by fileWatcher: (lines, previous, table, changed)
+            self.data = parsed[0]
+            parsed = parsed[1:]
+
+        # only the lines edited since the file was last parsed are read again and
+        # only the graph widgets whose values changed are redrawn
+        changed = self.defFile.reparse(self.data, fit_par.keys(), parsed)
+        # the journal has to match the file as the text editor left it; the edits
+        # made here since it was saved for the editor and not overwritten by the
+        # reload still aren't in it
+        self.startJournal()
+        for par, parVals in self.historyTargets().items():
+            if (par not in changed and par in self.defFile and
+                    not np.array_equal(self.defFile.get(par), parVals)):
+                self.logEdit(par, None, parVals)
+        self.applyTable(self.defFile.table, changed)
+        if not changed:
+            return
+        radiChanged = 'RADI' in changed
+
+        for j in self.gwObjects:
+            if j.par in changed and j.par in self.parVals:
+                j.parVals = self.parVals[j.par][:]
+            if radiChanged:
+                j.parValRADI = self.parVals['RADI'][:]
 
         # FIXME(Samuel 11-06-2018):
         # the comments below will probably be important to keep/implement
@@ -1556,25 +3100,20 @@ class MainWindow(QtGui.QMainWindow):
         #    for i in range(int(diff)):
         #        self.parVals[self.par].append(self.parVals[self.par][lastItemIndex])
 
-        # defining the x and y scale for plotting
-        if (np.subtract(max(self.gwObjects[0].parValRADI),
-                        min(self.gwObjects[0].parValRADI)) == 0):
-            self.xScale = [-100, 100]
-        elif ((max(self.gwObjects[0].parValRADI) -
-               min(self.gwObjects[0].parValRADI)) <= 100):
-            self.xScale = [int(ceil(-2 * max(self.gwObjects[0].parValRADI))),
-                           int(ceil(2 * max(self.gwObjects[0].parValRADI)))]
-        else:
-            self.xScale = [int(ceil(min(self.gwObjects[0].parValRADI) -
-                                    0.1 * (max(self.gwObjects[0].parValRADI) -
-                                           min(self.gwObjects[0].parValRADI)))),
-                           int(ceil(max(self.gwObjects[0].parValRADI) +
-                                    0.1 * (max(self.gwObjects[0].parValRADI) -
-                                           min(self.gwObjects[0].parValRADI))))]
+        # defining the x and y scale for plotting, the x scale only depends on RADI
+        if radiChanged:
+            self.updateXScale()
+
+        # the edits made in the text editor can be undone as one
+        edits = dict((i.par, i.parVals) for i in self.gwObjects
+                     if i.par in changed)
+        if radiChanged:
+            edits['RADI'] = self.parVals['RADI']
+        self.editHistory.record(edits, "edited in text editor")
 
         for i in self.gwObjects:
-            if not i.historyList[len(i.historyList)-1] == i.parVals[:]:
-                i.historyList.append(i.parVals[:])
+            if not (radiChanged or i.par in changed):
+                continue
 
             i.xScale = self.xScale
             if np.subtract(max(i.parVals), min(i.parVals)) == 0:
@@ -1587,37 +3126,69 @@ class MainWindow(QtGui.QMainWindow):
                                      0.1 * (max(i.parVals) - min(i.parVals)))),
                             int(ceil(max(i.parVals) + 0.1 * (max(i.parVals) -
                                                              min(i.parVals))))]
-            i.firstPlot()
+            i.invalidate()
+
+    def watchSnapshot(self):
+        if self.defFile is None:
+            return None, ()
+        return self.defFile.table, fit_par.keys()
+
+    def fileChanged(self, fileName, result):
+        """Shows the edits fileWatcher parsed
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        fileName (str)--  path of the file edited
+        result (tuple)--  (lines, previous, table, changed, notified) from fileWatcher
 
-    def animate(self):
-        if os.path.isfile(self.tmpDeffile):
-            after = os.stat(self.tmpDeffile).st_mtime
-            if self.before != after:
-                self.before = after
-                self.slotChangeData(self.tmpDeffile)
+        Returns:
+        None
+
+        The time from the first notification of the edit to the graph widgets being
+        brought up to date goes into METRICS as editLatency.
+        """
+        if fileName != self.fileName or self.defFile is None:
+            return
+        self.slotChangeData(fileName, result[:4])
+        if result[4] is not None:
+            METRICS.add('editLatency', clock() - result[4])
+
+    def watchFailed(self, fileName, message):
+        logging.warning("{} could not be parsed after it was edited: {}"
+                        .format(fileName, message))
 
     def openEditor(self):
         text, ok = QtGui.QInputDialog.getText(self, "Text Editor Input Dialog",
                                               "Enter text editor:")
         if ok:
 
-            for i in self.gwObjects:
-                self.saveAs(self.tmpDeffile, i.parVals, i.par, i.unitMeas,
-                            i.numPrecisionX, i.numPrecisionY)
+            self.saveDef(self.tmpDeffile,
+                         then=functools.partial(self.startEditor, str(text)))
 
-            if text:
-                programName = str(text)
-                try:
-                    run([programName, self.tmpDeffile])
-                except OSError:
-                    QtGui.QMessageBox.information(self, "Information",
-                                                  "{} is not installed or configured"
-                                                  "properly on this system.".format(programName))
-            else:
-                # assign current modified time of temporary def file to before
-                self.before = os.stat(self.tmpDeffile).st_mtime
-                self.t = TimerThread(1, self.animate)
-                self.t.start()
+    def startEditor(self, programName):
+        """Starts the text editor once the file to be edited is saved
+
+        Keyword arguments:
+        self --         main window being displayed i.e. the current instance of the
+                        mainWindow class
+        programName (str)--  the text editor (empty: the file is edited with an
+                             editor started by the user)
+
+        Returns:
+        None
+        """
+        if programName:
+            try:
+                run([programName, self.tmpDeffile])
+            except OSError:
+                QtGui.QMessageBox.information(
+                    self, "Information",
+                    "{} is not installed or configured properly on this system."
+                    .format(programName))
+                return
+        # the viewgraph follows the edits saved in the text editor
+        self.fileWatcher.watch(self.tmpDeffile)
 
     def inProgress(self):
         """Displays the information about feature under development
@@ -1629,6 +3200,10 @@ class MainWindow(QtGui.QMainWindow):
         self.sm = SMWindow(self.par, self.xScale, self.gwObjects)
         self.sm.show()
 
+    def metricsObj(self):
+        self.metricsWindow = MetricsWindow()
+        self.metricsWindow.show()
+
     def paramDef(self):
         global currPar, fit_par, selected_option
         user_input = self.ps.parameter.currentText()
@@ -1671,32 +3246,25 @@ class MainWindow(QtGui.QMainWindow):
                 zeroVals = [0.0] * self.NUR
                 self.parVals[tilted_ring_par] = zeroVals[:]
                 del zeroVals
-                self.historyList[tilted_ring_par] = (
-                    [self.parVals[tilted_ring_par][:]])
                 self.yScale[tilted_ring_par] = [-100, 100]
                 fit_par[tilted_ring_par] = unitMeas
                 self.gwObjects.insert(parIndex,
-                                      GraphWidget(self.xScale,
-                                                  self.yScale[tilted_ring_par],
-                                                  unitMeas,
-                                                  tilted_ring_par,
-                                                  self.parVals[tilted_ring_par],
-                                                  self.parVals['RADI'],
-                                                  self.historyList[tilted_ring_par],
-                                                  "Yes",
-                                                  self.numPrecisionX,
-                                                  1))
-                self.gwObjects[parIndex].setMinimumSize(self.scrollWidth/2,
-                                                        self.scrollHeight/2)
-                self.gwObjects[parIndex].btnAddParam.clicked.connect(
-                    self.gwObjects[parIndex].changeGlobal)
-                self.gwObjects[parIndex].btnAddParam.clicked.connect(
-                    self.insert_parameter_dialog)
-                self.gwObjects[parIndex].btnEditParam.clicked.connect(
-                    self.gwObjects[parIndex].changeGlobal)
-                self.gwObjects[parIndex].btnEditParam.clicked.connect(
-                    self.editParaObj)
+                                      ParameterModel(self.xScale,
+                                                     self.yScale[tilted_ring_par],
+                                                     unitMeas,
+                                                     tilted_ring_par,
+                                                     self.parVals[tilted_ring_par],
+                                                     self.parVals['RADI'],
+                                                     self.editHistory,
+                                                     "Yes",
+                                                     self.numPrecisionX,
+                                                     1))
+                self.editHistory.add(tilted_ring_par, self.parVals[tilted_ring_par])
+                # the journal has to know the new parameter to replay its edits
+                self.logEdit(tilted_ring_par, None, self.parVals[tilted_ring_par])
                 del list_of_t_r_p
+            # the parameter is about to be displayed so it needs its graph widget
+            self.graphWidget(tilted_ring_par)
 
             self.nrows = self.scroll_grid_layout.rowCount()
             self.ncols = self.scroll_grid_layout.columnCount()
@@ -1721,37 +3289,9 @@ class MainWindow(QtGui.QMainWindow):
             else:
                 self.nrows += 1
         
-                for i in range(item_count):
-                    widget_to_remove = self.scroll_grid_layout.itemAt(0).widget()
-                    self.scroll_grid_layout.removeWidget(widget_to_remove)
-                    widget_to_remove.close()
-                
-                # get only the plot widgets for the we want to plot: defined in par
-                    g_w_to_plot = [gwObject for gwObject in self.gwObjects
-                                   if gwObject.par in self.par]
-                    g_w_pars = [g_w.par for g_w in g_w_to_plot]
-                    sorted_g_w_to_plot = []
-                    for par in self.par:
-                        idx = g_w_pars.index(par)
-                        sorted_g_w_to_plot.append(g_w_to_plot[idx])
-                    # delete the unordered list of graph widgets
-                    del g_w_to_plot
-
-                    counter = 0
-                    for i in range(self.nrows):
-                        for j in range(self.ncols):
-                            self.scroll_grid_layout.addWidget(
-                                sorted_g_w_to_plot[counter], i, j)
-                            # call the show method on the graphWidget object in order to
-                            # display it
-                            sorted_g_w_to_plot[counter].show()
-                            # don't bother iterating to plot if all the parameters have been
-                            # plotted else you'll get an error
-                            if counter == len(sorted_g_w_to_plot) - 1 :
-                                break
-                            counter += 1
-                    del sorted_g_w_to_plot
+                self.layoutGraphWidgets()
 
+            self.refreshSharedFigure()
             self.ps.close()
 
     def editParamDef(self):
@@ -1777,8 +3317,7 @@ class MainWindow(QtGui.QMainWindow):
                             graph_widget.unitMeas = unitMeas
                             break
 
-                g_w_to_plot = [gwObject for gwObject in self.gwObjects
-                               if gwObject.par == user_input]
+                g_w_to_plot = [self.graphWidget(user_input)]
                 curr_par_position_on_layout = (
                     self.scroll_grid_layout.getItemPosition(parIndex))
                 row_number = curr_par_position_on_layout[0]
@@ -1846,46 +3385,6 @@ class MainWindow(QtGui.QMainWindow):
                                       "Data cube ("+self.INSET+") specified at INSET"
                                       " doesn't exist in specified directory.")
 
-    def progressBar(self, cmd):
-        progress = QtGui.QProgressDialog("Operation in progress...",
-                                         "Cancel", 0, 100)
-        progress.setWindowModality(QtCore.Qt.WindowModal)
-        progress.setMaximum(self.loops*1e6)
-        progress.resize(500, 100)
-        prev = 1
-        message = "Stopped"
-        completed = int(prev * 1e6) / 2
-        status = 'running'
-        progress.show()
-        time.sleep(10)
-        while cmd.poll() is None and status == 'running':
-            with open(self.progressPath, 'r') as f:
-                data = f.readlines()
-                for i in data:
-                    lin = i.split(" ")
-                    if 'L:' in lin[0].upper():
-                        count = lin[0].split(":")
-                        count = count[1].split("/")
-                        if int(count[0]) > prev:
-                            if int(count[0]) == self.loops:
-                                completed += 0.0001
-                            else:
-                                prev = int(count[0])
-                                completed = prev * 1e6
-                        else:
-                            completed += 0.0001
-                    elif "finish" in lin[0].lower():
-                        status = 'finished'
-                        progress.setValue(self.loops * 1e6)
-                        message = i
-                        break
-            progress.setValue(completed)
-            if progress.wasCanceled():
-                cmd.kill()
-                break
-        progress.setValue(self.loops * 1e6)
-        QtGui.QMessageBox.information(self, "Information", message)
-
     def startTiriFiC(self):
         """Start TiRiFiC
 
@@ -1896,56 +3395,72 @@ class MainWindow(QtGui.QMainWindow):
         Returns:
         None
 
-        Calls the os.system and opens terminal to start TiRiFiC
+        Saves the .def file with the settings TiRiFiC needs to fit without prompting
+        and starts it once the file is written, unless it's running already
         """
+        if self.fitProcess.running():
+            QtGui.QMessageBox.information(self, "Information", "TiRiFiC is already running.")
+            return
         fitsfilePath = os.getcwd()
         fitsfilePath = fitsfilePath + "/" + self.INSET
         if os.path.isfile(fitsfilePath):
-            for i in self.gwObjects:
-                self.saveFile(
-                    i.parVals, i.par, i.unitMeas, i.numPrecisionX, i.numPrecisionY)
-
-            tmpFile = []
-            with open(self.fileName, 'a') as f:
-                for i in self.data:
-                    lineVals = i.split("=")
-                    if len(lineVals) > 1:
-                        lineVals[0] = ''.join(lineVals[0].split())
-                        if lineVals[0] == "ACTION":
-                            tmpFile.append("ACTION = 1\n")
-                        elif lineVals[0] == "PROMPT":
-                            tmpFile.append("PROMPT = 0\n")
-                        elif lineVals[0] == "GR_DEVICE":
-                            tmpFile.append(i)
-                            tmpFile.append("GR_CONT = \n")
-                        elif lineVals[0] == "PROGRESSLOG":
-                            tmpFile.append("PROGRESSLOG = progress\n")
-                        elif lineVals[0] == "GR_CONT":
-                            pass
-                        else:
-                            tmpFile.append(i)
-                    else:
-                        tmpFile.append(i)
-
-                f.seek(0)
-                f.truncate()
-                for i in tmpFile:
-                    f.write(i)
-            try:
-                cmd = run(["tirific", "deffile=", self.fileName])
-            except OSError:
-                QtGui.QMessageBox.information(self, "Information",
-                                              "TiRiFiC is not installed or configured"
-                                              " properly on system.")
-            else:
-                self.progressPath = str(self.fileName)
-                self.progressPath = self.progressPath.split('/')
-                self.progressPath[-1] = 'progress'
-                self.progressPath = '/'.join(self.progressPath)
-                self.progressBar(cmd)
+            self.saveDef(self.fileName, defwriter.RUN_SETTINGS, then=self.runTiriFiC)
         else:
             self.tirificMessage()
 
+    def runTiriFiC(self):
+        """Runs TiRiFiC on the .def file once it's saved with the run settings
+
+        Keyword arguments:
+        self--  main window being displayed i.e. the current instance of
+        the mainWindow class
+
+        Returns:
+        None
+
+        TiRiFiC runs alongside the window, which shows how far it has got in a dialog
+        that doesn't block the rest of the window; Stop in the dialog kills TiRiFiC.
+        """
+        # TiRiFiC writes its progress log (PROGRESSLOG) to the working directory
+        self.progressPath = os.path.join(os.getcwd(), 'progress')
+        self.fitProgress = QtGui.QProgressDialog("Starting TiRiFiC...", "Stop", 0,
+                                                 self.loops, self)
+        self.fitProgress.setWindowTitle("TiRiFiC")
+        self.fitProgress.setWindowModality(QtCore.Qt.NonModal)
+        self.fitProgress.setAutoClose(False)
+        self.fitProgress.setAutoReset(False)
+        self.fitProgress.setMinimumDuration(0)
+        self.fitProgress.resize(500, 100)
+        self.fitProgress.canceled.connect(self.fitProcess.kill)
+        self.fitProcess.start(self.fileName, self.progressPath)
+        self.fitProgress.setValue(0)
+        self.fitProgress.show()
+
+    def fitProgressed(self, loopNo):
+        if self.fitProgress is None:
+            return
+        self.fitProgress.setLabelText("Fitting loop {} of {}".format(loopNo, self.loops))
+        # the loops before this one are done
+        self.fitProgress.setValue(min(loopNo - 1, self.loops))
+
+    def closeFitProgress(self):
+        if self.fitProgress is not None:
+            self.fitProgress.canceled.disconnect(self.fitProcess.kill)
+            self.fitProgress.close()
+            self.fitProgress.deleteLater()
+            self.fitProgress = None
+
+    def fitFinished(self, message):
+        self.closeFitProgress()
+        QtGui.QMessageBox.information(self, "Information", message)
+
+    def fitFailed(self, error):
+        self.closeFitProgress()
+        logging.warning("TiRiFiC could not be started: {}".format(error))
+        QtGui.QMessageBox.information(self, "Information",
+                                      "TiRiFiC is not installed or configured"
+                                      " properly on system.")
+
 def logWarnings():
     # logging.captureWarnings(True)
     # logging.basicConfig(filename='test.log', format='%(asctime)s %(name)s %(levelname)s %(message)s',
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""Micro-benchmark of formatting the values of a parameter for a .def file.
+
+Compares the string concatenation saveFile/saveAs used to build a line with
+defwriter.format_values at NUR = 100, 1 000 and 10 000 and checks that both produce
+the same text.
+
+usage:
+    python benchmarks/bench_format.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TiRiFiG.core import defwriter
+
+PRECISION = 5
+REPEAT = 5
+
+
+def concat_format(newVals, numPrecision):
+    """The loop saveFile and saveAs used before format_values"""
+    txt = ""
+    for i in range(len(newVals)):
+        txt = txt+" " +'{0:.{1}E}'.format(newVals[i], numPrecision)
+    return txt
+
+
+def best_of(func, number):
+    return min(timeit.repeat(func, repeat=REPEAT, number=number)) / number
+
+
+def main():
+    rng = np.random.RandomState(0)
+    print("{0:>6} {1:>14} {2:>14} {3:>8}".format("NUR", "loop (ms)", "vector (ms)",
+                                                  "speed-up"))
+    for nur in (100, 1000, 10000):
+        values = rng.uniform(-300, 300, nur)
+        newVals = values.tolist()
+        assert concat_format(newVals, PRECISION) == defwriter.format_values(values,
+                                                                            PRECISION)
+        number = max(1, 100000 // nur)
+        loop = best_of(lambda: concat_format(newVals, PRECISION), number)
+        vector = best_of(lambda: defwriter.format_values(values, PRECISION), number)
+        print("{0:>6} {1:>14.4f} {2:>14.4f} {3:>7.1f}x".format(nur, loop * 1e3,
+                                                              vector * 1e3,
+                                                              loop / vector))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""Benchmark of interactive editing in the GUI on synthetic .def files.
+
+Builds .def files with NUR from 10 to 10 000 rings and 4 to 100 tilted-ring parameters
+and drives the main window under the offscreen Qt platform, timing
+
+    open        openDef reading and parsing the file
+    firstPlot   until the displayed parameters are drawn after opening
+    drag        a point dragged through getClick/getMotion/getRelease by mouse
+                events sent to the canvas, until the last frame is drawn
+    undo, redo  undoCommand and redoCommand of the drags
+    scale       the Scale Manager updating the scales of all displayed parameters
+    relayout    setRowCol changing the number of rows and columns
+    reload      a value changed in the file opened in a text editor, from the write
+                until it's drawn
+    save        saveAll writing changed values to the file
+    saveAs      saveAsAll writing all values to a new file
+
+Every timing runs until the event loop has nothing left to draw, so deferred
+redraws are included. Each file is opened in a fresh process, since the main window
+keeps state in class variables. The dialogs the actions open are answered by the
+benchmark; messages they would show are recorded instead.
+
+The results are written as JSON with the commit, library versions and settings, so
+runs of different commits can be compared, e.g.
+
+    python benchmarks/bench_gui.py -o before.json
+    git checkout other-branch
+    python benchmarks/bench_gui.py -o after.json --compare before.json
+
+usage:
+    python benchmarks/bench_gui.py [--nur 10 100 1000 10000] [--params 4 20 100]
+                                   [--repeat 5] [--moves 50] [-o results.json]
+                                   [--compare baseline.json]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+FORMAT_VERSION = 1
+OPERATIONS = ('open', 'firstPlot', 'drag', 'undo', 'redo', 'scale', 'relayout',
+              'reload', 'save', 'saveAs')
+# the keys TiRiFiC uses for a disc; further discs add _2, _3, ... to them
+DISC_KEYS = ('VROT', 'SBR', 'INCL', 'PA', 'Z0', 'SDIS', 'XPOS', 'YPOS', 'VSYS', 'DVRO',
+             'DVRA', 'VRAD')
+# parameter plotted in the drag, undo and redo timings
+EDITED = 'VROT'
+SETTLE_TIMEOUT = 120.0
+
+
+def parameter_names(count):
+    """Returns count tilted-ring parameter names, filling one disc after the other"""
+    names = []
+    disc = 1
+    while len(names) < count:
+        suffix = '' if disc == 1 else '_{}'.format(disc)
+        names.extend(key + suffix for key in DISC_KEYS)
+        disc += 1
+    return names[:count]
+
+
+def make_def(fileName, nur, params, seed=0):
+    """Writes a synthetic .def file
+
+    Keyword arguments:
+    fileName (str)--  path of the file to write
+    nur (int)--       number of rings
+    params (int)--    number of tilted-ring parameters besides RADI, at least 4 so
+                      that the parameters the GUI displays are there
+    seed (int)--      seed of the noise added to the values
+
+    Returns:
+    None
+    """
+    rng = np.random.RandomState(seed)
+    radi = np.linspace(0.0, 600.0, nur)
+    scale = radi / 120.0
+    profiles = {'VROT': 220.0 * (1.0 - np.exp(-scale)),
+                'SBR': 1e-3 * np.exp(-scale / 2.0),
+                'INCL': 60.0 - 10.0 * np.tanh(scale - 2.0),
+                'PA': 170.0 + 30.0 * np.tanh(scale - 2.0)}
+    lines = ["LOGNAME= data.log\n", "ACTION= 1\n", "PROMPT= 1\n", "NCORES= 4\n", "\n",
+             "INSET= galaxy.fits\n", "OUTSET= galaxy_out.fits\n", "PROGRESSLOG=\n",
+             "TEXTLOG=\n", "\n", "NDISKS= {}\n".format((params - 1) // len(DISC_KEYS) + 1),
+             "NUR= {}\n".format(nur)]
+    columns = [('RADI', radi)]
+    for idx, name in enumerate(parameter_names(params)):
+        base = profiles.get(name.split('_')[0], 10.0 + idx + np.cos(scale + idx))
+        columns.append((name, base * (1.0 + 0.01 * rng.standard_normal(nur))))
+    for name, values in columns:
+        lines.append("{0:>8}= {1}\n".format(
+            name, ' '.join('{:+.5E}'.format(value) for value in values)))
+    lines.extend(["\n", "LOOPS= 5\n", "FITMODE= 2\n"])
+    with open(fileName, 'w') as f:
+        f.writelines(lines)
+
+
+def summarise(samples):
+    """Returns the samples in milliseconds with their minimum, median and maximum"""
+    ms = [seconds * 1e3 for seconds in samples]
+    if not ms:
+        return {'samples_ms': [], 'min_ms': None, 'median_ms': None, 'max_ms': None}
+    return {'samples_ms': [round(value, 3) for value in ms],
+            'min_ms': round(min(ms), 3),
+            'median_ms': round(float(np.median(ms)), 3),
+            'max_ms': round(max(ms), 3)}
+
+
+class Session(object):
+    """The main window with a .def file open, driven without a user
+
+    Instance variables:
+        launcher   (module):      qt5_launcher or qt4_launcher.
+        app        (QApplication): the application.
+        window     (MainWindow):  the main window.
+        messages   (list):        texts of the message boxes that would have shown.
+        answers    (dictionary):  answer of the next file or input dialog.
+
+    Functions:
+        settle:        runs the event loop until nothing is left to draw.
+        timed:         times a function together with the redraws it leaves behind.
+        drag:          drags a point of a parameter with mouse events.
+    """
+
+    def __init__(self):
+        try:
+            from PyQt5 import QtCore, QtGui, QtWidgets
+            from TiRiFiG import qt5_launcher as launcher
+        except ImportError:
+            from PyQt4 import QtCore, QtGui
+            QtWidgets = QtGui
+            from TiRiFiG import qt4_launcher as launcher
+        self.QtCore, self.QtGui, self.QtWidgets = QtCore, QtGui, QtWidgets
+        self.launcher = launcher
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        self.messages = []
+        self.answers = {}
+        self._answerDialogs()
+        self.window = None
+
+    def _answerDialogs(self):
+        QtWidgets = self.QtWidgets
+        session = self
+
+        def information(parent, title, text, *args, **kwargs):
+            session.messages.append(str(text))
+            return QtWidgets.QMessageBox.Ok
+
+        def answer(kind):
+            def dialog(*args, **kwargs):
+                return session.answers.pop(kind)
+            return staticmethod(dialog)
+
+        QtWidgets.QMessageBox.information = staticmethod(information)
+        QtWidgets.QFileDialog.getOpenFileName = answer('open')
+        QtWidgets.QFileDialog.getSaveFileName = answer('save')
+        QtWidgets.QInputDialog.getText = answer('text')
+
+    def _busy(self):
+        window = self.window
+        schedulers = [window.canvasPool.scheduler, window.repaintScheduler.scheduler]
+        canvases = [window.sharedFigure.canvas]
+        for gwObject in window.gwObjects:
+            if isinstance(gwObject, self.launcher.GraphWidget):
+                schedulers.append(gwObject.renderScheduler)
+                if gwObject.canvas is not None:
+                    canvases.append(gwObject.canvas)
+        return (bool(window.ioJobs) or
+                any(scheduler.timer.isActive() for scheduler in schedulers) or
+                any(getattr(canvas, '_draw_pending', False) for canvas in canvases))
+
+    def settle(self):
+        """Runs the event loop until no redraw is pending or scheduled"""
+        deadline = time.time() + SETTLE_TIMEOUT
+        idle = 0
+        while idle < 2:
+            self.app.processEvents()
+            idle = 0 if self._busy() else idle + 1
+            if time.time() > deadline:
+                raise RuntimeError("the GUI kept redrawing for {} s".format(SETTLE_TIMEOUT))
+            if idle == 0:
+                time.sleep(0.0005)
+
+    def redraws(self):
+        counts = {'fullRedraw': 0, 'partialRedraw': 0}
+        for (panel, name), count in self.launcher.METRICS.counters.items():
+            if name in counts:
+                counts[name] += count
+        return counts
+
+    def timed(self, func, *args):
+        """Times func(*args) and the redraws it leaves behind
+
+        Returns:
+        tuple
+        (seconds, number of full redraws, number of partial redraws)
+        """
+        before = self.redraws()
+        start = time.time()
+        func(*args)
+        self.settle()
+        seconds = time.time() - start
+        after = self.redraws()
+        return (seconds, after['fullRedraw'] - before['fullRedraw'],
+                after['partialRedraw'] - before['partialRedraw'])
+
+    def open(self, fileName, width=1280, height=960):
+        """Creates the main window and opens fileName; returns (open, firstPlot) times"""
+        self.window = self.launcher.MainWindow()
+        self.window.resize(width, height)
+        self.settle()
+        self.answers['open'] = (fileName, '.def Files (*.def)')
+        start = time.time()
+        self.window.openDef()
+        # the file is loaded in the background; it's shown once the job ends
+        while self.window.ioJobs:
+            self.app.processEvents()
+            time.sleep(0.0005)
+        opened = time.time() - start
+        self.settle()
+        if self.window.defFile is None:
+            raise RuntimeError("could not open {}: {}".format(fileName, self.messages))
+        return opened, time.time() - start - opened
+
+    def drag(self, par, ring, shift, moves):
+        """Drags ring of par up by shift times the height of its axes in moves steps"""
+        QtCore, QtGui, QtWidgets = self.QtCore, self.QtGui, self.QtWidgets
+        gwObject = self.window.graphWidget(par)
+        canvas, ax = gwObject.canvas, gwObject.ax
+        if canvas is None:
+            raise RuntimeError("{} has no canvas to drag on".format(par))
+        x, y = gwObject.parValRADI[ring], gwObject.parVals[ring]
+        bottom, top = ax.get_ylim()
+        ratio = getattr(canvas, 'device_pixel_ratio', 1) or 1
+
+        def send(kind, value, button, buttons):
+            X, Y = ax.transData.transform((x, value))
+            pos = QtCore.QPointF(X / ratio, canvas.height() - Y / ratio)
+            QtWidgets.QApplication.sendEvent(
+                canvas, QtGui.QMouseEvent(kind, pos, button, buttons,
+                                          QtCore.Qt.NoModifier))
+
+        send(QtCore.QEvent.MouseButtonPress, y, QtCore.Qt.LeftButton,
+             QtCore.Qt.LeftButton)
+        step = shift * (top - bottom) / moves
+        for move in range(1, moves + 1):
+            send(QtCore.QEvent.MouseMove, y + move * step, QtCore.Qt.NoButton,
+                 QtCore.Qt.LeftButton)
+            self.app.processEvents()
+        send(QtCore.QEvent.MouseButtonRelease, y + moves * step, QtCore.Qt.LeftButton,
+             QtCore.Qt.NoButton)
+
+    def edit(self, fileName, par, ring, value):
+        """Changes ring of par in fileName as a text editor would and waits for it"""
+        from TiRiFiG.core import deffile
+        gwObject = self.window.graphWidget(par)
+        old = gwObject.parVals[ring]
+        defFile = deffile.load(fileName)
+        defFile.set(par, value, rings=ring)
+        defFile.save()
+        deadline = time.time() + SETTLE_TIMEOUT
+        while gwObject.parVals[ring] == old:
+            if time.time() > deadline:
+                raise RuntimeError("the edit of {} was not picked up".format(par))
+            self.app.processEvents()
+            time.sleep(0.0005)
+
+
+def run_case(nur, params, repeat, moves, workDir, seed=0):
+    """Runs all timings on one synthetic .def file in this process
+
+    Returns:
+    dict
+    nur, params, size of the file, the summary of each timing with the full and
+    partial redraws it caused, errors and messages the GUI would have shown
+    """
+    fileName = os.path.join(workDir, 'bench_{}_{}.def'.format(nur, params))
+    make_def(fileName, nur, params, seed)
+    session = Session()
+    metrics = session.launcher.METRICS
+    metrics.reset()
+    samples = dict((op, []) for op in OPERATIONS)
+    redraws = dict((op, [0, 0]) for op in OPERATIONS)
+    errors = {}
+
+    def record(op, func, *args):
+        if op in errors:
+            return
+        try:
+            seconds, full, partial = session.timed(func, *args)
+        except Exception as e:
+            errors[op] = "{}: {}".format(type(e).__name__, e)
+            return
+        samples[op].append(seconds)
+        redraws[op][0] += full
+        redraws[op][1] += partial
+
+    try:
+        opened, plotted = session.open(fileName)
+        samples['open'].append(opened)
+        samples['firstPlot'].append(plotted)
+        counts = session.redraws()
+        redraws['firstPlot'] = [counts['fullRedraw'], counts['partialRedraw']]
+    except Exception as e:
+        errors['open'] = "{}: {}".format(type(e).__name__, e)
+        return {'nur': nur, 'params': params, 'errors': errors}
+    window = session.window
+    launcher = session.launcher
+
+    rings = np.linspace(0, nur - 1, repeat + 2).astype(int)[1:-1]
+    for idx, ring in enumerate(rings):
+        record('drag', session.drag, EDITED, int(ring), 0.2 if idx % 2 else -0.2, moves)
+
+    for _ in range(repeat):
+        record('undo', window.undoCommand)
+    for _ in range(repeat):
+        record('redo', window.redoCommand)
+
+    xScale = list(window.xScale)
+    manager = launcher.SMWindow(window.par, window.xScale, window.gwObjects)
+    for idx in range(repeat):
+        zoom = (xScale[1] - xScale[0]) // 4 if idx % 2 == 0 else 0
+        manager.xMin.setText(str(xScale[0] + zoom))
+        manager.xMax.setText(str(xScale[1] - zoom))
+        record('scale', manager.updateScale)
+
+    layouts = ['2,2', '4,1']
+    for idx in range(repeat):
+        session.answers['text'] = (layouts[idx % 2], True)
+        record('relayout', window.setRowCol)
+
+    # with no editor given, openEditor only starts following the file it writes
+    session.answers['text'] = ('', True)
+    window.openEditor()
+    session.settle()
+    tmpDeffile = window.fileName
+    for idx in range(repeat):
+        ring = int(rings[idx])
+        record('reload', session.edit, tmpDeffile, EDITED, ring,
+               window.graphWidget(EDITED).parVals[ring] + 10.0)
+    window.fileWatcher.unwatch()
+    window.fileName = fileName
+
+    edited = window.graphWidget(EDITED)
+    for idx in range(repeat):
+        # a changed value makes every save write the file
+        values = edited.parVals[:]
+        values[0] += 1.0
+        edited.parVals = values
+        record('save', window.saveAll)
+    for idx in range(repeat):
+        session.answers['save'] = (os.path.join(workDir, 'saved_{}.def'.format(idx)),
+                                   '.def Files (*.def)')
+        record('saveAs', window.saveAsAll)
+
+    result = {'nur': nur,
+              'params': params,
+              'file_bytes': os.path.getsize(fileName),
+              'timings': {},
+              'errors': errors,
+              'messages': sorted(set(session.messages)),
+              'metrics': metrics.snapshot()}
+    for op in OPERATIONS:
+        result['timings'][op] = summarise(samples[op])
+        result['timings'][op]['fullRedraws'] = redraws[op][0]
+        result['timings'][op]['partialRedraws'] = redraws[op][1]
+    # openDef doesn't draw; what it leaves to draw is counted under firstPlot
+    del result['timings']['open']['fullRedraws'], result['timings']['open']['partialRedraws']
+    return result
+
+
+def _git(*args):
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(('git',) + args, cwd=REPO,
+                                           stderr=devnull).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Returns the commit and versions of the libraries the results depend on"""
+    import matplotlib
+    env = {'commit': _git('rev-parse', 'HEAD'),
+           'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+           'python': platform.python_version(),
+           'platform': platform.platform(),
+           'numpy': np.__version__,
+           'matplotlib': matplotlib.__version__,
+           'qpa': os.environ.get('QT_QPA_PLATFORM')}
+    try:
+        from PyQt5 import QtCore
+    except ImportError:
+        from PyQt4 import QtCore
+    env['qt'] = QtCore.QT_VERSION_STR
+    env['pyqt'] = QtCore.PYQT_VERSION_STR
+    return env
+
+
+def compare(baseline, results):
+    """Prints the median of each timing against the one in baseline"""
+    old = dict(((case['nur'], case['params']), case) for case in baseline['cases'])
+    print("against {} ({})".format(baseline['environment'].get('commit'),
+                                   baseline['created']))
+    print("{0:>6} {1:>6} {2:<10} {3:>12} {4:>12} {5:>8}".format(
+        "NUR", "params", "timing", "before (ms)", "after (ms)", "ratio"))
+    for case in results['cases']:
+        before = old.get((case['nur'], case['params']))
+        if before is None or 'timings' not in before or 'timings' not in case:
+            continue
+        for op in OPERATIONS:
+            a = before['timings'].get(op, {}).get('median_ms')
+            b = case['timings'].get(op, {}).get('median_ms')
+            if a is None or b is None:
+                continue
+            print("{0:>6} {1:>6} {2:<10} {3:>12.2f} {4:>12.2f} {5:>7.2f}x".format(
+                case['nur'], case['params'], op, a, b, b / a if a else float('nan')))
+
+
+def _arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Time interactive editing in the TiRiFiG GUI on synthetic .def "
+                    "files.")
+    parser.add_argument('--nur', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="numbers of rings (default: 10 100 1000 10000)")
+    parser.add_argument('--params', type=int, nargs='+', default=[4, 20, 100],
+                        help="numbers of parameters besides RADI, at least 4 "
+                             "(default: 4 20 100)")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="samples of each timing but open and firstPlot "
+                             "(default: 5)")
+    parser.add_argument('--moves', type=int, default=50,
+                        help="mouse moves in each drag (default: 50)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the synthetic values (default: 0)")
+    parser.add_argument('-o', '--output', default=None, metavar='FILE',
+                        help="write the results to FILE as JSON")
+    parser.add_argument('--compare', default=None, metavar='FILE',
+                        help="compare the results with an earlier run")
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = _arg_parser().parse_args(argv)
+    if args.case is not None:
+        # a single file in this process: the results go to the file given
+        nur, params, output = args.case.split(',', 2)
+        workDir = os.path.dirname(output)
+        result = run_case(int(nur), int(params), args.repeat, args.moves, workDir,
+                          args.seed)
+        with open(output, 'w') as f:
+            json.dump(result, f)
+        return 0
+    if min(args.params) < 4:
+        _arg_parser().error("--params must be at least 4")
+
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    results = {'format': FORMAT_VERSION,
+               'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+               'environment': environment(),
+               'settings': {'repeat': args.repeat, 'moves': args.moves,
+                            'seed': args.seed},
+               'cases': []}
+    status = 0
+    for nur in args.nur:
+        for params in args.params:
+            workDir = tempfile.mkdtemp(prefix='bench_gui_')
+            output = os.path.join(workDir, 'result.json')
+            command = [sys.executable, os.path.abspath(__file__),
+                       '--case', '{},{},{}'.format(nur, params, output),
+                       '--repeat', str(args.repeat), '--moves', str(args.moves),
+                       '--seed', str(args.seed)]
+            start = time.time()
+            try:
+                # run in workDir, where the GUI leaves its temporary files
+                subprocess.check_call(command, cwd=workDir, env=env)
+                with open(output) as f:
+                    case = json.load(f)
+            except (subprocess.CalledProcessError, IOError, ValueError) as e:
+                case = {'nur': nur, 'params': params,
+                        'errors': {'process': "{}: {}".format(type(e).__name__, e)}}
+            finally:
+                shutil.rmtree(workDir, ignore_errors=True)
+            status = 1 if case['errors'] else status
+            results['cases'].append(case)
+            timings = case.get('timings', {})
+            print("NUR {0:>6} params {1:>4} ({2:.1f} s): {3}".format(
+                nur, params, time.time() - start,
+                '  '.join("{} {:.1f}".format(op, timings[op]['median_ms'])
+                          for op in OPERATIONS
+                          if timings.get(op, {}).get('median_ms') is not None)))
+            for op, error in sorted(case['errors'].items()):
+                print("    {} failed: {}".format(op, error))
+            sys.stdout.flush()
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -36,6 +36,7 @@ setup(name="TiRiFiG",
                                 'utilities/icons/*.png']},
       entry_points={
           'console_scripts': [
-              'TiRiFiG = TiRiFiG.TiRiFiG_launcher:main'
+              'TiRiFiG = TiRiFiG.TiRiFiG_launcher:main',
+              'TiRiFiG-batch = TiRiFiG.batch:main'
            ]}
       )